@@ -87,6 +87,24 @@ DATABASES = {
     )
 }
 
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# Kept in the database, so it is shared by every Gunicorn worker and the monitor.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'monitor_cache',
+    },
+    # Rendered pages, kept in each worker's memory so serving them needs no
+    # query. Emptied whenever the workers restart, i.e. on every deploy.
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pages',
+        'TIMEOUT': config('PAGE_CACHE_TIMEOUT', default=3600, cast=int),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
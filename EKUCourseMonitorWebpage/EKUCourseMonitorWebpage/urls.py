@@ -15,10 +15,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from monitor.views import CourseForm, thank_you_page
+from monitor.views import BulkImport, CourseForm, SeatHistory, catalog_autocomplete, signup_status, thank_you_page
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', CourseForm.as_view(), name='new_course_form'),
-    path('thank-you-page/', thank_you_page, name='thank_you_page')
+    path('thank-you-page/', thank_you_page, name='thank_you_page'),
+    path('signups/status/', signup_status, name='signup_status'),
+    path('courses/<int:pk>/seats/', SeatHistory.as_view(), name='seat_history'),
+    path('courses/import/', BulkImport.as_view(), name='bulk_import'),
+    path('catalog/', catalog_autocomplete, name='catalog_autocomplete')
 ]
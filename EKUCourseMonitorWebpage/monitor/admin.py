@@ -1,5 +1,12 @@
 from django.contrib import admin
-from monitor.models import Course, Email
+from monitor.models import (
+    CatalogSection, Course, MonitorWorker, SeatRollup, SeatSnapshot, Subscriber, Subscription
+)
 
 admin.site.register(Course)
-admin.site.register(Email)
+admin.site.register(Subscriber)
+admin.site.register(Subscription)
+admin.site.register(MonitorWorker)
+admin.site.register(SeatSnapshot)
+admin.site.register(SeatRollup)
+admin.site.register(CatalogSection)
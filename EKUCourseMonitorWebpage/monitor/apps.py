@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class MonitorConfig(AppConfig):
     name = 'monitor'
+
+    def ready(self):
+        # Connect signal handlers.
+        from . import signals
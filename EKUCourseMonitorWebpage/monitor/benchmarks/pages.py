@@ -0,0 +1,175 @@
+"""
+Generated registrar pages, shaped like Banner's section detail and class
+search listing pages.
+
+"""
+import os
+
+# Directory of saved registrar pages.
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+# Page chrome surrounding the content of every Banner page.
+PAGE_TEMPLATE = '''\
+<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
+<html lang="en">
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">
+<title>{title}</title>
+<link rel="stylesheet" href="/css/web_defaultapp.css" type="text/css">
+</head>
+<body>
+<div class="headerwrapperdiv">
+<div class="pageheaderdiv1"><a href="#main_content" class="skiplinks">Go to Main Content</a></div>
+<table class="plaintable" summary="This table displays Menu Items and Banner Search textbox." width="100%">
+<tr><td class="pldefault"><a href="/prod/twbkwbis.P_GenMenu?name=bmenu.P_MainMnu">Main Menu</a></td>
+<td class="pldefault"><a href="/prod/bwckschd.p_disp_dyn_sched">Class Schedule</a></td></tr>
+</table>
+</div>
+<div class="pagetitlediv"><h2>{title}</h2></div>
+<div class="pagebodydiv">
+<a name="main_content"></a>
+{content}
+</div>
+<div class="footerbeforediv"></div>
+<div class="footerafterdiv">&copy; 2019 Ellucian Company L.P. and its affiliates.</div>
+</body>
+</html>
+'''
+
+# Detail of a single section.
+DETAIL_TEMPLATE = '''\
+<table class="datadisplaytable" summary="This table is used to present the detailed class information." width="100%">
+<caption class="captiontext">Detailed Class Information</caption>
+<tr><th class="ddlabel" scope="row">{title} - {crn} - {subject} {number} - {section}</th></tr>
+<tr><td class="dddefault">
+<span class="fieldlabeltext">Associated Term: </span>{term_name}<br>
+<span class="fieldlabeltext">Levels: </span>Undergraduate<br>
+<br>
+3.000 Credits<br>
+<table class="datadisplaytable" summary="This layout table is used to present the seating numbers." width="100%">
+<caption class="captiontext">Registration Availability</caption>
+<tr>
+<td class="dddead">&nbsp;</td>
+<th class="ddheader" scope="col"><span class="fieldlabeltext">Capacity</span></th>
+<th class="ddheader" scope="col"><span class="fieldlabeltext">Actual</span></th>
+<th class="ddheader" scope="col"><span class="fieldlabeltext">Remaining</span></th>
+</tr>
+<tr>
+<th class="ddlabel" scope="row"><span class="fieldlabeltext">Seats</span></th>
+<td class="dddefault">{capacity}</td>
+<td class="dddefault">{actual}</td>
+<td class="dddefault">{remaining}</td>
+</tr>
+{waitlist_row}</table>
+<br>
+<span class="fieldlabeltext">Restrictions:</span><br>
+Must be enrolled in the following Levels:<br>
+&nbsp;&nbsp;&nbsp;&nbsp;&nbsp;Undergraduate<br>
+</td></tr>
+</table>
+'''
+
+WAITLIST_ROW_TEMPLATE = '''\
+<tr>
+<th class="ddlabel" scope="row"><span class="fieldlabeltext">Waitlist Seats</span></th>
+<td class="dddefault">{0}</td>
+<td class="dddefault">{1}</td>
+<td class="dddefault">{2}</td>
+</tr>
+'''
+
+# Error shown for a CRN that does not exist.
+INVALID_TEMPLATE = '''\
+<table class="datadisplaytable" summary="This layout table holds message information">
+<tr><td class="dddefault"><span class="errortext">No detailed class information found</span></td></tr>
+</table>
+'''
+
+# Class search results listing many sections.
+LISTING_TEMPLATE = '''\
+<table class="datadisplaytable" summary="This layout table is used to present the sections found" width="100%">
+<caption class="captiontext">Sections Found</caption>
+<tr>
+<th class="ddheader" scope="col">Select</th><th class="ddheader" scope="col">CRN</th>
+<th class="ddheader" scope="col">Subj</th><th class="ddheader" scope="col">Crse</th>
+<th class="ddheader" scope="col">Sec</th><th class="ddheader" scope="col">Title</th>
+<th class="ddheader" scope="col">Cap</th><th class="ddheader" scope="col">Act</th>
+<th class="ddheader" scope="col">Rem</th>
+</tr>
+{rows}</table>
+'''
+
+LISTING_ROW_TEMPLATE = '''\
+<tr>
+<td class="dddefault">&nbsp;</td><td class="dddefault">{crn}</td>
+<td class="dddefault">{subject}</td><td class="dddefault">{number}</td>
+<td class="dddefault">{section}</td><td class="dddefault">{title}</td>
+<td class="dddefault">{capacity}</td><td class="dddefault">{actual}</td>
+<td class="dddefault">{remaining}</td>
+</tr>
+'''
+
+
+def render_detail(crn, capacity, actual, remaining, waitlist=None, term_name='Spring 2019',
+                  subject='ENG', number='101', section='001', title='Composition I'):
+    """
+    Render a section detail page.
+
+    Args:
+        crn (int): Course registration number.
+        capacity (int): Seat capacity.
+        actual (int): Seats taken.
+        remaining (int): Seats remaining.
+        waitlist (tuple): (capacity, actual, remaining) of the waitlist, or None.
+
+    Returns: The page, as bytes.
+
+    """
+    waitlist_row = WAITLIST_ROW_TEMPLATE.format(*waitlist) if waitlist else ''
+    content = DETAIL_TEMPLATE.format(
+        crn=crn, capacity=capacity, actual=actual, remaining=remaining,
+        waitlist_row=waitlist_row, term_name=term_name, subject=subject,
+        number=number, section=section, title=title
+    )
+    return PAGE_TEMPLATE.format(title='Detailed Class Information', content=content).encode('utf-8')
+
+
+def render_invalid():
+    """
+    Render the detail page shown for a CRN that does not exist.
+
+    Returns: The page, as bytes.
+
+    """
+    return PAGE_TEMPLATE.format(title='Detailed Class Information', content=INVALID_TEMPLATE).encode('utf-8')
+
+
+def render_listing(sections):
+    """
+    Render a class search listing.
+
+    Args:
+        sections (list): Dicts with the crn, subject, number, section, title,
+            capacity, actual and remaining of each section.
+
+    Returns: The page, as bytes.
+
+    """
+    rows = ''.join(LISTING_ROW_TEMPLATE.format(**section) for section in sections)
+    content = LISTING_TEMPLATE.format(rows=rows)
+    return PAGE_TEMPLATE.format(title='Class Schedule Listing', content=content).encode('utf-8')
+
+
+def saved_pages():
+    """
+    Load the saved registrar pages.
+
+    Returns: Dict of file name to page bytes.
+
+    """
+    pages = {}
+    for name in sorted(os.listdir(PAGES_DIR)):
+        if name.endswith('.html'):
+            with open(os.path.join(PAGES_DIR, name), 'rb') as page:
+                pages[name] = page.read()
+    return pages
@@ -0,0 +1,67 @@
+"""
+The original BeautifulSoup extraction of seating numbers, kept as a reference
+to check and benchmark `monitoring_core.parsing` against.
+
+"""
+from bs4 import BeautifulSoup
+
+from ..monitoring_core.parsing import CRN_HEADER, SEATING_HEADERS
+
+
+def parse_seating(raw):
+    """
+    Parse the seating of a section from its detail page with BeautifulSoup.
+
+    Args:
+        raw (bytes): HTML of the detail page.
+
+    Returns: Tuple of (Capacity, Actual, Remaining), or None if the page has no
+        seating table.
+
+    """
+    # Parse HTML.
+    parsed = BeautifulSoup(raw, features='html.parser')
+    # Get the table associated with seating.
+    seating_table = parsed.body.find('table', attrs={
+        'class': 'datadisplaytable',
+        'summary': 'This layout table is used to present the seating numbers.'
+    })
+    if seating_table is None:
+        return None
+    # Get the second table row, containing information about open seats.
+    seating_row = seating_table.find_all('tr')[1]
+    # Get a list of columns as such: [Capacity, Actual, Remaining]
+    seating_cols = seating_row.find_all('td')
+    # Convert to ints.
+    return tuple(int(seat_tag.string) for seat_tag in seating_cols)
+
+
+def parse_listing(raw):
+    """
+    Parse the seating of every section in a class search listing with
+    BeautifulSoup.
+
+    Args:
+        raw (bytes): HTML of the listing page.
+
+    Returns: Dict of CRN to [Capacity, Actual, Remaining].
+
+    """
+    seating = {}
+    parsed = BeautifulSoup(raw, features='html.parser')
+    for table in parsed.find_all('table', attrs={'class': 'datadisplaytable'}):
+        columns = None
+        for row in table.find_all('tr'):
+            headers = [th.get_text(strip=True) for th in row.find_all('th')]
+            if CRN_HEADER in headers and all(h in headers for h in SEATING_HEADERS):
+                columns = [headers.index(h) for h in (CRN_HEADER,) + SEATING_HEADERS]
+                continue
+            cells = row.find_all('td')
+            if columns is None or len(cells) <= max(columns):
+                continue
+            try:
+                crn, *vals = [int(cells[i].get_text(strip=True)) for i in columns]
+            except ValueError:
+                continue
+            seating[crn] = vals
+    return seating
@@ -0,0 +1,179 @@
+"""
+Local stand-in for the registrar, serving generated detail and listing pages
+with optional injected latency, errors and seat churn. Point `REGISTRAR_URL` at it to
+exercise the monitor without touching the real registrar, or run it on its
+own with `python -m monitor.benchmarks.registrar`.
+
+"""
+import argparse
+import http.server
+import random
+import socketserver
+import threading
+import time
+import urllib.parse
+
+from .pages import render_detail, render_invalid, render_listing
+
+
+class RegistrarHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves detail pages on GET and the term listing on POST, from the seating
+    held by the server.
+
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        try:
+            crn = int(query['crn_in'][0])
+        except (KeyError, ValueError):
+            self.send_error(404)
+            return
+        if not self.server.inject(self):
+            return
+        self.server.churn_seating(crn)
+        seating = self.server.sections.get(crn)
+        body = render_detail(crn, *seating) if seating else render_invalid()
+        self.respond(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.server.inject(self):
+            return
+        sections = [
+            {
+                'crn': crn, 'subject': 'ENG', 'number': str(100 + crn % 900), 'section': '001',
+                'title': 'Section {0}'.format(crn), 'capacity': capacity, 'actual': actual, 'remaining': remaining
+            }
+            for crn, (capacity, actual, remaining) in sorted(self.server.sections.items())
+            if crn not in self.server.unlisted
+        ]
+        self.respond(render_listing(sections))
+
+    def respond(self, body):
+        """
+        Send a page.
+
+        Args:
+            body (bytes): The page.
+
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeRegistrar(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Registrar stand-in running in a background thread.
+
+    Attributes:
+        sections (dict): (capacity, actual, remaining) of each CRN.
+        latency (float): Seconds added to every response.
+        error_rate (float): Fraction of requests answered with `error_status`.
+        error_status (int): Status of injected errors.
+        churn (float): Chance that a section's seating changes whenever its
+            detail page is requested.
+        requests (int): Requests received so far.
+        unlisted (set): CRNs left out of the listing, served on their detail
+            page only.
+
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, error_status=503, churn=0.0):
+        super().__init__(('127.0.0.1', port), RegistrarHandler)
+        self.sections = {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.churn = churn
+        self.requests = 0
+        self.unlisted = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        """
+        Root URL to use as `REGISTRAR_URL`.
+
+        """
+        return 'http://{0}:{1}/prod/'.format(*self.server_address)
+
+    def set_seating(self, crn, capacity, actual, remaining):
+        """
+        Set the seating served for a CRN.
+
+        """
+        self.sections[crn] = (capacity, actual, remaining)
+
+    def churn_seating(self, crn):
+        """
+        Take or free a seat in a section, if churn is due.
+
+        Args:
+            crn (int): CRN of the section.
+
+        """
+        if not self.churn or random.random() >= self.churn:
+            return
+        with self.lock:
+            if crn not in self.sections:
+                return
+            capacity, actual, remaining = self.sections[crn]
+            # Free a seat in full sections, and otherwise go either way.
+            change = 1 if actual >= capacity or random.random() < 0.5 else -1
+            if actual - change < 0:
+                change = -1
+            self.sections[crn] = (capacity, actual - change, remaining + change)
+
+    def inject(self, handler):
+        """
+        Apply the injected latency, and answer with an error if one is due.
+
+        Args:
+            handler (RegistrarHandler): Handler of the request.
+
+        Returns: True if the request should be served, False if it was failed.
+
+        """
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            handler.send_error(self.error_status)
+            return False
+        return True
+
+    def start(self):
+        """
+        Serve from a daemon thread.
+
+        Returns: The server.
+
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a stand-in registrar.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--sections', type=int, default=100, help='Number of sections, from CRN 10000.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failed.')
+    parser.add_argument('--churn', type=float, default=0.0, help='Chance a section changes when requested.')
+    args = parser.parse_args()
+    registrar = FakeRegistrar(args.port, args.latency, args.error_rate, churn=args.churn)
+    for crn in range(10000, 10000 + args.sections):
+        registrar.set_seating(crn, 30, 29, 1)
+    print('Serving registrar on {0}'.format(registrar.url))
+    registrar.serve_forever()
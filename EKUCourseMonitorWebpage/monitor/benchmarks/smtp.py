@@ -0,0 +1,141 @@
+"""
+Local SMTP sink that accepts and counts every message without delivering it.
+Point `SMTP_HOST`/`SMTP_PORT` at it, with `SMTP_SSL=False`, to exercise the
+mailer without sending mail, or run it on its own with
+`python -m monitor.benchmarks.smtp`.
+
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough SMTP for `smtplib` to hand over messages.
+
+    """
+
+    def reply(self, *lines):
+        """
+        Send reply lines to the client.
+
+        Args:
+            *lines (str): The lines, status code included.
+
+        """
+        self.wfile.write(''.join(line + '\r\n' for line in lines).encode('ascii'))
+
+    def handle(self):
+        self.server.connect()
+        self.reply('220 localhost SMTP sink')
+        # Lines of the message being received, or None outside of DATA.
+        data = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if data is not None:
+                if line.rstrip(b'\r\n') == b'.':
+                    self.server.receive(b''.join(data))
+                    data = None
+                    self.reply('250 OK')
+                else:
+                    # Undo dot-stuffing.
+                    data.append(line[1:] if line.startswith(b'..') else line)
+                continue
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.reply('250-localhost', '250 8BITMIME')
+            elif command == b'MAIL' and self.server.drop_due():
+                # Hang up without replying, as if the connection was lost.
+                return
+            elif command in (b'HELO', b'MAIL', b'RCPT', b'RSET', b'NOOP'):
+                self.reply('250 OK')
+            elif command == b'DATA':
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                data = []
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SmtpSink(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    SMTP server running in a background thread that drops every message.
+
+    Attributes:
+        latency (float): Seconds added to every message.
+        messages (int): Messages received so far.
+        connections (int): Connections opened so far.
+        drop_after (int): Messages to receive before dropping the connection
+            once, at the start of the next message; None to never drop.
+
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, host='127.0.0.1', latency=0.0):
+        super().__init__((host, port), SmtpHandler)
+        self.latency = latency
+        self.messages = 0
+        self.connections = 0
+        self.drop_after = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Count an opened connection.
+
+        """
+        with self.lock:
+            self.connections += 1
+
+    def drop_due(self):
+        """
+        Check whether to drop the connection before the next message.
+
+        Returns: True if the connection should be dropped, False if not.
+
+        """
+        with self.lock:
+            if self.drop_after is None or self.messages < self.drop_after:
+                return False
+            self.drop_after = None
+            return True
+
+    def receive(self, message):
+        """
+        Count a received message.
+
+        Args:
+            message (bytes): The message, headers included.
+
+        """
+        with self.lock:
+            self.messages += 1
+
+    def start(self):
+        """
+        Serve from a daemon thread.
+
+        Returns: The server.
+
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve an SMTP sink.')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every message.')
+    args = parser.parse_args()
+    sink = SmtpSink(args.port, latency=args.latency)
+    print('Serving SMTP sink on {0}:{1}'.format(*sink.server_address))
+    sink.serve_forever()
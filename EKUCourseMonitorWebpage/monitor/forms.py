@@ -1,32 +1,100 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
 from .models import Course
+from .monitoring_core.resilience import CircuitOpenError
 from .monitoring_core.url import URL
 
 
-# For saving a new course to be monitored.
-class NewMonitoredCourse(forms.ModelForm):
-    emails = forms.CharField(max_length=250, label='Emails Addresses (to be alerted, separated by commas)')
+# For validating a course to be monitored.
+class MonitoredCourse(forms.ModelForm):
+    # Whether to fetch sections not known yet to check they exist; if not,
+    # they are saved as pending and checked by the monitor.
+    FETCH_UNKNOWN = True
 
     def clean(self):
         """
         Validate that the course exists.
 
         """
-        super(NewMonitoredCourse, self).clean()
+        super(MonitoredCourse, self).clean()
+        # Status the course is saved with.
+        self.status = Course.VALID
         year = self.cleaned_data.get('year')
         semester = self.cleaned_data.get('semester')
         crn = self.cleaned_data.get('crn')
-        url = URL.get_url(year, semester, crn)
+        # Fields that failed validation were already reported.
+        if None in (year, semester, crn):
+            return
+        if self.FETCH_UNKNOWN:
+            try:
+                valid = URL.is_valid_course(year, semester, crn)
+            except (CircuitOpenError, OSError):
+                # The registrar is struggling; ask for a retry rather than failing the request.
+                self.add_error(None, 'The registrar could not be reached to check this course. Please try again later.')
+                return
+        else:
+            valid = URL.known_course(year, semester, crn)
+            if valid is None:
+                self.status = Course.PENDING
+                return
         # If not valid, add error to each course field.
-        if not URL.validate_url(url):
+        if not valid:
             msg = 'A course does not exist for the information entered.'
             self.add_error('crn', msg)
             self.add_error('name', msg)
             self.add_error('semester', msg)
             self.add_error('year', msg)
 
+    def validate_unique(self):
+        """
+        Skip the uniqueness check; signups for a section already in the
+        database join its course instead.
+
+        """
+
+    def save_section(self):
+        """
+        Get the course of the section entered, creating it if this is its
+        first signup, and monitoring it again if it was deactivated. Pending
+        and rejected courses take the status of this signup, so a rejected
+        section is checked again.
+
+        Returns: The course.
+
+        """
+        course, created = Course.objects.get_or_create(
+            crn=self.cleaned_data['crn'],
+            semester=self.cleaned_data['semester'],
+            year=self.cleaned_data['year'],
+            defaults={
+                'name': self.cleaned_data['name'],
+                'future_alert': self.cleaned_data['future_alert'],
+                'status': self.status
+            }
+        )
+        if created:
+            return course
+        # Sections confirmed before stay valid.
+        status = Course.VALID if course.status == Course.VALID else self.status
+        if not course.is_monitored or course.status != status:
+            course.is_monitored = True
+            course.status = status
+            course.save()
+        return course
+
     class Meta:
         model = Course
+        fields = ['crn', 'name', 'semester', 'year', 'future_alert']
+
+
+# For saving a new course to be monitored.
+class NewMonitoredCourse(MonitoredCourse):
+    # Signups never wait on the registrar.
+    FETCH_UNKNOWN = False
+    emails = forms.CharField(max_length=250, label='Emails Addresses (to be alerted, separated by commas)')
+
+    class Meta(MonitoredCourse.Meta):
         # Fields for the main signup form.
         fields = ['crn', 'name', 'semester', 'year', 'emails', 'future_alert']
         # Change labels to make more human readable.
@@ -40,3 +108,24 @@ class NewMonitoredCourse(forms.ModelForm):
             'crn': forms.TextInput(attrs={'placeholder': '12345'}),
             'name': forms.TextInput(attrs={'placeholder': 'ENG 101'})
         }
+
+    def clean_emails(self):
+        """
+        Split the comma separated email addresses, and validate each one.
+
+        Returns: Set of the addresses.
+
+        """
+        # Split at each comma and strip whitespace from either end.
+        addresses = {x.strip() for x in self.cleaned_data['emails'].split(',')} - {''}
+        invalid = []
+        for address in sorted(addresses):
+            try:
+                validate_email(address)
+            except ValidationError:
+                invalid.append(address)
+        if invalid:
+            raise ValidationError('Invalid email addresses: {0}'.format(', '.join(invalid)))
+        if not addresses:
+            raise ValidationError('Enter at least one email address.')
+        return addresses
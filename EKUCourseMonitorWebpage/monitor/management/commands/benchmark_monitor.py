@@ -0,0 +1,250 @@
+import contextlib
+import datetime
+import io
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from monitor.benchmarks.registrar import FakeRegistrar
+from monitor.benchmarks.smtp import SmtpSink
+from monitor.models import Course, MonitorWorker, SeatRollup, SeatSnapshot, Subscriber, Subscription
+from monitor.monitoring_core import mailer as mailer_module
+from monitor.monitoring_core import url as url_module
+from monitor.monitoring_core.alerts import ALERTS
+from monitor.monitoring_core.http_client import HTTPClient, client
+from monitor.monitoring_core.monitor import Monitor
+from monitor.monitoring_core.scheduler import POLL_SECONDS, POLLS
+from monitor.monitoring_core.seat_tracker import SeatingTracker
+
+# Semester and year of every benchmark course.
+SEMESTER = 'spr'
+YEAR = 2019
+# First CRN of the benchmark sections.
+FIRST_CRN = 10000
+
+
+def local_port(host, port):
+    """
+    Check that an address the monitor is configured with is on this machine.
+
+    Args:
+        host (str): Configured host.
+        port (int): Configured port.
+
+    Returns: The port.
+
+    Raises:
+        CommandError: If the host is not local.
+
+    """
+    if host not in ('127.0.0.1', 'localhost'):
+        raise CommandError('{0}:{1} is not local.'.format(host, port))
+    return port
+
+
+def histogram_counts(histogram):
+    """
+    Get the bucket counts of a histogram summed over every label value.
+
+    Args:
+        histogram (Histogram): The histogram.
+
+    Returns: List of the count of each bucket, overflow included.
+
+    """
+    with histogram.lock:
+        values = list(histogram.values.values())
+    return [sum(counts[index] for counts in values) for index in range(len(histogram.buckets) + 1)]
+
+
+def bucket_quantile(bounds, counts, quantile):
+    """
+    Estimate a quantile from histogram buckets, interpolating linearly within
+    the bucket it falls in, as Prometheus does.
+
+    Args:
+        bounds (tuple): Upper bound of each bucket.
+        counts (list): Count of each bucket, overflow included.
+        quantile (float): The quantile, in [0, 1].
+
+    Returns: The estimate, or None if there are no observations.
+
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = quantile * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if count and cumulative + count >= rank:
+            if index == len(bounds):
+                # Beyond the last bucket; its bound is all that is known.
+                return bounds[-1]
+            lower = bounds[index - 1] if index else 0.0
+            return lower + (bounds[index] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return bounds[-1]
+
+
+def rss_megabytes():
+    """
+    Get the resident set size of this process.
+
+    Returns: The size, in megabytes.
+
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+    except OSError:
+        # Not Linux; fall back to the peak, in kilobytes on most platforms.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the monitor against a local registrar and SMTP sink with increasing numbers of courses, '
+        'reporting polls/s, poll latency, alerts/s, RSS and threads. REGISTRAR_URL, SMTP_HOST and '
+        'SMTP_PORT must point at free local ports, with SMTP_SSL=False. Runs in a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--courses', type=int, nargs='+', default=[100, 1000, 10000], help='Numbers of courses to run with.'
+        )
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to measure each run for.')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between polls of each course.')
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds the registrar takes per response.')
+        parser.add_argument('--churn', type=float, default=0.05, help='Chance a section changes when polled.')
+        parser.add_argument(
+            '--rate', type=float, default=None, help='Requests per second allowed to the registrar; defaults to HTTP_RATE_LIMIT.'
+        )
+
+    def handle(self, *args, **options):
+        registrar_url = urllib.parse.urlsplit(url_module.REGISTRAR_URL)
+        if mailer_module.SMTP_SSL:
+            raise CommandError('Set SMTP_SSL=False to deliver to the SMTP sink.')
+        registrar = FakeRegistrar(
+            local_port(registrar_url.hostname, registrar_url.port),
+            latency=options['latency'],
+            churn=options['churn']
+        ).start()
+        sink = SmtpSink(local_port(mailer_module.SMTP_HOST, mailer_module.SMTP_PORT)).start()
+        # Keep benchmark data out of the real database.
+        directory = tempfile.mkdtemp()
+        if connection.vendor == 'sqlite':
+            # Polls read and write from many threads, which an in-memory database cannot share.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write('courses  startup  polls/s  p50 ms  p99 ms  alerts/s  emails/s  rss MB  threads')
+            for count in options['courses']:
+                # The monitor logs every course it starts; only show that when asked.
+                output = io.StringIO() if options['verbosity'] < 2 else self.stdout
+                with contextlib.redirect_stdout(output):
+                    report = self.run(count, registrar, sink, options)
+                self.stdout.write(report)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(directory, ignore_errors=True)
+            registrar.shutdown()
+            sink.shutdown()
+
+    def seed(self, count, registrar, name):
+        """
+        Create courses owned by a monitor, each with a subscriber and the
+        snapshot of its current seating, so the monitor resumes them without
+        fetching.
+
+        Args:
+            count (int): Number of courses.
+            registrar (FakeRegistrar): Registrar to serve the sections from.
+            name (str): Name of the monitor owning the courses.
+
+        """
+        for model in (Subscription, Subscriber, Course, SeatSnapshot, SeatRollup, MonitorWorker):
+            model.objects.all().delete()
+        registrar.sections.clear()
+        now = timezone.now()
+        lease_expires = now + datetime.timedelta(seconds=Monitor.LEASE)
+        courses = []
+        for crn in range(FIRST_CRN, FIRST_CRN + count):
+            registrar.set_seating(crn, 30, 30 - crn % 5, crn % 5)
+            courses.append(Course(
+                crn=crn, name='Course {0}'.format(crn), semester=SEMESTER, year=YEAR,
+                owner=name, lease_expires=lease_expires
+            ))
+        Course.objects.bulk_create(courses, batch_size=500)
+        Subscriber.objects.bulk_create([
+            Subscriber(email='student{0}@example.com'.format(crn), welcomed=True)
+            for crn in range(FIRST_CRN, FIRST_CRN + count)
+        ], batch_size=500)
+        subscribers = dict(Subscriber.objects.values_list('email', 'pk'))
+        subscriptions = []
+        snapshots = []
+        for course in Course.objects.all():
+            subscriptions.append(Subscription(
+                subscriber_id=subscribers['student{0}@example.com'.format(course.crn)],
+                course=course, name=course.name, alerted=True
+            ))
+            capacity, actual, remaining = registrar.sections[course.crn]
+            snapshots.append(SeatSnapshot(
+                url=course.url, timestamp=now, capacity=capacity, actual=actual, remaining=remaining
+            ))
+        Subscription.objects.bulk_create(subscriptions, batch_size=500)
+        SeatSnapshot.objects.bulk_create(snapshots, batch_size=500)
+
+    def run(self, count, registrar, sink, options):
+        """
+        Run the monitor with a number of courses and measure it.
+
+        Args:
+            count (int): Number of courses.
+            registrar (FakeRegistrar): The registrar stand-in.
+            sink (SmtpSink): The SMTP sink.
+            options (dict): Command options.
+
+        Returns: Report line of the run.
+
+        """
+        name = 'benchmark-{0}'.format(count)
+        self.seed(count, registrar, name)
+        # Poll every course once per interval, starting within the first one.
+        SeatingTracker.INTERVAL = options['interval']
+        Monitor.WARMUP = options['interval']
+        if options['rate'] is not None:
+            HTTPClient.RATE = options['rate']
+            HTTPClient.BURST = max(1, int(options['rate']))
+        client.buckets.clear()
+        client.breakers.clear()
+        start = time.monotonic()
+        monitor = Monitor(name)
+        startup = time.monotonic() - start
+        # Measure from after startup, so each run only counts its own polls.
+        polls = POLLS.total(result='ok')
+        latencies = histogram_counts(POLL_SECONDS)
+        alerts = ALERTS.total(kind='change')
+        emails = sink.messages
+        start = time.monotonic()
+        time.sleep(options['duration'])
+        elapsed = time.monotonic() - start
+        polls = POLLS.total(result='ok') - polls
+        latencies = [after - before for after, before in zip(histogram_counts(POLL_SECONDS), latencies)]
+        alerts = ALERTS.total(kind='change') - alerts
+        emails = sink.messages - emails
+        rss = rss_megabytes()
+        threads = threading.active_count()
+        monitor.shutdown()
+        p50, p99 = (bucket_quantile(POLL_SECONDS.buckets, latencies, quantile) for quantile in (0.5, 0.99))
+        return '{0:7d}  {1:6.1f}s  {2:7.1f}  {3:6.0f}  {4:6.0f}  {5:8.2f}  {6:8.2f}  {7:6.0f}  {8:7d}'.format(
+            count, startup, polls / elapsed, (p50 or 0) * 1000, (p99 or 0) * 1000,
+            alerts / elapsed, emails / elapsed, rss, threads
+        )
@@ -0,0 +1,31 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from monitor.benchmarks import reference
+from monitor.benchmarks.pages import saved_pages
+from monitor.monitoring_core import parsing
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the seating parser against the BeautifulSoup reference on saved pages. '
+        'Their equivalence is checked by the monitor app tests.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=1000, help='Parses of each page per timing run.')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        for name, raw in saved_pages().items():
+            # Listing pages hold many sections; detail pages hold one.
+            if name.startswith('listing'):
+                fast, slow = parsing.parse_listing, reference.parse_listing
+            else:
+                fast, slow = parsing.parse_seating, reference.parse_seating
+            fast_time = timeit.timeit(lambda: fast(raw), number=iterations) / iterations
+            slow_time = timeit.timeit(lambda: slow(raw), number=iterations) / iterations
+            self.stdout.write('{0}: {1:.1f}us vs {2:.1f}us BeautifulSoup ({3:.1f}x)'.format(
+                name, fast_time * 1e6, slow_time * 1e6, slow_time / fast_time
+            ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from monitor.models import Course
+from monitor.monitoring_core.catalog import crawl_term
+from monitor.monitoring_core.url import URL
+
+
+class Command(BaseCommand):
+    help = 'Index every section of a term from the registrar\'s class schedule.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('year', type=int, help='Year of the term, as chosen on the signup form.')
+        parser.add_argument('semester', choices=[code for code, _ in Course.SEMESTERS], help='Semester of the term.')
+
+    def handle(self, *args, **options):
+        term = URL.get_term(options['year'], options['semester'])
+        count = crawl_term(term)
+        # An empty listing means the term is not scheduled yet.
+        if not count:
+            raise CommandError('No sections listed for term {0}.'.format(term))
+        self.stdout.write('Indexed {0} sections of term {1}.'.format(count, term))
@@ -0,0 +1,49 @@
+# Generated by Django 2.1.4 on 2019-01-20 18:02
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def leases_from_threads(apps, schema_editor):
+    # Courses with active threads are handed to the default worker, with their
+    # leases already expired so any worker may take them over.
+    Course = apps.get_model('monitor', 'Course')
+    Course.objects.filter(thread_active=True).update(owner='default', lease_expires=timezone.now())
+
+
+def threads_from_leases(apps, schema_editor):
+    Course = apps.get_model('monitor', 'Course')
+    Course.objects.filter(owner__isnull=False).update(thread_active=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0004_auto_20190101_1619'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonitorWorker',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('heartbeat', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='lease_expires',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='owner',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(leases_from_threads, threads_from_leases),
+        migrations.RemoveField(
+            model_name='course',
+            name='thread_active',
+        ),
+    ]
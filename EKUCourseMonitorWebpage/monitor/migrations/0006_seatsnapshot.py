@@ -0,0 +1,28 @@
+# Generated by Django 2.1.4 on 2019-01-21 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0005_course_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=200)),
+                ('timestamp', models.DateTimeField()),
+                ('capacity', models.IntegerField()),
+                ('actual', models.IntegerField()),
+                ('remaining', models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='seatsnapshot',
+            index=models.Index(fields=['url', 'timestamp'], name='monitor_sea_url_a624a6_idx'),
+        ),
+    ]
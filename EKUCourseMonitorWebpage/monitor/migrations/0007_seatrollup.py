@@ -0,0 +1,32 @@
+# Generated by Django 2.1.4 on 2019-01-23 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0006_seatsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=200)),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('min_remaining', models.IntegerField()),
+                ('max_remaining', models.IntegerField()),
+                ('last_remaining', models.IntegerField()),
+                ('opened', models.PositiveIntegerField(default=0)),
+                ('closed', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='seatrollup',
+            unique_together={('url', 'granularity', 'bucket_start')},
+        ),
+    ]
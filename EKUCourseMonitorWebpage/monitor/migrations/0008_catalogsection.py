@@ -0,0 +1,33 @@
+# Generated by Django 2.1.4 on 2019-01-25 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0007_seatrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogSection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=6)),
+                ('crn', models.PositiveIntegerField()),
+                ('subject', models.CharField(max_length=10)),
+                ('number', models.CharField(max_length=10)),
+                ('section', models.CharField(max_length=10)),
+                ('title', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='catalogsection',
+            index=models.Index(fields=['term', 'subject', 'number'], name='monitor_cat_term_9392c0_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='catalogsection',
+            unique_together={('term', 'crn')},
+        ),
+    ]
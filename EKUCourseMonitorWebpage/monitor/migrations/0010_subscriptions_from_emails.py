@@ -0,0 +1,71 @@
+# Generated by Django 2.1.4 on 2019-01-27 18:14
+
+from django.db import migrations
+
+
+def merge_courses(apps, schema_editor):
+    """
+    Merge courses signed up for more than once into the oldest row of each
+    section, and turn every email into a subscriber and a subscription.
+
+    """
+    Course = apps.get_model('monitor', 'Course')
+    Email = apps.get_model('monitor', 'Email')
+    Subscriber = apps.get_model('monitor', 'Subscriber')
+    Subscription = apps.get_model('monitor', 'Subscription')
+    # Oldest course of each section, and the section of every course.
+    kept = {}
+    sections = {}
+    for course in Course.objects.order_by('pk'):
+        key = (course.crn, course.semester, course.year)
+        sections[course.pk] = key
+        if key not in kept:
+            kept[key] = course
+            continue
+        # The merged course is monitored, and asks about next semester, if any duplicate did.
+        kept[key].is_monitored = kept[key].is_monitored or course.is_monitored
+        kept[key].future_alert = kept[key].future_alert or course.future_alert
+    for course in kept.values():
+        course.save()
+    # One subscriber per address, welcomed if any of its emails was.
+    subscribers = {}
+    for email in Email.objects.select_related('course').order_by('pk'):
+        subscriber = subscribers.get(email.email)
+        if subscriber is None:
+            subscriber = Subscriber.objects.create(email=email.email, welcomed=email.welcomed)
+            subscribers[email.email] = subscriber
+        elif email.welcomed and not subscriber.welcomed:
+            subscriber.welcomed = True
+            subscriber.save()
+        course = kept[sections[email.course_id]]
+        # Courses a monitor has owned have had their initial alerts sent.
+        Subscription.objects.get_or_create(
+            subscriber=subscriber,
+            course=course,
+            defaults={'name': email.course.name, 'alerted': email.course.owner is not None}
+        )
+    Course.objects.exclude(pk__in=[course.pk for course in kept.values()]).delete()
+
+
+def split_subscriptions(apps, schema_editor):
+    """
+    Turn every subscription back into an email on its course.
+
+    """
+    Email = apps.get_model('monitor', 'Email')
+    Subscription = apps.get_model('monitor', 'Subscription')
+    Email.objects.bulk_create([
+        Email(email=subscription.subscriber.email, course_id=subscription.course_id, welcomed=subscription.subscriber.welcomed)
+        for subscription in Subscription.objects.select_related('subscriber')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0009_subscriber_subscription'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_courses, split_subscriptions),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.1.4 on 2019-01-27 18:15
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0010_subscriptions_from_emails'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Email',
+        ),
+        migrations.AlterUniqueTogether(
+            name='course',
+            unique_together={('crn', 'semester', 'year')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.4 on 2019-01-29 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0011_remove_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('valid', 'Valid'), ('rejected', 'Rejected')], default='valid', max_length=10),
+        ),
+    ]
@@ -1,13 +1,11 @@
 import datetime
-import smtplib
-from decouple import config
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from .monitoring_core.events import notify_course_change
+from .monitoring_core.mailer import mailer
+from .monitoring_core.metrics import Counter
 from .monitoring_core.url import URL
 
-# Gmail authentication information.
-GMAIL_USERNAME = config('GMAIL_USERNAME')
-GMAIL_PASSWORD = config('GMAIL_PASSWORD')
 # Email template.
 EMAIL_TEMPLATE = '''\
 From: {from_field}
@@ -30,6 +28,15 @@ If you have any questions, please reply to this email.
 
 Good luck getting into classes!
 """
+# Template for the email telling subscribers a signup was rejected.
+REJECTION_TEMPLATE = """\
+No section with CRN {crn} was found for {semester} {year}, so {name} will not be monitored.
+
+Please check the CRN, semester and year, and sign up again.
+"""
+
+WELCOMES = Counter('monitor_welcomes_total', 'Welcome emails queued.')
+REJECTIONS = Counter('monitor_rejections_total', 'Rejected signup emails queued.')
 
 
 # Get possibilities for year selection of Course objects.
@@ -44,7 +51,8 @@ def years():
 
 class Course(models.Model):
     """
-    For holding information about each course to be monitored.
+    For holding information about each course section to be monitored,
+    shared by every subscription to it.
 
     """
     BASE_URL = 'https://web4s.eku.edu/prod/bwckschd.p_disp_detail_sched?term_in={year}{semester_code}&crn_in={crn}'
@@ -78,10 +86,29 @@ class Course(models.Model):
     year = models.PositiveSmallIntegerField(choices=years(), default=datetime.date.today().year)
     # Whether or not the associated emails should be alerted of the server's new IP next semester.
     future_alert = models.BooleanField(default=True)
-    # Is there an active monitor thread.
-    thread_active = models.BooleanField(default=False, blank=True)
+    # Name of the monitor worker polling this course; kept after its lease
+    # expires, so a takeover is not mistaken for a new course.
+    owner = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+    # When the owner's lease on this course runs out unless renewed.
+    lease_expires = models.DateTimeField(null=True, blank=True)
     # Whether this course should be monitored.
     is_monitored = models.BooleanField(default=True, blank=True)
+    # Constants for the possible validation statuses.
+    PENDING = 'pending'
+    VALID = 'valid'
+    REJECTED = 'rejected'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (VALID, 'Valid'),
+        (REJECTED, 'Rejected')
+    )
+    # Whether the section was confirmed to exist. Signups for sections not
+    # known yet are saved as pending and checked by the monitor.
+    status = models.CharField(max_length=10, choices=STATUSES, default=VALID)
+
+    class Meta:
+        # Each section is monitored once, however many people subscribe to it.
+        unique_together = ('crn', 'semester', 'year')
 
     @property
     def url(self):
@@ -94,17 +121,222 @@ class Course(models.Model):
         url = URL.get_url(self.year, self.semester, self.crn)
         return url
 
+    @property
+    def term(self):
+        """
+        Get the Banner term code for the course.
+
+        Returns: The term code, e.g. '201920'.
+
+        """
+        return URL.get_term(self.year, self.semester)
+
+    def reject(self):
+        """
+        Mark the section as not found, and tell the subscribers waiting on it
+        that their signups were rejected, dropping their subscriptions.
+
+        """
+        Course.objects.filter(pk=self.pk).update(status=Course.REJECTED)
+        self.status = Course.REJECTED
+        subscriptions = list(self.subscriptions.filter(alerted=False).select_related('subscriber'))
+        for subscription in subscriptions:
+            address = subscription.subscriber.email
+            content = EMAIL_TEMPLATE.format(
+                from_field='EKU Course Monitor',
+                to_field=address,
+                subject_field='[Course Monitor] {0} Not Found'.format(subscription.name),
+                body=REJECTION_TEMPLATE.format(
+                    crn=self.crn,
+                    semester=self.get_semester_display(),
+                    year=self.year,
+                    name=subscription.name
+                )
+            )
+            mailer.send(address, content)
+            REJECTIONS.inc()
+        Subscription.objects.filter(pk__in=[subscription.pk for subscription in subscriptions]).delete()
+
     def __str__(self):
         return "{0} ({1}), {2}, {3}".format(self.name, self.crn, self.semester, self.year)
 
 
-# Holds the emails to be alerted for different courses.
-class Email(models.Model):
-    # An email address to be alerted.
-    email = models.EmailField()
-    # Related course.
-    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='emails')
-    # Whether or not this email has been sent a welcome email.
+# A running monitor worker process.
+class MonitorWorker(models.Model):
+    # Unique name of the worker.
+    name = models.CharField(max_length=100, unique=True)
+    # Last time the worker checked in; workers not seen for a lease are dead.
+    heartbeat = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
+
+# Seating of a course URL whenever it changes.
+class SeatSnapshot(models.Model):
+    # Most URLs looked up per query.
+    CHUNK_SIZE = 500
+    # URL the seating was read from.
+    url = models.CharField(max_length=200)
+    # When the seating was read.
+    timestamp = models.DateTimeField()
+    # Seating values.
+    capacity = models.IntegerField()
+    actual = models.IntegerField()
+    remaining = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['url', 'timestamp']),
+        ]
+
+    @staticmethod
+    def latest(url):
+        """
+        Get the most recent snapshot of a URL.
+
+        Args:
+            url (str): URL of the course.
+
+        Returns: The snapshot, or None if the URL was never recorded.
+
+        """
+        return SeatSnapshot.objects.filter(url=url).order_by('-timestamp').first()
+
+    @staticmethod
+    def latest_for(urls):
+        """
+        Get the most recent snapshot of many URLs, a chunk of URLs per query.
+
+        Args:
+            urls (list): URLs of the courses.
+
+        Returns: Dict of the snapshots, keyed by URL; URLs never recorded are left out.
+
+        """
+        urls = list(urls)
+        snapshots = {}
+        for start in range(0, len(urls), SeatSnapshot.CHUNK_SIZE):
+            newest = SeatSnapshot.objects.filter(url=models.OuterRef('url')).order_by('-timestamp')
+            chunk = SeatSnapshot.objects.filter(
+                url__in=urls[start:start + SeatSnapshot.CHUNK_SIZE],
+                pk=models.Subquery(newest.values('pk')[:1])
+            )
+            snapshots.update((snapshot.url, snapshot) for snapshot in chunk)
+        return snapshots
+
+    def __str__(self):
+        return '{0} at {1}: {2}/{3}/{4}'.format(self.url, self.timestamp, self.capacity, self.actual, self.remaining)
+
+
+# Seating of a course URL summarized over an hour or a day.
+class SeatRollup(models.Model):
+    HOUR = 'hour'
+    DAY = 'day'
+    GRANULARITIES = (
+        (HOUR, 'Hour'),
+        (DAY, 'Day')
+    )
+    # URL the seating was read from.
+    url = models.CharField(max_length=200)
+    # Length of the bucket.
+    granularity = models.CharField(max_length=4, choices=GRANULARITIES)
+    # Start of the bucket.
+    bucket_start = models.DateTimeField()
+    # Remaining seats over the bucket.
+    min_remaining = models.IntegerField()
+    max_remaining = models.IntegerField()
+    last_remaining = models.IntegerField()
+    # Number of times seats opened up (none to some) and closed (some to none).
+    opened = models.PositiveIntegerField(default=0)
+    closed = models.PositiveIntegerField(default=0)
+    # When the bucket last changed.
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('url', 'granularity', 'bucket_start')
+
+    @staticmethod
+    def bucket(timestamp, granularity):
+        """
+        Get the start of the bucket holding a timestamp.
+
+        Args:
+            timestamp (datetime): The timestamp.
+            granularity (str): Granularity constant.
+
+        Returns: Start of the bucket.
+
+        """
+        timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+        if granularity == SeatRollup.DAY:
+            timestamp = timestamp.replace(hour=0)
+        return timestamp
+
+    def add(self, remaining, prev_remaining):
+        """
+        Fold a new observation of the remaining seats into the bucket.
+
+        Args:
+            remaining (int): The remaining seats observed.
+            prev_remaining (int): The remaining seats before, or None if unknown.
+
+        """
+        self.min_remaining = min(self.min_remaining, remaining)
+        self.max_remaining = max(self.max_remaining, remaining)
+        self.last_remaining = remaining
+        if prev_remaining is not None:
+            if prev_remaining <= 0 < remaining:
+                self.opened += 1
+            elif remaining <= 0 < prev_remaining:
+                self.closed += 1
+
+    def __str__(self):
+        return '{0} {1} from {2}'.format(self.url, self.granularity, self.bucket_start)
+
+
+# A section of a term, as listed in the registrar's class schedule.
+class CatalogSection(models.Model):
+    # Banner term code of the section.
+    term = models.CharField(max_length=6)
+    # Course registration number.
+    crn = models.PositiveIntegerField()
+    # Subject code, course number and section number, e.g. ENG 101 001.
+    subject = models.CharField(max_length=10)
+    number = models.CharField(max_length=10)
+    section = models.CharField(max_length=10)
+    # Title of the course.
+    title = models.CharField(max_length=100)
+
+    class Meta:
+        unique_together = ('term', 'crn')
+        indexes = [
+            models.Index(fields=['term', 'subject', 'number']),
+        ]
+
+    @staticmethod
+    def is_listed(term, crn):
+        """
+        Check whether a section is in the catalog.
+
+        Args:
+            term (str): Banner term code.
+            crn (int): Course registration number.
+
+        Returns: True if listed, False if unknown.
+
+        """
+        return CatalogSection.objects.filter(term=term, crn=crn).exists()
+
+    def __str__(self):
+        return '{0} {1} {2} ({3}), {4}'.format(self.subject, self.number, self.section, self.crn, self.term)
+
+
+# A person alerted about the courses they subscribe to.
+class Subscriber(models.Model):
+    # The email address to be alerted.
+    email = models.EmailField(unique=True)
+    # Whether or not this address has been sent a welcome email.
     welcomed = models.BooleanField(default=False)
 
     # For debugging.
@@ -113,44 +345,147 @@ class Email(models.Model):
 
     def welcome(self):
         """
-        Send welcome email to this email address.
+        Queue a welcome email to this subscriber.
 
         """
-        # Make an ssl connection to Gmail's SMTP server.
-        server_ssl = smtplib.SMTP_SSL('smtp.gmail.com', 465)
-        server_ssl.ehlo()
-        # Login to email account.
-        server_ssl.login(GMAIL_USERNAME, GMAIL_PASSWORD)
-        # Format the email and send it.
-        content = EMAIL_TEMPLATE.format(
-            from_field='EKU Course Monitor',
-            to_field=self.email,
-            subject_field='Welcome to the EKU Course Monitor',
-            body=WELCOME_TEMPLATE
-        )
-        server_ssl.sendmail(
-            GMAIL_USERNAME,
-            self.email,
-            content
-        )
-        server_ssl.close()
+        Subscriber.send_welcome(self.email)
         # Signify that welcome email was sent.
         self.welcomed = True
         self.save()
 
     def welcome_if_new(self):
         """
-        Welcome email address if new.
+        Welcome subscriber if new.
 
         Returns: True if new and was welcomed, False if not.
 
         """
-        same_emails = Email.objects.filter(email=self.email, welcomed=True)
-        # If already exists and welcomed, set welcomed and exit.
-        if same_emails:
-            self.welcomed = True
-            self.save()
-            return False
-        # Else, welcome.
-        self.welcome()
-        return True
+        return bool(Subscriber.welcome_new([self]))
+
+    @staticmethod
+    def send_welcome(address):
+        """
+        Queue a welcome email to an address.
+
+        Args:
+            address (str): The email address.
+
+        """
+        # Format the email and queue it.
+        content = EMAIL_TEMPLATE.format(
+            from_field='EKU Course Monitor',
+            to_field=address,
+            subject_field='Welcome to the EKU Course Monitor',
+            body=WELCOME_TEMPLATE
+        )
+        mailer.send(address, content)
+        WELCOMES.inc()
+
+    @staticmethod
+    def welcome_new(subscribers):
+        """
+        Welcome every subscriber that has not been welcomed before, once each,
+        and mark them welcomed in one query.
+
+        Args:
+            subscribers (list): The Subscriber objects.
+
+        Returns: The addresses that were welcomed.
+
+        """
+        new_subscribers = {
+            subscriber.pk: subscriber
+            for subscriber in subscribers if not subscriber.welcomed
+        }
+        if not new_subscribers:
+            return []
+        new_addresses = sorted(subscriber.email for subscriber in new_subscribers.values())
+        for address in new_addresses:
+            Subscriber.send_welcome(address)
+        # Signify that welcome emails were sent.
+        Subscriber.objects.filter(pk__in=list(new_subscribers)).update(welcomed=True)
+        for subscriber in new_subscribers.values():
+            subscriber.welcomed = True
+        return new_addresses
+
+    @staticmethod
+    def for_addresses(addresses):
+        """
+        Get the subscribers of some addresses, creating any that are missing.
+        Takes three queries however many addresses there are, unless a
+        concurrent signup creates some of them first.
+
+        Args:
+            addresses (set): The email addresses.
+
+        Returns: List of the subscribers.
+
+        """
+        existing = set(Subscriber.objects.filter(email__in=addresses).values_list('email', flat=True))
+        missing = sorted(set(addresses) - existing)
+        try:
+            with transaction.atomic():
+                Subscriber.objects.bulk_create([Subscriber(email=address) for address in missing])
+        except IntegrityError:
+            # Another signup added some since; create the rest one at a time.
+            for address in missing:
+                Subscriber.objects.get_or_create(email=address)
+        return list(Subscriber.objects.filter(email__in=addresses))
+
+
+# A subscriber's signup to be alerted about a course.
+class Subscription(models.Model):
+    # Who is alerted.
+    subscriber = models.ForeignKey(Subscriber, on_delete=models.CASCADE, related_name='subscriptions')
+    # The course they are alerted about.
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='subscriptions')
+    # The name the subscriber gave the course (for alerts).
+    name = models.CharField(max_length=25)
+    # Whether the subscriber has been sent the initial alert for the course.
+    alerted = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('subscriber', 'course')
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.subscriber, self.name)
+
+    @staticmethod
+    def subscribe(course, name, addresses):
+        """
+        Subscribe addresses to a course, skipping any already subscribed, and
+        tell the monitor once committed.
+
+        Args:
+            course (Course): The course.
+            name (str): Name the subscribers gave the course.
+            addresses (set): The email addresses.
+
+        Returns: Number of new subscriptions.
+
+        """
+        subscribers = Subscriber.for_addresses(addresses)
+        subscribed = set(
+            Subscription.objects.filter(course=course, subscriber__in=subscribers).values_list(
+                'subscriber_id', flat=True
+            )
+        )
+        subscriptions = [
+            Subscription(subscriber=subscriber, course=course, name=name)
+            for subscriber in subscribers if subscriber.pk not in subscribed
+        ]
+        created = len(subscriptions)
+        try:
+            with transaction.atomic():
+                Subscription.objects.bulk_create(subscriptions)
+        except IntegrityError:
+            # Another signup added some since; create the rest one at a time.
+            created = sum(
+                Subscription.objects.get_or_create(
+                    subscriber=subscription.subscriber, course=course, defaults={'name': name}
+                )[1]
+                for subscription in subscriptions
+            )
+        # Bulk creation sends no signals; the monitor is told directly.
+        transaction.on_commit(lambda: notify_course_change(course.pk))
+        return created
@@ -0,0 +1,321 @@
+"""
+Alert aggregation between seating trackers and the mailer. Coalesces the
+changes of flapping sections over a window, drops changes below the alert
+threshold, and optionally merges each recipient's alerts into digests.
+
+"""
+import threading
+import time
+import traceback
+
+from decouple import config
+from django.db import close_old_connections
+
+from .mailer import mailer
+from .metrics import Counter
+
+# Seconds the changes of a section are coalesced over; 0 alerts at once.
+WINDOW = config('ALERT_WINDOW', default=0, cast=int)
+# Seconds each recipient's alerts are gathered into one digest; 0 disables digests.
+DIGEST_WINDOW = config('ALERT_DIGEST_WINDOW', default=0, cast=int)
+# Name of the threshold a change must pass to be alerted.
+THRESHOLD = config('ALERT_THRESHOLD', default='any')
+
+# Whether a change from `before` to `after` remaining seats is worth an
+# alert, by threshold name.
+THRESHOLDS = {
+    'any': lambda before, after: True,
+    'opening': lambda before, after: before <= 0 < after,
+}
+
+# Digest email template.
+DIGEST_TEMPLATE = '''\
+From: {from_field}
+To: {to_field}
+Subject: {subject_field}
+
+{body}
+'''
+
+CHANGES = Counter('monitor_alert_changes_total', 'Changes in remaining seats handed to the alert stage.')
+RAISED = Counter('monitor_alerts_raised_total', 'Section alerts raised after coalescing and thresholds.')
+SUPPRESSED = Counter('monitor_alerts_suppressed_total', 'Changes in remaining seats not alerted, by reason.', ['reason'])
+DIGESTED = Counter('monitor_alerts_digested_total', 'Recipient alerts merged into digests.')
+ALERTS = Counter('monitor_alerts_total', 'Alert emails queued, by kind.', ['kind'])
+
+
+class PendingChange:
+    """
+    Change in the remaining seats of a section, being coalesced.
+
+    Attributes:
+        tracker (SeatingTracker): Tracker of the section.
+        before (int): Remaining seats before the window.
+        after (int): Remaining seats as of the latest change.
+        due (float): Monotonic time the window closes.
+
+    """
+
+    def __init__(self, tracker, before, after, due):
+        self.tracker = tracker
+        self.before = before
+        self.after = after
+        self.due = due
+
+
+class AlertAggregator:
+    """
+    Turns changes in remaining seats into alert emails. Changes within
+    `window` of a section's first change are coalesced into one alert on the
+    net change, sent when the window closes. Alerts are only raised for
+    changes passing the threshold. With a digest window, every alert for a
+    recipient within `digest_window` of their first is sent as one email.
+    Windows are closed by a worker thread, started on the first change
+    needing one. Alerts that fail, e.g. because their recipients could not be
+    looked up, are held and retried by the worker after `RETRY_DELAY`, as the
+    tracker has already moved on to the new seating.
+
+    Attributes:
+        RETRY_DELAY (int): Seconds before retrying a failed alert.
+        window (int): Seconds the changes of a section are coalesced over.
+        digest_window (int): Seconds a recipient's alerts are gathered over, or 0.
+        threshold: Takes the remaining seats before and after a change, and
+            returns whether to alert on it.
+        pending (dict): Changes being coalesced, keyed by tracker URL.
+        digests (dict): [monotonic due time, [(course name, text)]] of each
+            recipient's digest, keyed by email address.
+        thread (threading.Thread): The worker thread, or None.
+
+    """
+    RETRY_DELAY = 30
+
+    def __init__(self, window=None, digest_window=None, threshold=None):
+        self.window = WINDOW if window is None else window
+        self.digest_window = DIGEST_WINDOW if digest_window is None else digest_window
+        self.threshold = THRESHOLDS[threshold or THRESHOLD]
+        self.pending = {}
+        self.digests = {}
+        self.thread = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def change(self, tracker, before, after):
+        """
+        Hand over a change in the remaining seats of a section.
+
+        Args:
+            tracker (SeatingTracker): Tracker of the section.
+            before (int): Remaining seats before the change.
+            after (int): Remaining seats after the change.
+
+        """
+        CHANGES.inc()
+        if not self.window:
+            try:
+                self.raise_alert(tracker, before, after)
+            except Exception:
+                traceback.print_exc()
+                self.hold(tracker, before, after, AlertAggregator.RETRY_DELAY)
+            return
+        self.hold(tracker, before, after, self.window)
+
+    def hold(self, tracker, before, after, delay):
+        """
+        Hold a change until the worker thread alerts on it, folding it into
+        any change of the section already held.
+
+        Args:
+            tracker (SeatingTracker): Tracker of the section.
+            before (int): Remaining seats before the change.
+            after (int): Remaining seats after the change.
+            delay (float): Seconds to hold a new change for.
+
+        """
+        with self.lock:
+            pending = self.pending.get(tracker.url)
+            if pending is not None:
+                # Fold into the open window; alerted on its net change.
+                pending.after = after
+                SUPPRESSED.inc(reason='coalesced')
+                return
+            self.pending[tracker.url] = PendingChange(tracker, before, after, time.monotonic() + delay)
+        self.start()
+
+    def raise_alert(self, tracker, before, after):
+        """
+        Alert the subscribers of a section to a net change, if it passes the
+        threshold, or add it to their digests.
+
+        Args:
+            tracker (SeatingTracker): Tracker of the section.
+            before (int): Remaining seats before the change.
+            after (int): Remaining seats after the change.
+
+        """
+        if before == after:
+            SUPPRESSED.inc(reason='unchanged')
+            return
+        if not self.threshold(before, after):
+            SUPPRESSED.inc(reason='threshold')
+            return
+        RAISED.inc()
+        text = tracker.get_alert_text(before, after)
+        if not self.digest_window:
+            tracker.email_alert(text)
+            return
+        subscriptions = tracker.recipients()
+        with self.lock:
+            for subscription in subscriptions:
+                for email in subscription.emails:
+                    digest = self.digests.setdefault(email, [time.monotonic() + self.digest_window, []])
+                    digest[1].append((subscription.course_name, text))
+        self.start()
+
+    def send_digest(self, email, alerts):
+        """
+        Queue one email holding every gathered alert of a recipient.
+
+        Args:
+            email (str): Address of the recipient.
+            alerts (list): (course name, alert text) of each alert.
+
+        """
+        if len(alerts) == 1:
+            subject = '[Course Monitor] {0} Seating Changes'.format(alerts[0][0])
+            body = alerts[0][1]
+        else:
+            subject = '[Course Monitor] Seating Changes in {0} Courses'.format(len(alerts))
+            body = '\n\n'.join('{0}: {1}'.format(course_name, text) for course_name, text in alerts)
+        mailer.send(email, DIGEST_TEMPLATE.format(
+            from_field='EKU Course Monitor',
+            to_field=email,
+            subject_field=subject,
+            body=body
+        ))
+        DIGESTED.inc(len(alerts))
+        ALERTS.inc(kind='digest')
+
+    def start(self):
+        """
+        Start the worker thread if it is not running, and wake it to look at
+        new windows.
+
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def flush(self, now=None):
+        """
+        Close every window due by a time: alert on coalesced changes and send
+        digests. Changes and digests that fail are held to be retried.
+
+        Args:
+            now (float): Monotonic time to close windows due by; every window
+                is closed if None, e.g. on shutdown.
+
+        """
+        with self.lock:
+            due = [url for url, pending in self.pending.items() if now is None or pending.due <= now]
+            changes = [self.pending.pop(url) for url in due]
+        for pending in changes:
+            try:
+                self.raise_alert(pending.tracker, pending.before, pending.after)
+            except Exception:
+                traceback.print_exc()
+                self.retry_change(pending)
+        with self.lock:
+            due = [email for email, digest in self.digests.items() if now is None or digest[0] <= now]
+            digests = [(email, self.digests.pop(email)[1]) for email in due]
+        for email, alerts in digests:
+            try:
+                self.send_digest(email, alerts)
+            except Exception:
+                traceback.print_exc()
+                self.retry_digest(email, alerts)
+
+    def retry_change(self, pending):
+        """
+        Hold a change that could not be alerted on again, folding it into any
+        later change of the section held since.
+
+        Args:
+            pending (PendingChange): The change.
+
+        """
+        with self.lock:
+            later = self.pending.get(pending.tracker.url)
+            if later is not None:
+                later.before = pending.before
+                return
+            pending.due = time.monotonic() + AlertAggregator.RETRY_DELAY
+            self.pending[pending.tracker.url] = pending
+
+    def retry_digest(self, email, alerts):
+        """
+        Hold a digest that could not be sent again, ahead of any alerts
+        gathered for the recipient since.
+
+        Args:
+            email (str): Address of the recipient.
+            alerts (list): (course name, alert text) of each alert.
+
+        """
+        with self.lock:
+            digest = self.digests.setdefault(email, [time.monotonic() + AlertAggregator.RETRY_DELAY, []])
+            digest[1][:0] = alerts
+
+    def next_due(self):
+        """
+        Get the number of seconds until the next window closes.
+
+        Returns: The seconds, or None if no window is open.
+
+        """
+        with self.lock:
+            dues = [pending.due for pending in self.pending.values()]
+            dues.extend(digest[0] for digest in self.digests.values())
+        return max(0.0, min(dues) - time.monotonic()) if dues else None
+
+    def run(self):
+        """
+        Main thread execution; close windows as they come due.
+
+        """
+        while True:
+            self.wakeup.wait(self.next_due())
+            self.wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush(time.monotonic())
+            except Exception:
+                traceback.print_exc()
+
+    @staticmethod
+    def report():
+        """
+        Summarize how much the alert stage cut alerts and emails.
+
+        Returns: The summary, or None if no changes were seen.
+
+        """
+        changes = CHANGES.total()
+        if not changes:
+            return None
+        raised = RAISED.total()
+        digested = DIGESTED.total()
+        digests = ALERTS.total(kind='digest')
+        summary = '{0} seat changes raised {1} alerts ({2:.0%} fewer).'.format(
+            int(changes), int(raised), 1 - raised / changes
+        )
+        if digested:
+            summary += ' {0} recipient alerts sent as {1} digests ({2:.0%} fewer emails).'.format(
+                int(digested), int(digests), 1 - digests / digested
+            )
+        return summary
+
+
+# Aggregator shared by every tracker in the process.
+alerts = AlertAggregator()
@@ -0,0 +1,150 @@
+"""
+Batched seating lookups. Pulls the seating of every monitored section of a
+term from one class search listing, instead of one detail page per CRN.
+
+"""
+import time
+import traceback
+
+from .http_client import client
+from .parsing import PARSE_SECONDS, parse_listing
+from .resilience import CircuitOpenError
+from .seat_table import REMAINING, seats
+from .seat_tracker import SeatingTracker
+from .url import LISTING_URL, URL, VALID_TTL
+
+
+class TermBatch:
+    """
+    Polls the seating of every tracker of a term with a single listing request,
+    falling back to the detail page of any section missing from the listing,
+    or of every section if the listing cannot be read. Polled by a
+    `PollScheduler` in place of its trackers.
+
+    Attributes:
+        INTERVAL (int): Default number of seconds to wait between each scan.
+        interval (float): Number of seconds currently waited between each scan.
+        term (str): Banner term code of the batch.
+        trackers (dict): Trackers in the batch, keyed by CRN.
+        warmed (float): Monotonic time the validation cache was last warmed, or None.
+
+    """
+    INTERVAL = SeatingTracker.INTERVAL
+    # Seconds between warming the validation cache with every listed section.
+    WARM_INTERVAL = VALID_TTL // 2
+
+    def __init__(self, term):
+        self.term = term
+        self.interval = TermBatch.INTERVAL
+        self.trackers = {}
+        self.warmed = None
+
+    @property
+    def key(self):
+        """
+        Key identifying this batch to the scheduler.
+
+        """
+        return 'term:{0}'.format(self.term)
+
+    @property
+    def last_change(self):
+        """
+        Monotonic time the seating of any tracker last changed, or None.
+
+        """
+        changes = [t.last_change for t in list(self.trackers.values()) if t.last_change is not None]
+        return max(changes) if changes else None
+
+    def remaining_seats(self):
+        """
+        Get the remaining seats of every course in the batch, for the interval policy.
+
+        Returns: List of the number of remaining seats of each course.
+
+        """
+        return [seats.get(t.slot, REMAINING) for t in list(self.trackers.values()) if t.slot is not None]
+
+    def add(self, tracker):
+        """
+        Add a tracker to the batch.
+
+        Args:
+            tracker (SeatingTracker): Tracker of a section in this term.
+
+        """
+        self.trackers[tracker.crn] = tracker
+
+    def remove(self, tracker):
+        """
+        Remove a tracker from the batch.
+
+        Args:
+            tracker (SeatingTracker): Tracker of a section in this term.
+
+        Returns: True if the batch is now empty, False if not.
+
+        """
+        self.trackers.pop(tracker.crn, None)
+        return not self.trackers
+
+    def fetch(self):
+        """
+        Get the seating of every section in the term.
+
+        Returns: Dict of CRN to [Capacity, Actual, Remaining].
+
+        """
+        raw = client.request(LISTING_URL, URL.get_listing_data(self.term)).body
+        with PARSE_SECONDS.time(page='listing'):
+            return parse_listing(raw)
+
+    def scan(self):
+        """
+        Update every tracker in the batch and send alerts for any changes.
+        The seating of listed sections is stored and compared in one pass over
+        the seat table, so only trackers that changed are visited.
+
+        """
+        try:
+            seating = self.fetch()
+        except CircuitOpenError:
+            # Let the scheduler pause polling.
+            raise
+        except Exception:
+            # Fetch every section's detail page instead.
+            traceback.print_exc()
+            seating = {}
+        # Every listed section exists; spare signups for them a validation fetch.
+        if seating and (self.warmed is None or time.monotonic() - self.warmed > TermBatch.WARM_INTERVAL):
+            try:
+                URL.remember_courses(self.term, list(seating))
+                self.warmed = time.monotonic()
+            except Exception:
+                traceback.print_exc()
+        # Sections missing from the listing are fetched individually, and
+        # ones without seating yet are primed. Copy trackers, as they may
+        # change while scanning.
+        listed = []
+        unlisted = []
+        for tracker in list(self.trackers.values()):
+            # Skip trackers closed since the copy.
+            if tracker.slot is None:
+                continue
+            (listed if tracker.primed and tracker.crn in seating else unlisted).append(tracker)
+        changed = seats.update_many([(tracker.slot, seating[tracker.crn]) for tracker in listed])
+        for position in changed:
+            tracker = listed[position]
+            try:
+                tracker.record_change()
+                tracker.alert_change()
+            except Exception:
+                traceback.print_exc()
+        for tracker in unlisted:
+            try:
+                tracker.scan(seating.get(tracker.crn))
+            except CircuitOpenError:
+                # Let the scheduler pause polling.
+                raise
+            except Exception:
+                traceback.print_exc()
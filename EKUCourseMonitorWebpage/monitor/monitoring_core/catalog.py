@@ -0,0 +1,44 @@
+"""
+Crawls the class schedule of a term into a local index of its sections, for
+autocomplete and for validating signups without a network round trip.
+
+"""
+from django.db import transaction
+
+from ..models import CatalogSection
+from .http_client import client
+from .parsing import parse_catalog
+from .url import LISTING_URL, URL
+
+
+def crawl_term(term):
+    """
+    Replace the catalog of a term with the sections currently listed. An
+    empty listing leaves the catalog as it was.
+
+    Args:
+        term (str): Banner term code.
+
+    Returns: The number of sections listed.
+
+    """
+    raw = client.request(LISTING_URL, URL.get_listing_data(term)).body
+    catalog = parse_catalog(raw)
+    if not catalog:
+        return 0
+    sections = [
+        CatalogSection(
+            term=term,
+            crn=crn,
+            subject=info.subject[:10],
+            number=info.number[:10],
+            section=info.section[:10],
+            title=info.title[:100]
+        )
+        for crn, info in catalog.items()
+    ]
+    # Swap the index atomically, so lookups never see a partial term.
+    with transaction.atomic():
+        CatalogSection.objects.filter(term=term).delete()
+        CatalogSection.objects.bulk_create(sections, batch_size=500)
+    return len(sections)
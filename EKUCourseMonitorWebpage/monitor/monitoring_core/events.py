@@ -0,0 +1,101 @@
+"""
+Course change notifications between the web app and the monitor. Uses
+Postgres LISTEN/NOTIFY when available, and falls back to polling otherwise.
+
+"""
+import select
+import time
+import traceback
+
+from decouple import config
+from django.db import connection
+
+# Postgres channel course changes are announced on.
+CHANNEL = 'monitor_course_changes'
+
+
+def notify_course_change(pk):
+    """
+    Announce that a course was added, changed or removed.
+
+    Args:
+        pk (int): Database PK of the course.
+
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, str(pk)])
+
+
+class CourseEvents:
+    """
+    Waits for course changes. On Postgres, listens on a dedicated connection and
+    wakes as soon as a change is announced, rescanning every `SAFETY_TIMEOUT`
+    regardless to catch changes made without signals (e.g. `QuerySet.update`).
+    On other databases, simply waits `POLL_TIMEOUT` between scans.
+
+    Attributes:
+        POLL_TIMEOUT (int): Seconds between scans without notifications.
+        SAFETY_TIMEOUT (int): Most seconds between scans with notifications.
+        listener: Connection listening for notifications, or None if polling.
+
+    """
+    POLL_TIMEOUT = 10
+    SAFETY_TIMEOUT = config('MONITOR_SAFETY_TIMEOUT', default=300, cast=int)
+
+    def __init__(self):
+        self.listener = None
+        if connection.vendor == 'postgresql':
+            self.listen()
+
+    def listen(self):
+        """
+        Open a dedicated autocommit connection listening on the channel.
+
+        """
+        self.listener = connection.get_new_connection(connection.get_connection_params())
+        self.listener.autocommit = True
+        with self.listener.cursor() as cursor:
+            cursor.execute('LISTEN {0}'.format(CHANNEL))
+
+    def wait(self, timeout=None):
+        """
+        Block until a course change is announced or the timeout passes.
+
+        Args:
+            timeout (float): Most seconds to wait, if shorter than the default.
+
+        Returns: Set of the PKs of the courses announced; empty if the wait
+            timed out.
+
+        """
+        if self.listener is None:
+            time.sleep(min(timeout or CourseEvents.POLL_TIMEOUT, CourseEvents.POLL_TIMEOUT))
+            return set()
+        timeout = min(timeout or CourseEvents.SAFETY_TIMEOUT, CourseEvents.SAFETY_TIMEOUT)
+        ready, _, _ = select.select([self.listener], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            self.listener.poll()
+        except Exception:
+            # Connection lost; listen again, rescanning in case anything was missed.
+            traceback.print_exc()
+            self.close()
+            time.sleep(CourseEvents.POLL_TIMEOUT)
+            self.listen()
+            return set()
+        # Drain every pending notification; one scan handles them all.
+        notified = {int(notify.payload) for notify in self.listener.notifies if notify.payload.isdigit()}
+        del self.listener.notifies[:]
+        return notified
+
+    def close(self):
+        """
+        Close the listening connection, if any.
+
+        """
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
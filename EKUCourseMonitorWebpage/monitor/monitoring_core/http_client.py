@@ -0,0 +1,275 @@
+"""
+Shared HTTP client for talking to the registrar. Keeps pooled keep-alive
+connections per host, decodes gzip, and makes conditional requests so
+unchanged pages can be skipped. Requests are rate limited per host, retried
+with jittered backoff, and refused outright while a host keeps failing.
+
+"""
+import gzip
+import http.client
+import queue
+import threading
+import time
+import urllib.error
+import urllib.parse
+from collections import namedtuple
+
+from decouple import config
+
+from .metrics import Counter, Histogram
+from .resilience import CircuitBreaker, CircuitOpenError, TokenBucket, backoff_delay
+
+# Result of a request. `body` is None when the page was not modified.
+Response = namedtuple('Response', ['status', 'body', 'not_modified'])
+
+# Statuses that redirect to another location.
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Maximum number of redirects to follow for one request.
+MAX_REDIRECTS = 5
+
+REQUEST_SECONDS = Histogram('monitor_http_request_seconds', 'Latency of requests to the registrar.', ['method'])
+RESPONSES = Counter('monitor_http_responses_total', 'Responses from the registrar, by status.', ['status'])
+REQUEST_ERRORS = Counter('monitor_http_errors_total', 'Requests to the registrar that failed without a response.')
+RETRIES = Counter('monitor_http_retries_total', 'Requests to the registrar retried after a transient failure.')
+REJECTED = Counter('monitor_http_rejected_total', 'Requests refused because the circuit of their host was open.')
+
+
+class HTTPClient:
+    """
+    Thread-safe HTTP client with per-host connection pools. Polls run on the
+    scheduler's executor threads, so every request is synchronous but many can
+    share the client at once.
+
+    Attributes:
+        MAX_PER_HOST (int): Default cap on concurrent requests per host.
+        TIMEOUT (int): Default socket timeout, in seconds.
+        RATE (float): Requests per second allowed per host, on average. Polls
+            beyond it queue up, so it caps the courses a monitor can poll
+            every MONITOR_POLL_INTERVAL.
+        BURST (int): Requests allowed per host in a burst.
+        RETRIES (int): Retries of a request after a transient failure.
+        RETRY_BASE (float): Seconds before the first retry; doubled for each one after.
+        RETRY_MAX (float): Most seconds between retries.
+        BREAKER_THRESHOLD (int): Consecutive failures after which a host's circuit opens.
+        BREAKER_RESET (int): Seconds a host's circuit stays open.
+        max_per_host (int): Cap on concurrent requests, and pooled connections, per host.
+        timeout (int): Socket timeout, in seconds.
+        pools (dict): Idle connections for each (scheme, host).
+        limits (dict): Semaphore limiting concurrent requests for each (scheme, host).
+        buckets (dict): TokenBucket limiting the request rate of each (scheme, host).
+        breakers (dict): CircuitBreaker of each (scheme, host).
+        validators (dict): (ETag, Last-Modified) of each URL, for conditional requests.
+
+    """
+    MAX_PER_HOST = config('HTTP_MAX_PER_HOST', default=4, cast=int)
+    TIMEOUT = config('HTTP_TIMEOUT', default=30, cast=int)
+    RATE = config('HTTP_RATE_LIMIT', default=5.0, cast=float)
+    BURST = config('HTTP_RATE_BURST', default=10, cast=int)
+    RETRIES = config('HTTP_RETRIES', default=3, cast=int)
+    RETRY_BASE = 0.5
+    RETRY_MAX = 10
+    BREAKER_THRESHOLD = config('HTTP_BREAKER_THRESHOLD', default=5, cast=int)
+    BREAKER_RESET = config('HTTP_BREAKER_RESET', default=60, cast=int)
+
+    def __init__(self, max_per_host=None, timeout=None):
+        self.max_per_host = max_per_host or HTTPClient.MAX_PER_HOST
+        self.timeout = timeout or HTTPClient.TIMEOUT
+        self.pools = {}
+        self.limits = {}
+        self.buckets = {}
+        self.breakers = {}
+        self.validators = {}
+        self.lock = threading.Lock()
+
+    def get_pool(self, host):
+        """
+        Get the idle connection pool and request limit of a host.
+
+        Args:
+            host (tuple): (scheme, netloc) of the host.
+
+        Returns: Tuple of (connection queue, semaphore).
+
+        """
+        with self.lock:
+            if host not in self.pools:
+                self.pools[host] = queue.LifoQueue()
+                self.limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self.pools[host], self.limits[host]
+
+    def get_guards(self, host):
+        """
+        Get the rate limiter and circuit breaker of a host.
+
+        Args:
+            host (tuple): (scheme, netloc) of the host.
+
+        Returns: Tuple of (TokenBucket, CircuitBreaker).
+
+        """
+        with self.lock:
+            if host not in self.breakers:
+                self.buckets[host] = TokenBucket(HTTPClient.RATE, HTTPClient.BURST)
+                self.breakers[host] = CircuitBreaker(HTTPClient.BREAKER_THRESHOLD, HTTPClient.BREAKER_RESET)
+            return self.buckets[host], self.breakers[host]
+
+    @staticmethod
+    def is_transient(error):
+        """
+        Check whether a failed request is worth retrying.
+
+        Args:
+            error (Exception): The error the request raised.
+
+        Returns: True if the host is struggling or unreachable, False if the
+            request itself was bad.
+
+        """
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code >= 500 or error.code == 429
+        return isinstance(error, (http.client.HTTPException, OSError))
+
+    def connect(self, host):
+        """
+        Open a new connection to a host.
+
+        Args:
+            host (tuple): (scheme, netloc) of the host.
+
+        Returns: The new connection.
+
+        """
+        scheme, netloc = host
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def forget(self, url):
+        """
+        Drop the validators of a URL, e.g. once nothing polls it.
+
+        Args:
+            url (str): The URL.
+
+        """
+        self.validators.pop(url, None)
+
+    def request(self, url, data=None, conditional=False):
+        """
+        Make a request, following redirects. Transient failures are retried
+        with jittered backoff, within the host's rate limit.
+
+        Args:
+            url (str): The URL to request.
+            data (bytes): Encoded form data to POST, or None to GET.
+            conditional (bool): Whether to send If-None-Match/If-Modified-Since
+                from the last response for this URL.
+
+        Returns: The Response. Raises urllib.error.HTTPError on error statuses,
+            and CircuitOpenError while the host keeps failing.
+
+        """
+        parts = urllib.parse.urlsplit(url)
+        host = (parts.scheme, parts.netloc)
+        bucket, breaker = self.get_guards(host)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                REJECTED.inc()
+                raise CircuitOpenError(parts.netloc, breaker.retry_after())
+            bucket.acquire()
+            try:
+                response = self.fetch(url, data, conditional)
+            except Exception as e:
+                if not HTTPClient.is_transient(e):
+                    # The host answered; only the request was bad.
+                    breaker.record_success()
+                    raise
+                if breaker.record_failure() or attempt >= HTTPClient.RETRIES:
+                    raise
+                attempt += 1
+                RETRIES.inc()
+                time.sleep(backoff_delay(attempt, HTTPClient.RETRY_BASE, HTTPClient.RETRY_MAX))
+                continue
+            breaker.record_success()
+            return response
+
+    def fetch(self, url, data=None, conditional=False):
+        """
+        Make one attempt at a request, following redirects.
+
+        Returns: The Response. Raises urllib.error.HTTPError on error statuses.
+
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers, body = self.send(url, data, conditional)
+            if status not in REDIRECT_STATUSES:
+                break
+            # Follow the redirect with a plain GET.
+            url = urllib.parse.urljoin(url, headers.get('Location', ''))
+            data = None
+        if status == 304:
+            return Response(status, None, True)
+        if status >= 400:
+            raise urllib.error.HTTPError(url, status, http.client.responses.get(status, ''), headers, None)
+        # Remember validators so the next request can be conditional.
+        if data is None and (headers.get('ETag') or headers.get('Last-Modified')):
+            self.validators[url] = (headers.get('ETag'), headers.get('Last-Modified'))
+        return Response(status, body, False)
+
+    def send(self, url, data, conditional):
+        """
+        Send one request over a pooled connection, retrying once on a fresh
+        connection if a reused one has gone stale.
+
+        Returns: Tuple of (status, headers, decoded body).
+
+        """
+        parts = urllib.parse.urlsplit(url)
+        host = (parts.scheme, parts.netloc)
+        path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        headers = {'Accept-Encoding': 'gzip', 'Connection': 'keep-alive'}
+        if data is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if conditional and url in self.validators:
+            etag, last_modified = self.validators[url]
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        pool, limit = self.get_pool(host)
+        with limit:
+            for attempt in range(2):
+                try:
+                    conn = pool.get_nowait()
+                    reused = True
+                except queue.Empty:
+                    conn = self.connect(host)
+                    reused = False
+                method = 'POST' if data is not None else 'GET'
+                start = time.monotonic()
+                try:
+                    conn.request(method, path, data, headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                except (http.client.HTTPException, OSError):
+                    conn.close()
+                    # A pooled connection may have been closed by the server.
+                    if reused and attempt == 0:
+                        continue
+                    REQUEST_ERRORS.inc()
+                    raise
+                REQUEST_SECONDS.observe(time.monotonic() - start, method=method)
+                RESPONSES.inc(status=response.status)
+                # Return the connection to the pool unless the server is closing it.
+                if response.will_close:
+                    conn.close()
+                else:
+                    pool.put(conn)
+                if response.getheader('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                return response.status, response.headers, body
+
+
+# Client shared by every poll and URL validation in the process.
+client = HTTPClient()
@@ -0,0 +1,201 @@
+"""
+Outbound mail queue. Alerts and welcome emails are queued and delivered by one
+worker thread over a reused, authenticated SMTP connection.
+
+"""
+import queue
+import smtplib
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+from decouple import config
+
+from .metrics import Counter, Gauge, Histogram
+
+# Gmail authentication information.
+GMAIL_USERNAME = config('GMAIL_USERNAME')
+GMAIL_PASSWORD = config('GMAIL_PASSWORD')
+# SMTP server (overridable to point at a local stand-in).
+SMTP_HOST = config('SMTP_HOST', default='smtp.gmail.com')
+SMTP_PORT = config('SMTP_PORT', default=465, cast=int)
+SMTP_SSL = config('SMTP_SSL', default=True, cast=bool)
+# Most seconds to wait for queued messages to be delivered on shutdown.
+FLUSH_TIMEOUT = config('SMTP_FLUSH_TIMEOUT', default=30, cast=int)
+
+SMTP_SECONDS = Histogram('monitor_smtp_send_seconds', 'Time taken to hand one email to the SMTP server.')
+EMAILS = Counter('monitor_emails_total', 'Emails taken off the queue, by outcome.', ['result'])
+SMTP_ERRORS = Counter('monitor_smtp_errors_total', 'Failed SMTP connections or deliveries that were retried.')
+QUEUE_DEPTH = Gauge('monitor_email_queue_depth', 'Emails waiting to be delivered.')
+
+# A queued email.
+Message = namedtuple('Message', ['to_addr', 'content'])
+
+
+class Mailer:
+    """
+    Delivers queued messages from a worker thread, keeping the SMTP connection
+    open between messages and reconnecting with exponential backoff on failure.
+
+    Attributes:
+        BATCH_SIZE (int): Most messages taken off the queue at once.
+        IDLE_TIMEOUT (int): Seconds without messages before the connection is closed.
+        MIN_BACKOFF (int): Seconds to wait after the first failed delivery.
+        MAX_BACKOFF (int): Most seconds to wait between delivery attempts.
+        queue (queue.Queue): Messages waiting to be delivered.
+        server (smtplib.SMTP): The open connection, or None.
+        thread (threading.Thread): The worker thread, started on first send.
+
+    """
+    BATCH_SIZE = 50
+    IDLE_TIMEOUT = 60
+    MIN_BACKOFF = 1
+    MAX_BACKOFF = 300
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.server = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def send(self, to_addr, content):
+        """
+        Queue an email for delivery.
+
+        Args:
+            to_addr (str): Address to send to.
+            content (str): The full message, headers included.
+
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.queue.put(Message(to_addr, content))
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued message has been delivered or dropped, or
+        the timeout passes.
+
+        Args:
+            timeout (float): Most seconds to wait; defaults to `FLUSH_TIMEOUT`.
+
+        Returns: True if every message was handled, False if some are still queued.
+
+        """
+        deadline = time.monotonic() + (FLUSH_TIMEOUT if timeout is None else timeout)
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def connect(self):
+        """
+        Open and authenticate a connection to the SMTP server.
+
+        """
+        if SMTP_SSL:
+            self.server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT)
+        else:
+            self.server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
+        self.server.ehlo()
+        # Local stand-ins typically do not support authentication.
+        if self.server.has_extn('auth'):
+            self.server.login(GMAIL_USERNAME, GMAIL_PASSWORD)
+
+    def close(self):
+        """
+        Close the connection to the SMTP server, if open.
+
+        """
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+    def deliver(self, batch):
+        """
+        Deliver a batch of messages, reconnecting with backoff until the server
+        accepts them. Messages the server refuses outright are dropped, as is
+        the whole batch if the server permanently refuses the connection or
+        the credentials.
+
+        Args:
+            batch (list): The messages to deliver.
+
+        """
+        backoff = Mailer.MIN_BACKOFF
+        while batch:
+            try:
+                if self.server is None:
+                    try:
+                        self.connect()
+                    except smtplib.SMTPResponseException as e:
+                        if e.smtp_code < 500:
+                            raise
+                        # Retrying will not help; drop the batch.
+                        traceback.print_exc()
+                        self.close()
+                        EMAILS.inc(len(batch), result='dropped')
+                        for _ in batch:
+                            self.queue.task_done()
+                        return
+                while batch:
+                    result = 'sent'
+                    try:
+                        with SMTP_SECONDS.time():
+                            self.server.sendmail(GMAIL_USERNAME, batch[0].to_addr, batch[0].content)
+                    except smtplib.SMTPRecipientsRefused:
+                        # Retrying will not help; drop the message.
+                        traceback.print_exc()
+                        result = 'dropped'
+                    except smtplib.SMTPResponseException as e:
+                        # Permanent failures are dropped; transient ones retried.
+                        if e.smtp_code < 500:
+                            raise
+                        traceback.print_exc()
+                        result = 'dropped'
+                    EMAILS.inc(result=result)
+                    batch.pop(0)
+                    self.queue.task_done()
+                    backoff = Mailer.MIN_BACKOFF
+            except (smtplib.SMTPException, OSError):
+                traceback.print_exc()
+                SMTP_ERRORS.inc()
+                self.close()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, Mailer.MAX_BACKOFF)
+
+    def run(self):
+        """
+        Main thread execution; deliver messages in batches as they are queued.
+
+        """
+        while True:
+            try:
+                message = self.queue.get(timeout=Mailer.IDLE_TIMEOUT)
+            except queue.Empty:
+                # Don't hold the connection open while idle.
+                self.close()
+                continue
+            # Take whatever else is already waiting, up to the batch size.
+            batch = [message]
+            while len(batch) < Mailer.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.deliver(batch)
+
+
+# Mailer shared by every alert and welcome email in the process.
+mailer = Mailer()
+QUEUE_DEPTH.set_function(mailer.queue.qsize)
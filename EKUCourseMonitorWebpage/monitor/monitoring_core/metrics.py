@@ -0,0 +1,375 @@
+"""
+Counters, gauges and latency histograms for the monitor daemon, served in the
+Prometheus text format from a local `/metrics` endpoint, alongside any JSON
+views added for operators.
+
+"""
+import bisect
+import http.server
+import json
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+
+from decouple import config
+
+# Address the metrics endpoint listens on; a port of 0 disables it.
+METRICS_HOST = config('MONITOR_METRICS_HOST', default='127.0.0.1')
+METRICS_PORT = config('MONITOR_METRICS_PORT', default=9100, cast=int)
+
+
+class Metric:
+    """
+    Base class of metrics. Each metric holds one value per combination of
+    label values, and registers itself with the registry on creation.
+
+    Attributes:
+        TYPE (str): Prometheus type of the metric.
+        name (str): Name of the metric.
+        documentation (str): Description of the metric.
+        labelnames (tuple): Names of the labels the metric is split by.
+        values (dict): Value of each combination of label values.
+
+    """
+    TYPE = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def key(self, labels):
+        """
+        Get the label values of a sample, in label name order.
+
+        Args:
+            labels (dict): Label values, by name.
+
+        Returns: Tuple of label values.
+
+        """
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def format_labels(self, key, extra=()):
+        """
+        Format label values for the text exposition.
+
+        Args:
+            key (tuple): Label values, in label name order.
+            extra (tuple): Further (name, value) pairs, e.g. a bucket bound.
+
+        Returns: The labels, e.g. '{result="ok"}', or '' if there are none.
+
+        """
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(
+            '{0}="{1}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in pairs
+        ) + '}'
+
+    def samples(self):
+        """
+        Get the samples of the metric.
+
+        Returns: List of (name suffix, labels, value) tuples.
+
+        """
+        with self.lock:
+            return [('', self.format_labels(key), value) for key, value in sorted(self.values.items())]
+
+    def expose(self):
+        """
+        Render the metric in the Prometheus text format.
+
+        Returns: The lines of the metric.
+
+        """
+        lines = [
+            '# HELP {0} {1}'.format(self.name, self.documentation),
+            '# TYPE {0} {1}'.format(self.name, self.TYPE)
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append('{0}{1}{2} {3}'.format(self.name, suffix, labels, float(value)))
+        return lines
+
+
+class Counter(Metric):
+    """
+    Value that only goes up, such as a number of events.
+
+    """
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the counter.
+
+        Args:
+            amount (float): How much to increase it by.
+            **labels: Label values of the sample.
+
+        """
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self, **labels):
+        """
+        Get the count across every label value, or of the given label values.
+
+        Args:
+            **labels: Label values to count; all are counted if none are given.
+
+        Returns: The count.
+
+        """
+        with self.lock:
+            if labels:
+                return self.values.get(self.key(labels), 0)
+            return sum(self.values.values())
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down, such as a number of trackers. May instead
+    read its value from a function whenever it is exposed.
+
+    Attributes:
+        function: Returns the current value, or None if set directly.
+
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        """
+        Set the gauge.
+
+        Args:
+            value (float): The new value.
+            **labels: Label values of the sample.
+
+        """
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the gauge.
+
+        Args:
+            amount (float): How much to increase it by; negative to decrease.
+            **labels: Label values of the sample.
+
+        """
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_function(self, function):
+        """
+        Read the value of the gauge from a function from now on.
+
+        Args:
+            function: Returns the current value.
+
+        """
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            return [('', '', self.function())]
+        return super().samples()
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, such as latencies, in cumulative buckets.
+    Each value of `values` is a list of bucket counts, plus the overflow count
+    and the sum of observations.
+
+    Attributes:
+        BUCKETS (tuple): Default upper bounds of each bucket, in seconds.
+        buckets (tuple): Upper bounds of each bucket.
+
+    """
+    TYPE = 'histogram'
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets or Histogram.BUCKETS)
+
+    def observe(self, value, **labels):
+        """
+        Record an observation.
+
+        Args:
+            value (float): The observed value.
+            **labels: Label values of the sample.
+
+        """
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts = self.values[key]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe how long the body of a `with` block takes, in seconds.
+
+        Args:
+            **labels: Label values of the sample.
+
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def totals(self):
+        """
+        Get the number and sum of observations across every label value.
+
+        Returns: Tuple of (count, sum).
+
+        """
+        with self.lock:
+            values = list(self.values.values())
+        return sum(sum(counts[:-1]) for counts in values), sum(counts[-1] for counts in values)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            values = sorted((key, list(counts)) for key, counts in self.values.items())
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts[:-1]):
+                cumulative += count
+                bound = '+Inf' if bound == float('inf') else repr(float(bound))
+                samples.append(('_bucket', self.format_labels(key, [('le', bound)]), cumulative))
+            samples.append(('_count', self.format_labels(key), cumulative))
+            samples.append(('_sum', self.format_labels(key), counts[-1]))
+        return samples
+
+
+class Registry:
+    """
+    Every metric of the process, in the order they were created.
+
+    Attributes:
+        metrics (list): The registered metrics.
+
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        """
+        Add a metric to the registry.
+
+        Args:
+            metric (Metric): The metric.
+
+        """
+        self.metrics.append(metric)
+
+    def expose(self):
+        """
+        Render every metric in the Prometheus text format.
+
+        Returns: The exposition, as a string.
+
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+# Registry shared by every metric in the process.
+registry = Registry()
+
+# Functions returning the JSON served at each extra path of the endpoint.
+views = {}
+
+
+def add_view(path, function):
+    """
+    Serve the result of a function as JSON from the metrics endpoint.
+
+    Args:
+        path (str): Path to serve it at, e.g. '/workers'.
+        function: Returns a JSON serializable object; called on every request.
+
+    """
+    views[path] = function
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the registry at `/metrics`, and each view at its own path.
+
+    """
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            body = registry.expose().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif path in views:
+            body = json.dumps(views[path](), indent=2).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are too frequent to log.
+        pass
+
+
+class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def start_server(port=None, host=None):
+    """
+    Serve the metrics endpoint from a daemon thread.
+
+    Args:
+        port (int): Port to listen on; defaults to `METRICS_PORT`. 0 disables the endpoint.
+        host (str): Address to listen on; defaults to `METRICS_HOST`.
+
+    Returns: The server, or None if disabled.
+
+    """
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = MetricsServer((host or METRICS_HOST, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # Logging.
+    print('Serving metrics on http://{0}:{1}/metrics'.format(*server.server_address))
+    return server
@@ -1,25 +1,64 @@
 """
-Base monitoring script. Continually checks the DB for new courses to monitor
-and adds threads for each one. Also removes threads for courses that have
-been deactivated.
+Base monitoring script. Checks the DB for new courses to monitor whenever
+courses change and schedules polling for each one. Also stops polling courses
+that have been deactivated.
+
+Several monitors may run at once, each named and holding leases on the courses
+it polls. Courses are partitioned between the live monitors by consistent
+hashing on course PK; run with `--processes N` to supervise N of them.
 
 """
+import argparse
+import datetime
 import os
 import os.path
 import signal
 import sys
 import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
 
+# When the process started, for measuring how long startup takes.
+START = time.monotonic()
 
-# Allow script to access Django models.
+# Allow script to access Django models. Only the app registry is needed, not
+# the whole WSGI application.
 path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 sys.path.insert(0, path)
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "EKUCourseMonitorWebpage.settings")
-from django.core.wsgi import get_wsgi_application
-application = get_wsgi_application()
+import django
+django.setup()
+
+from django.db.models import Q
+from django.utils import timezone
 
-from monitor.models import Course
+from monitor.models import Course, MonitorWorker, SeatSnapshot, Subscriber, Subscription
+from monitor.monitoring_core.alerts import AlertAggregator, alerts
+from monitor.monitoring_core.batch import TermBatch
+from monitor.monitoring_core.events import CourseEvents
+from monitor.monitoring_core.http_client import REQUEST_SECONDS, client
+from monitor.monitoring_core.mailer import mailer
+from monitor.monitoring_core.recipients import Recipients, recipients
+from monitor.monitoring_core.metrics import Counter, Gauge, Histogram, METRICS_PORT, add_view, start_server
+from monitor.monitoring_core.resilience import backoff_delay
+from monitor.monitoring_core.registry import WorkerRegistry
+from monitor.monitoring_core.ring import HashRing
+from monitor.monitoring_core.scheduler import PollScheduler
 from monitor.monitoring_core.seat_tracker import SeatingTracker
+from monitor.monitoring_core.snapshots import writer
+from monitor.monitoring_core.supervisor import Supervisor
+from monitor.monitoring_core.url import URL
+from monitor.monitoring_core.validation import SignupValidator
+
+TRACKERS = Gauge('monitor_trackers', 'Seating trackers being polled.')
+COURSES = Gauge('monitor_courses', 'Courses subscribed to a tracker.')
+BATCHES = Gauge('monitor_batches', 'Term batches being polled.')
+SCAN_SECONDS = Histogram('monitor_scan_seconds', 'Time taken to sync courses with the database.')
+STARTUP_SECONDS = Gauge('monitor_startup_seconds', 'Seconds from process start until owned courses were resumed.')
+FIRST_POLL_SECONDS = Gauge('monitor_time_to_first_poll_seconds', 'Seconds from process start until the first poll finished.')
+COURSE_STARTS = Counter('monitor_course_starts_total', 'Attempts to start monitoring a course, by outcome.', ['result'])
 
 
 class Monitor:
@@ -27,15 +66,52 @@ class Monitor:
     Main class for performing monitoring tasks.
 
     Attributes:
-        workers (list): List of active monitoring threads.
+        name (str): Name of this monitor, recorded as the owner of its courses.
+        ring (HashRing): Partition of courses between the live monitors.
+        workers (WorkerRegistry): Active seating trackers, by URL and course PK.
+        batches (dict): Batches of trackers polled together, keyed by term.
+        scheduler (PollScheduler): Event loop polling every active tracker.
+        retries (dict): (failed attempts, monotonic time of next attempt) of
+            courses that could not be started, keyed by PK.
+        events (CourseEvents): Wakes the monitor when courses change.
+        validator (SignupValidator): Checks the sections of pending signups.
 
     """
-    # Timeout between scanning.
-    TIMEOUT = 10
+    # Whether to poll each term's trackers from one class search listing.
+    BATCH_FETCH = config('MONITOR_BATCH_FETCH', default=False, cast=bool)
+    # Seconds a lease on a course lasts without renewal.
+    LEASE = config('MONITOR_LEASE', default=90, cast=int)
+    # Seconds between lease renewals; also the longest wait between scans.
+    HEARTBEAT = LEASE // 3
+    # Seconds before retrying a course that could not be started; doubled for
+    # each failure after, up to the maximum.
+    RETRY_BASE = config('MONITOR_RETRY_BASE', default=30, cast=int)
+    RETRY_MAX = 3600
+    # Seconds the first polls of courses resumed on startup are spread over.
+    WARMUP = config('MONITOR_WARMUP', default=60, cast=int)
+    # Most trackers fetching their initial seating at once.
+    STARTUP_CONCURRENCY = config('MONITOR_STARTUP_CONCURRENCY', default=8, cast=int)
+    # Most course PKs in one query, within SQLite's limit on query parameters.
+    CHUNK_SIZE = 500
 
-    def __init__(self):
-        self.workers = []
-        # Start threads for courses that should have them.
+    def __init__(self, name='default'):
+        self.name = name
+        self.ring = HashRing([name])
+        self.workers = WorkerRegistry()
+        self.batches = {}
+        self.retries = {}
+        self.scheduler = PollScheduler()
+        self.scheduler.start()
+        self.events = CourseEvents()
+        self.validator = SignupValidator()
+        TRACKERS.set_function(lambda: len(self.workers))
+        COURSES.set_function(lambda: len(self.workers.urls))
+        BATCHES.set_function(lambda: len(self.batches))
+        FIRST_POLL_SECONDS.set_function(
+            lambda: self.scheduler.first_poll - START if self.scheduler.first_poll else float('nan')
+        )
+        add_view('/workers', self.describe)
+        # Start polling courses that should be monitored.
         self.initialize()
         # Set signal handler for script.
         signal.signal(signal.SIGTERM, self.catch)
@@ -44,54 +120,226 @@ class Monitor:
     def initialize(self):
         """
         Actions to perform on startup of the monitoring script.
-         - Start threads for all courses that should have them.
+         - Join the live monitors.
+         - Resume trackers for the courses this monitor owned before.
 
         """
-        active_course_threads = Course.objects.filter(thread_active=True)
-        for course in active_course_threads:
-            self.new_worker(course)
-            # Logging.
-            print('Initialized worker for: {0}'.format(course))
+        self.heartbeat()
+        owned_courses = [
+            course
+            for course in Course.objects.filter(owner=self.name, is_monitored=True)
+            if self.ring.node_for(course.pk) == self.name
+        ]
+        started = self.start_courses(owned_courses)
+        # Renew leases on resumed courses, and release the rest.
+        self.heartbeat()
+        STARTUP_SECONDS.set(time.monotonic() - START)
+        # Logging.
+        print('Resumed {0} of {1} courses {2:.1f}s after start.'.format(
+            len(started), len(owned_courses), time.monotonic() - START
+        ))
 
-    def new_worker(self, course, new=False):
+    def start_courses(self, courses, new=None):
         """
-        Create new monitor thread for a course.
+        Start monitoring courses this monitor has claimed, creating the
+        trackers they need at once. Resumed courses start from their last
+        snapshot, or from their first poll if none was recorded. New courses
+        need up to date seating for their initial alerts, so their trackers
+        are fetched straight away, in parallel.
 
         Args:
-            course (Course): The course to be monitored.
-            new (boolean): Whether or not this is the first time this course is being monitored.
+            courses (list): The courses to be monitored.
+            new (dict): Whether each course is being monitored for the first
+                time, keyed by PK. No course is new by default.
+
+        Returns: Set of the PKs of the courses started.
 
         """
-        emails = course.emails.all()
-        addrs = emails.values_list('email', flat=True)
-        worker = SeatingTracker(
-            course.id,
-            course.url,
-            course.name,
-            *addrs
-        )
-        # Send out an initial alert if this is the first time monitoring this course.
-        if new:
-            worker.initial_alert()
-        worker.start()
-        self.workers.append(worker)
-        print('New worker for {0} activated.'.format(course))
+        new = new or {}
+        # URLs needing a tracker, and whether any course needs fresh seating.
+        fresh = {}
+        for course in courses:
+            if course.url not in self.workers:
+                fresh[course.url] = fresh.get(course.url, False) or new.get(course.pk, False)
+        snapshots = SeatSnapshot.latest_for([url for url, is_fresh in fresh.items() if not is_fresh])
+        trackers = {}
+        with ThreadPoolExecutor(max_workers=Monitor.STARTUP_CONCURRENCY) as executor:
+            fetches = {}
+            for course in courses:
+                url = course.url
+                if url not in fresh or url in trackers or url in fetches:
+                    continue
+                if fresh[url]:
+                    fetches[url] = executor.submit(SeatingTracker, url, course.term, course.crn)
+                else:
+                    trackers[url] = SeatingTracker(url, course.term, course.crn, snapshots.get(url), lazy=True)
+            for url, fetch in fetches.items():
+                try:
+                    trackers[url] = fetch.result()
+                except Exception:
+                    traceback.print_exc()
+        # Spare signups for these sections a validation fetch.
+        terms = {}
+        for tracker in trackers.values():
+            terms.setdefault(tracker.term, []).append(tracker.crn)
+        for term, crns in terms.items():
+            URL.remember_courses(term, crns)
+        for url, tracker in trackers.items():
+            self.workers.add(tracker)
+            # Resumed trackers are polled within the warm-up window, to catch
+            # up on changes; fresh ones have just been fetched.
+            self.schedule_worker(tracker, None if fresh[url] else Monitor.WARMUP)
+            print('New worker for {0} activated.'.format(url))
+        started = set()
+        for course in courses:
+            try:
+                worker = self.workers.get(course.url)
+                if worker is None:
+                    raise ValueError('No tracker could be created for {0}'.format(course.url))
+                worker.subscribe(course.pk)
+                self.workers.attach(course.pk, course.url)
+            except Exception:
+                traceback.print_exc()
+                self.course_failed(course)
+                continue
+            COURSE_STARTS.inc(result='ok')
+            self.retries.pop(course.pk, None)
+            started.add(course.pk)
+            print('Course {0} subscribed.'.format(course))
+        return started
 
-    @staticmethod
-    def close_workers(workers):
+    def schedule_worker(self, worker, window=None):
         """
-        Close monitor threads for a list of workers.
-         - Set stop control for each worker.
-         - Join worker threads.
+        Schedule a worker for polling, on its own or as part of its term's batch.
+        The first poll falls at the worker's phase offset within the window.
 
         Args:
-            workers (list): The worker threads to be closed.
+            worker (SeatingTracker): The worker to be polled.
+            window (float): Seconds the first poll may be spread over; defaults
+                to the worker's interval.
 
         """
+        if not Monitor.BATCH_FETCH:
+            self.scheduler.add(worker, window=window)
+            return
+        batch = self.batches.get(worker.term)
+        if batch is None:
+            batch = TermBatch(worker.term)
+            self.batches[worker.term] = batch
+            self.scheduler.add(batch, window=window)
+        batch.add(worker)
+
+    def close_workers(self, workers):
+        """
+        Stop polling a list of workers and free their seat table slots.
+        Polls already in flight finish but are not rescheduled.
+
+        Args:
+            workers (list): The workers to be closed.
+
+        """
+        if not Monitor.BATCH_FETCH:
+            self.scheduler.remove_many(workers)
+        else:
+            # Close each term's batch once its last worker is gone.
+            emptied = []
+            for worker in workers:
+                batch = self.batches[worker.term]
+                if batch.remove(worker):
+                    emptied.append(batch)
+                    del self.batches[worker.term]
+            self.scheduler.remove_many(emptied)
         for worker in workers:
-            worker.shut.set()
-        for worker in workers:
-            worker.join()
+            worker.close()
+
+    def close_courses(self, pks):
+        """
+        Unsubscribe courses from their trackers, closing every tracker no
+        other course uses.
+
+        Args:
+            pks (list): Database PKs of the courses.
+
+        """
+        closed = self.workers.detach(pks)
+        self.close_workers(closed)
+        # A tracker created for the URL later starts without seating, so
+        # must not be answered with a 304.
+        for worker in closed:
+            client.forget(worker.url)
+
+    def describe(self):
+        """
+        Describe the state of this monitor for operators, served as `/workers`.
+
+        Returns: Dict of the monitor's name, courses and trackers.
+
+        """
+        def status(tracker):
+            # Batched trackers are polled, and so scheduled, by their batch.
+            batch = self.batches.get(tracker.term) if Monitor.BATCH_FETCH else None
+            last_poll, next_due = self.scheduler.status((batch or tracker).key)
+            return [
+                None if when is None else datetime.datetime.utcfromtimestamp(when).isoformat() + 'Z'
+                for when in (last_poll, next_due)
+            ]
+
+        return {
+            'monitor': self.name,
+            'courses': {str(pk): url for pk, url in sorted(list(self.workers.urls.items()))},
+            'trackers': self.workers.describe(status),
+        }
+
+    def heartbeat(self):
+        """
+        Check in as a live monitor, renew leases on this monitor's courses and
+        rebuild the partition of courses from the set of live monitors.
+         - Drop courses another monitor has taken over or that were deleted.
+         - Release courses that now hash to another monitor.
+
+        """
+        now = timezone.now()
+        lease_expires = now + datetime.timedelta(seconds=Monitor.LEASE)
+        MonitorWorker.objects.update_or_create(name=self.name, defaults={'heartbeat': now})
+        # Renew every lease at once, rather than sending the PK of each course polled.
+        owned_courses = Course.objects.filter(owner=self.name)
+        owned = set(owned_courses.values_list('pk', flat=True))
+        owned_courses.update(lease_expires=lease_expires)
+        # Let other monitors take any owned course this monitor is not polling.
+        self.release(owned.difference(self.workers.pks()), now)
+        # Partition courses between the monitors seen within a lease.
+        live = MonitorWorker.objects.filter(
+            heartbeat__gte=now - datetime.timedelta(seconds=Monitor.LEASE)
+        ).values_list('name', flat=True)
+        if set(live) != self.ring.nodes:
+            self.ring = HashRing(live)
+            print('Monitors now: {0}'.format(', '.join(sorted(self.ring.nodes))))
+        # Drop courses no longer leased to this monitor.
+        self.close_courses([pk for pk in self.workers.pks() if pk not in owned])
+        # Release courses that belong to another monitor.
+        released = [pk for pk in self.workers.pks() if self.ring.node_for(pk) != self.name]
+        self.close_courses(released)
+        if released:
+            self.release(released, now)
+            print('Released {0} courses for rebalancing.'.format(len(released)))
+
+    def release(self, pks, now):
+        """
+        Let other monitors take over courses straight away, a chunk of
+        courses per query. This monitor stays their owner, so the monitor
+        taking one over knows it is not new.
+
+        Args:
+            pks (iterable): Database PKs of the courses.
+            now (datetime): The current time.
+
+        """
+        pks = list(pks)
+        for start in range(0, len(pks), Monitor.CHUNK_SIZE):
+            Course.objects.filter(
+                pk__in=pks[start:start + Monitor.CHUNK_SIZE],
+                owner=self.name
+            ).update(lease_expires=now)
 
     def setup_new_courses(self):
         """
@@ -101,23 +349,129 @@ class Monitor:
             True if new courses setup, False if not.
 
         """
-        new_courses = Course.objects.filter(
-            thread_active=False,
-            is_monitored=True
-        )
-        if not new_courses:
+        now = timezone.now()
+        # Courses nobody holds a lease on.
+        unleased = Q(owner__isnull=True) | Q(lease_expires__isnull=True) | Q(lease_expires__lt=now)
+        candidates = Course.objects.filter(unleased, is_monitored=True, status=Course.VALID)
+        # Courses are new if they have never been owned; otherwise they are
+        # being taken over from another monitor.
+        new = {
+            course.pk: course.owner is None
+            for course in candidates
+            if course.pk not in self.workers.urls
+            and self.ring.node_for(course.pk) == self.name
+            and self.retry_due(course.pk)
+        }
+        if not new:
             return False
-        for course in new_courses:
-            # Welcome the emails associated with this course.
-            for email in course.emails.all():
-                email.welcome_if_new()
-            # Create worker for this course.
-            self.new_worker(course, new=True)
+        # Claim the courses, a chunk at a time; another monitor may win some of them.
+        pks = list(new)
+        claimed_courses = []
+        for start in range(0, len(pks), Monitor.CHUNK_SIZE):
+            chunk = pks[start:start + Monitor.CHUNK_SIZE]
+            Course.objects.filter(unleased, pk__in=chunk).update(
+                owner=self.name,
+                lease_expires=now + datetime.timedelta(seconds=Monitor.LEASE)
+            )
+            claimed_courses.extend(Course.objects.filter(pk__in=chunk, owner=self.name))
+        started = self.start_courses(claimed_courses, new)
+        for course in claimed_courses:
+            if course.pk not in started:
+                # Give the course back, still new if it was, to retry later.
+                Course.objects.filter(pk=course.pk).update(
+                    owner=None if new[course.pk] else self.name,
+                    lease_expires=now
+                )
+                continue
             print('New course {0} set up.'.format(course))
-        # Set them to have active threads.
-        new_courses.update(thread_active=True)
         return True
 
+    def validate_signups(self):
+        """
+        Queue the pending courses of this monitor's partition to be checked.
+
+        Returns: True if any were queued, False if not.
+
+        """
+        pending = [
+            course
+            for course in Course.objects.filter(status=Course.PENDING, is_monitored=True)
+            if self.ring.node_for(course.pk) == self.name
+        ]
+        return bool(self.validator.submit(pending))
+
+    def alert_new_subscriptions(self):
+        """
+        Welcome the subscribers of courses this monitor polls that have not
+        yet had an initial alert, and send them one.
+
+        Returns: True if any were alerted, False if not.
+
+        """
+        pending = [
+            subscription
+            for subscription in Subscription.objects.filter(
+                course__owner=self.name,
+                alerted=False
+            ).select_related('subscriber')
+            if self.workers.tracker_of(subscription.course_id) is not None
+        ]
+        if not pending:
+            return False
+        # Welcome new subscribers at once.
+        subscribers = {subscription.subscriber_id: subscription.subscriber for subscription in pending}
+        Subscriber.welcome_new(subscribers.values())
+        # Group the new subscribers of each course by the name they gave it.
+        courses = {}
+        for subscription in pending:
+            names = courses.setdefault(subscription.course_id, {})
+            names.setdefault(subscription.name, []).append(subscription)
+        alerted = []
+        for pk, names in courses.items():
+            worker = self.workers.tracker_of(pk)
+            try:
+                if not worker.primed:
+                    worker.prime()
+            except Exception:
+                # Try again on the next scan.
+                traceback.print_exc()
+                continue
+            worker.initial_alert(*[
+                Recipients(name, tuple(subscription.subscriber.email for subscription in subscriptions))
+                for name, subscriptions in names.items()
+            ])
+            alerted.extend(subscription.pk for subscriptions in names.values() for subscription in subscriptions)
+            # The course has new recipients.
+            recipients.invalidate(pk)
+        Subscription.objects.filter(pk__in=alerted).update(alerted=True)
+        return bool(alerted)
+
+    def course_failed(self, course):
+        """
+        Back off before trying to start a course again.
+
+        Args:
+            course (Course): The course that could not be started.
+
+        """
+        COURSE_STARTS.inc(result='error')
+        attempts = self.retries.get(course.pk, (0, 0))[0] + 1
+        delay = backoff_delay(attempts, Monitor.RETRY_BASE, Monitor.RETRY_MAX)
+        self.retries[course.pk] = (attempts, time.monotonic() + delay)
+        print('Retrying course {0} in {1:.0f}s.'.format(course, delay))
+
+    def retry_due(self, pk):
+        """
+        Check whether a course that could not be started may be tried again.
+
+        Args:
+            pk (int): Database PK of the course.
+
+        Returns: True if due or never failed, False if still backing off.
+
+        """
+        return pk not in self.retries or self.retries[pk][1] <= time.monotonic()
+
     def close_deactivated_courses(self):
         """
         Stop monitoring any deactivated courses.
@@ -126,7 +480,7 @@ class Monitor:
 
         """
         deactivated_courses = Course.objects.filter(
-            thread_active=True,
+            owner=self.name,
             is_monitored=False
         )
         if not deactivated_courses:
@@ -134,44 +488,91 @@ class Monitor:
         # Logging.
         for course in deactivated_courses:
             print('Deactivated worker for: {0}'.format(course))
-        # Close workers and remove from worker list.
-        for course in deactivated_courses:
-            worker = [worker for worker in self.workers if worker.pk == course.pk]
-            self.close_workers(worker)
-            self.workers.remove(worker[0])
-        # Set course thread status to deactivated.
-        deactivated_courses.update(thread_active=False)
+        # Unsubscribe courses, closing workers no other course uses.
+        self.close_courses([course.pk for course in deactivated_courses])
+        # Clear ownership, so the course is new again if reactivated.
+        deactivated_courses.update(owner=None, lease_expires=None)
         return True
 
     def scan(self):
         """
-        Scans the DB, creating new threads for any new courses and closing
-        threads for any deactivated ones. Waits the timeout amount before
+        Scans the DB, creating new trackers for any new courses and closing
+        trackers for any deactivated ones. Waits for courses to change before
         scanning again.
 
         """
         try:
             while True:
-                self.setup_new_courses()
-                self.close_deactivated_courses()
-                time.sleep(Monitor.TIMEOUT)
-        # Shut down threads on interrupt.
+                with SCAN_SECONDS.time():
+                    self.heartbeat()
+                    self.validate_signups()
+                    self.setup_new_courses()
+                    self.alert_new_subscriptions()
+                    self.close_deactivated_courses()
+                # Changed courses may have changed recipients.
+                recipients.invalidate(*self.events.wait(Monitor.HEARTBEAT))
+        # Shut down the scheduler on interrupt.
         except KeyboardInterrupt:
-            self.close_workers(self.workers)
+            self.shutdown()
+
+    def shutdown(self):
+        """
+        Cancel all scheduled polls, wait for in-flight polls and signup
+        checks to finish, send any coalesced alerts, deliver any queued emails and write any
+        buffered snapshots.
+
+        """
+        self.events.close()
+        self.validator.shutdown()
+        self.close_workers(list(self.workers.trackers.values()))
+        self.scheduler.stop()
+        # Hand courses over to the other monitors straight away.
+        Course.objects.filter(owner=self.name).update(lease_expires=timezone.now())
+        MonitorWorker.objects.filter(name=self.name).delete()
+        # Send coalesced alerts and digests now rather than dropping them.
+        alerts.flush()
+        if not mailer.flush():
+            print('Gave up on {0} undelivered emails.'.format(mailer.queue.unfinished_tasks))
+        writer.flush()
+        # Logging.
+        report = AlertAggregator.report()
+        if report:
+            print(report)
+        count, total = REQUEST_SECONDS.totals()
+        if count:
+            print('Made {0} requests, mean latency {1:.3f}s.'.format(count, total / count))
 
     def catch(self, signum, frame):
         """
         Shut down program on termination. This involves:
-         - closing all the threads
-         - pausing to ensure the threads are closed
+         - cancelling all scheduled polls
+         - waiting for in-flight polls to finish
          - and exiting
 
         """
-        self.close_workers(self.workers)
-        time.sleep(0.1)
+        self.shutdown()
         exit()
 
 
 if __name__ == '__main__':
-    monitor = Monitor()
-    monitor.scan()
+    parser = argparse.ArgumentParser(description='Monitor course seating.')
+    parser.add_argument('--worker', default='default', help='Name of this monitor.')
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=config('MONITOR_PROCESSES', default=1, cast=int),
+        help='Number of monitor processes to supervise.'
+    )
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=METRICS_PORT,
+        help='Port to serve metrics on; supervised processes use the following ports. 0 disables metrics.'
+    )
+    args = parser.parse_args()
+    if args.processes > 1:
+        Supervisor(args.processes, args.metrics_port).run()
+    else:
+        start_server(args.metrics_port)
+        monitor = Monitor(args.worker)
+        monitor.scan()
@@ -0,0 +1,227 @@
+"""
+Targeted extraction of seating numbers from registrar pages. Streams only the
+relevant part of each page through a minimal table parser rather than
+building a full document tree.
+
+"""
+from collections import namedtuple
+from html.parser import HTMLParser
+
+from .metrics import Histogram
+
+# Marker identifying the seating table of a section's detail page.
+SEATING_SUMMARY = b'This layout table is used to present the seating numbers.'
+# Class of Banner's data tables.
+DATA_TABLE_CLASS = 'datadisplaytable'
+# Row header of the waitlist in the seating table.
+WAITLIST_ROW = 'Waitlist Seats'
+# Listing column headers holding each value.
+CRN_HEADER = 'CRN'
+SEATING_HEADERS = ('Cap', 'Act', 'Rem')
+CATALOG_HEADERS = ('Subj', 'Crse', 'Sec', 'Title')
+
+PARSE_SECONDS = Histogram(
+    'monitor_parse_seconds', 'Time spent parsing registrar pages.', ['page'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+
+# Seating of a section. `waitlist` is a (capacity, actual, remaining) tuple, or
+# None if the section has no waitlist row.
+SeatingInfo = namedtuple('SeatingInfo', ['capacity', 'actual', 'remaining', 'waitlist'])
+# Description of a section in a class search listing.
+CatalogInfo = namedtuple('CatalogInfo', ['subject', 'number', 'section', 'title'])
+
+
+class TableParser(HTMLParser):
+    """
+    Collects the cell text of Banner data tables, row by row, without keeping
+    any other part of the document.
+
+    Attributes:
+        tables (list): Each table found, as a list of rows. Each row is a list
+            of (tag, text) cells, where tag is 'th' or 'td'.
+
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tables = []
+        # Nesting depth of tables, and the depth of the data table being read.
+        self.depth = 0
+        self.table_depth = None
+        self.row = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            self.depth += 1
+            classes = (dict(attrs).get('class') or '').split()
+            if self.table_depth is None and DATA_TABLE_CLASS in classes:
+                self.table_depth = self.depth
+                self.tables.append([])
+        elif self.depth != self.table_depth:
+            return
+        elif tag == 'tr':
+            self.close_cell()
+            self.row = []
+            self.tables[-1].append(self.row)
+        elif tag in ('th', 'td') and self.row is not None:
+            self.close_cell()
+            self.cell = [tag, []]
+            self.row.append(self.cell)
+
+    def handle_endtag(self, tag):
+        if tag == 'table':
+            if self.depth == self.table_depth:
+                self.close_cell()
+                self.table_depth = None
+                self.row = None
+            self.depth -= 1
+        elif self.depth != self.table_depth:
+            return
+        elif tag in ('th', 'td'):
+            self.close_cell()
+        elif tag == 'tr':
+            self.close_cell()
+            self.row = None
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.cell[1].append(data)
+
+    def close_cell(self):
+        """
+        Join the text of the open cell, if any. Also called when a new cell or
+        row starts, as Banner does not always close its cells.
+
+        """
+        if self.cell is not None:
+            self.cell[1] = ''.join(self.cell[1]).strip()
+            self.cell = None
+
+
+def parse_tables(raw):
+    """
+    Parse every Banner data table out of some HTML.
+
+    Args:
+        raw (bytes): The HTML.
+
+    Returns: List of tables, each a list of rows of (tag, text) cells.
+
+    """
+    parser = TableParser()
+    parser.feed(raw.decode('utf-8', errors='replace'))
+    parser.close()
+    parser.close_cell()
+    return parser.tables
+
+
+def parse_seating(raw):
+    """
+    Parse the seating of a section from its detail page.
+
+    Args:
+        raw (bytes): HTML of the detail page.
+
+    Returns: The SeatingInfo, or None if the page has no seating table.
+
+    """
+    # Cut out just the seating table, so the rest of the page is never parsed.
+    marker = raw.find(SEATING_SUMMARY)
+    if marker == -1:
+        return None
+    start = raw.rfind(b'<table', 0, marker)
+    end = raw.find(b'</table>', marker)
+    if start == -1 or end == -1:
+        return None
+    tables = parse_tables(raw[start:end + len(b'</table>')])
+    if not tables:
+        return None
+    seats = None
+    waitlist = None
+    for row in tables[0]:
+        headers = [text for tag, text in row if tag == 'th']
+        values = [text for tag, text in row if tag == 'td']
+        if len(values) < 3:
+            continue
+        try:
+            values = tuple(int(value) for value in values[:3])
+        except ValueError:
+            continue
+        if headers and headers[0] == WAITLIST_ROW:
+            waitlist = values
+        # The first row of values holds the seats.
+        elif seats is None:
+            seats = values
+    if seats is None:
+        return None
+    return SeatingInfo(seats[0], seats[1], seats[2], waitlist)
+
+
+def parse_listing_columns(raw, headers):
+    """
+    Parse some columns of every row in a class search listing.
+
+    Args:
+        raw (bytes): HTML of the listing page.
+        headers (tuple): Headers of the columns to read.
+
+    Returns: Generator of lists of cell text, in the order of the headers.
+
+    """
+    for table in parse_tables(raw):
+        columns = None
+        for row in table:
+            # Find the columns from the header row.
+            row_headers = [text for tag, text in row if tag == 'th']
+            if all(h in row_headers for h in headers):
+                columns = [row_headers.index(h) for h in headers]
+                continue
+            cells = [text for tag, text in row if tag == 'td']
+            if columns is None or len(cells) <= max(columns):
+                continue
+            yield [cells[i] for i in columns]
+
+
+def parse_listing(raw):
+    """
+    Parse the seating of every section in a class search listing.
+
+    Args:
+        raw (bytes): HTML of the listing page.
+
+    Returns: Dict of CRN to [Capacity, Actual, Remaining]. Empty if the listing
+        has no seating columns.
+
+    """
+    seating = {}
+    for cells in parse_listing_columns(raw, (CRN_HEADER,) + SEATING_HEADERS):
+        # Skip continuation rows of a section (e.g. extra meeting times).
+        try:
+            crn, *vals = [int(cell) for cell in cells]
+        except ValueError:
+            continue
+        seating[crn] = vals
+    return seating
+
+
+def parse_catalog(raw):
+    """
+    Parse the description of every section in a class search listing.
+
+    Args:
+        raw (bytes): HTML of the listing page.
+
+    Returns: Dict of CRN to CatalogInfo.
+
+    """
+    catalog = {}
+    for cells in parse_listing_columns(raw, (CRN_HEADER,) + CATALOG_HEADERS):
+        # Skip continuation rows of a section (e.g. extra meeting times).
+        try:
+            crn = int(cells[0])
+        except ValueError:
+            continue
+        catalog[crn] = CatalogInfo(*cells[1:])
+    return catalog
@@ -0,0 +1,164 @@
+"""
+Policies deciding how long the scheduler waits before polling a job again.
+
+"""
+import abc
+import datetime
+import time
+
+from decouple import config, Csv
+from django.utils.module_loading import import_string
+
+
+class IntervalPolicy(abc.ABC):
+    """
+    Base class of interval policies. A policy is asked for the next interval of
+    a job after every poll of it, and told when a job stops being polled.
+
+    """
+
+    @abc.abstractmethod
+    def next_interval(self, job):
+        """
+        Get the number of seconds to wait before polling a job again.
+
+        Args:
+            job: The job that was just polled.
+
+        Returns: The interval, in seconds.
+
+        """
+
+    def forget(self, key):
+        """
+        Drop any state kept about a job that is no longer polled.
+
+        Args:
+            key: Key of the job that was removed.
+
+        """
+
+
+class FixedIntervalPolicy(IntervalPolicy):
+    """
+    Polls every job at its own fixed `INTERVAL`.
+
+    """
+
+    def next_interval(self, job):
+        return job.INTERVAL
+
+
+class AdaptiveIntervalPolicy(IntervalPolicy):
+    """
+    Polls volatile jobs often and backs off exponentially on static ones, while
+    keeping the overall request rate within a budget.
+
+    A job is hot if its seating changed within the last `RECENT` seconds, or if
+    it has only a few seats left. Hot jobs are polled every `MIN_INTERVAL`;
+    others have their interval multiplied by `BACKOFF` after every unchanged
+    poll, up to `MAX_INTERVAL`. During a registration rush no job waits longer
+    than `RUSH_MAX_INTERVAL`.
+
+    Jobs must have `interval`, `last_change` (monotonic time or None) and
+    `remaining_seats()`.
+
+    Attributes:
+        MIN_INTERVAL (int): Interval of hot jobs, in seconds.
+        MAX_INTERVAL (int): Longest interval of static jobs, in seconds.
+        RUSH_MAX_INTERVAL (int): Longest interval during a rush, in seconds.
+        BACKOFF (float): Factor the interval grows by after an unchanged poll.
+        RECENT (int): Seconds a change keeps a job hot.
+        NEAR_ZERO (int): Most remaining seats for which a job is hot.
+        BUDGET (int): Most requests per minute across all jobs.
+        RUSH_PERIODS (list): (start, end) dates of registration rushes, inclusive.
+        rates (dict): Requests per minute currently planned for each job.
+        total_rate (float): Sum of planned requests per minute.
+
+    """
+    MIN_INTERVAL = config('MONITOR_MIN_INTERVAL', default=60, cast=int)
+    MAX_INTERVAL = config('MONITOR_MAX_INTERVAL', default=3600, cast=int)
+    RUSH_MAX_INTERVAL = config('MONITOR_RUSH_MAX_INTERVAL', default=120, cast=int)
+    BACKOFF = 2
+    RECENT = 3600
+    NEAR_ZERO = 3
+    BUDGET = config('MONITOR_REQUEST_BUDGET', default=300, cast=int)
+    # Periods formatted as 'YYYY-MM-DD:YYYY-MM-DD', separated by commas.
+    RUSH_PERIODS = [
+        tuple(datetime.datetime.strptime(day, '%Y-%m-%d').date() for day in period.split(':'))
+        for period in config('MONITOR_RUSH_PERIODS', default='', cast=Csv())
+    ]
+
+    def __init__(self):
+        self.rates = {}
+        self.total_rate = 0.0
+
+    @staticmethod
+    def in_rush(today=None):
+        """
+        Check whether today falls in a registration rush.
+
+        Returns: True if in a rush, False if not.
+
+        """
+        today = today or datetime.date.today()
+        return any(start <= today <= end for start, end in AdaptiveIntervalPolicy.RUSH_PERIODS)
+
+    @staticmethod
+    def is_hot(job):
+        """
+        Check whether a job's seating is volatile.
+
+        Args:
+            job: The job to check.
+
+        Returns: True if hot, False if not.
+
+        """
+        if job.last_change is not None and time.monotonic() - job.last_change < AdaptiveIntervalPolicy.RECENT:
+            return True
+        return any(0 < seats <= AdaptiveIntervalPolicy.NEAR_ZERO for seats in job.remaining_seats())
+
+    def next_interval(self, job):
+        if AdaptiveIntervalPolicy.is_hot(job):
+            interval = AdaptiveIntervalPolicy.MIN_INTERVAL
+        else:
+            interval = min(job.interval * AdaptiveIntervalPolicy.BACKOFF, AdaptiveIntervalPolicy.MAX_INTERVAL)
+        if AdaptiveIntervalPolicy.in_rush():
+            interval = min(interval, AdaptiveIntervalPolicy.RUSH_MAX_INTERVAL)
+        # Stretch the interval if polling this often would exceed the budget.
+        other_rate = self.total_rate - self.rates.get(job.key, 0)
+        available = AdaptiveIntervalPolicy.BUDGET - other_rate
+        if available <= 0:
+            interval = AdaptiveIntervalPolicy.MAX_INTERVAL
+        else:
+            interval = max(interval, 60 / available)
+        self.rates[job.key] = 60 / interval
+        self.total_rate = other_rate + self.rates[job.key]
+        return interval
+
+    def forget(self, key):
+        self.total_rate -= self.rates.pop(key, 0)
+
+
+# Policies selectable by name.
+POLICIES = {
+    'fixed': FixedIntervalPolicy,
+    'adaptive': AdaptiveIntervalPolicy,
+}
+
+
+def get_policy(name):
+    """
+    Create an interval policy from its name, or from the dotted path of any
+    IntervalPolicy subclass.
+
+    Args:
+        name (str): Name or dotted path of the policy.
+
+    Returns: The policy.
+
+    """
+    if name in POLICIES:
+        return POLICIES[name]()
+    return import_string(name)()
@@ -0,0 +1,92 @@
+"""
+Who to alert about each course, resolved from its subscriptions when an alert
+is sent and cached until the course's subscriptions change.
+
+"""
+import threading
+import time
+from collections import namedtuple
+
+from decouple import config
+
+from .metrics import Counter
+
+LOOKUPS = Counter('monitor_recipient_lookups_total', 'Recipient lookups, by whether they hit the cache.', ['result'])
+
+# The addresses that gave a course the same name, for one alert email each.
+Recipients = namedtuple('Recipients', ['course_name', 'emails'])
+
+
+class RecipientCache:
+    """
+    Recipients of each course, loaded with one query per course and kept
+    until invalidated by a change to its subscriptions. Entries also expire
+    after `TTL`, for changes made where no notification reaches the monitor.
+
+    Attributes:
+        TTL (int): Most seconds an entry is kept.
+        entries (dict): (monotonic expiry time, tuple of Recipients), keyed by course PK.
+
+    """
+    TTL = config('MONITOR_RECIPIENT_TTL', default=300, cast=int)
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, pk):
+        """
+        Get the recipients of a course.
+
+        Args:
+            pk (int): Database PK of the course.
+
+        Returns: Tuple of Recipients, grouped by the name given to the course.
+
+        """
+        with self.lock:
+            entry = self.entries.get(pk)
+        if entry is not None and entry[0] > time.monotonic():
+            LOOKUPS.inc(result='hit')
+            return entry[1]
+        LOOKUPS.inc(result='miss')
+        recipients = RecipientCache.load(pk)
+        with self.lock:
+            self.entries[pk] = (time.monotonic() + RecipientCache.TTL, recipients)
+        return recipients
+
+    @staticmethod
+    def load(pk):
+        """
+        Query the recipients of a course.
+
+        Args:
+            pk (int): Database PK of the course.
+
+        Returns: Tuple of Recipients, grouped by the name given to the course.
+
+        """
+        from ..models import Subscription
+        names = {}
+        rows = Subscription.objects.filter(course_id=pk).order_by('name', 'subscriber__email').values_list(
+            'name', 'subscriber__email'
+        )
+        for name, email in rows:
+            names.setdefault(name, []).append(email)
+        return tuple(Recipients(name, tuple(emails)) for name, emails in names.items())
+
+    def invalidate(self, *pks):
+        """
+        Drop the cached recipients of courses.
+
+        Args:
+            *pks (int): Database PKs of the courses.
+
+        """
+        with self.lock:
+            for pk in pks:
+                self.entries.pop(pk, None)
+
+
+# Cache shared by every tracker in the process.
+recipients = RecipientCache()
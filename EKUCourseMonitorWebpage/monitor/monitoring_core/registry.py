@@ -0,0 +1,127 @@
+"""
+Index of the seating trackers a monitor runs, by URL and by the PK of every
+course subscribed to them.
+
+"""
+
+
+class WorkerRegistry:
+    """
+    Active seating trackers, keyed by course URL, and the URL each subscribed
+    course is tracked at, keyed by course PK. Lookups in either direction
+    take constant time.
+
+    Attributes:
+        trackers (dict): Active seating trackers, keyed by course URL.
+        urls (dict): URL of each subscribed course, keyed by PK.
+
+    """
+
+    def __init__(self):
+        self.trackers = {}
+        self.urls = {}
+
+    def __len__(self):
+        return len(self.trackers)
+
+    def __contains__(self, url):
+        return url in self.trackers
+
+    def get(self, url):
+        """
+        Get the tracker of a URL.
+
+        Args:
+            url (str): URL of the course.
+
+        Returns: The tracker, or None if the URL is not tracked.
+
+        """
+        return self.trackers.get(url)
+
+    def tracker_of(self, pk):
+        """
+        Get the tracker a course is subscribed to.
+
+        Args:
+            pk (int): Database PK of the course.
+
+        Returns: The tracker, or None if the course is not subscribed.
+
+        """
+        return self.trackers.get(self.urls.get(pk))
+
+    def add(self, tracker):
+        """
+        Add a tracker, keyed by its URL.
+
+        Args:
+            tracker (SeatingTracker): The tracker.
+
+        """
+        self.trackers[tracker.url] = tracker
+
+    def attach(self, pk, url):
+        """
+        Record that a course is subscribed to the tracker of a URL.
+
+        Args:
+            pk (int): Database PK of the course.
+            url (str): URL of the tracker.
+
+        """
+        self.urls[pk] = url
+
+    def detach(self, pks):
+        """
+        Unsubscribe courses from their trackers, removing any tracker left
+        without subscribers.
+
+        Args:
+            pks (list): Database PKs of the courses.
+
+        Returns: List of the trackers removed, to be stopped.
+
+        """
+        removed = []
+        for pk in pks:
+            tracker = self.trackers.get(self.urls.pop(pk, None))
+            if tracker is not None and tracker.unsubscribe(pk):
+                del self.trackers[tracker.url]
+                removed.append(tracker)
+        return removed
+
+    def pks(self):
+        """
+        Get the PKs of every subscribed course.
+
+        Returns: List of PKs.
+
+        """
+        return list(self.urls)
+
+    def describe(self, status):
+        """
+        Describe every tracker for operators.
+
+        Args:
+            status: Takes a tracker and returns its (last poll, next due)
+                wall-clock times, either of which may be None.
+
+        Returns: List of dicts, one per tracker, ordered by URL.
+
+        """
+        trackers = []
+        for url, tracker in sorted(list(self.trackers.items())):
+            last_poll, next_due = status(tracker)
+            trackers.append({
+                'url': url,
+                'term': tracker.term,
+                'crn': tracker.crn,
+                'courses': sorted(tracker.subscribers),
+                'seating': tracker.get_seating(),
+                'interval': tracker.interval,
+                'last_poll': last_poll,
+                'next_due': next_due,
+            })
+        return trackers
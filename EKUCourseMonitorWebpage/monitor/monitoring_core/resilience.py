@@ -0,0 +1,166 @@
+"""
+Building blocks for polling a registrar that may be slow, throttled or down:
+per-host rate limiting, jittered backoff and a circuit breaker.
+
+"""
+import random
+import threading
+import time
+
+
+def backoff_delay(attempt, base, cap):
+    """
+    Get a jittered exponential backoff delay. Half of the delay is fixed and
+    half random, so retries spread out without ever becoming immediate.
+
+    Args:
+        attempt (int): Number of the retry, starting at 1.
+        base (float): Delay of the first retry, in seconds.
+        cap (float): Longest delay, in seconds.
+
+    Returns: The delay, in seconds.
+
+    """
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a request while a host's circuit is open.
+
+    Attributes:
+        host: The host that is failing.
+        retry_after (float): Seconds until requests are tried again.
+
+    """
+
+    def __init__(self, host, retry_after):
+        super().__init__('Circuit open for {0}; retrying in {1:.0f}s.'.format(host, retry_after))
+        self.host = host
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing `rate` requests per second on average, in bursts of
+    up to `capacity`. Thread-safe.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        capacity (float): Most tokens held at once.
+        tokens (float): Tokens currently held.
+        updated (float): Monotonic time tokens were last added.
+
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token, going into debt if none are left.
+
+        Returns: Seconds to wait before the token may be used.
+
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        """
+        Block until a token is available, then take it.
+
+        """
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host after `threshold` consecutive failures. Once
+    `reset_timeout` has passed a single probe request is let through; its
+    success closes the circuit, and its failure opens it again.
+
+    Attributes:
+        threshold (int): Consecutive failures that open the circuit.
+        reset_timeout (float): Seconds the circuit stays open.
+        failures (int): Consecutive failures so far.
+        opened (float): Monotonic time the circuit opened, or None if closed.
+        probing (bool): Whether a probe request is in flight.
+
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def retry_after(self):
+        """
+        Get the number of seconds until a probe request is let through.
+
+        Returns: The seconds, or 0 if requests are allowed now.
+
+        """
+        with self.lock:
+            if self.opened is None:
+                return 0
+            return max(0.0, self.opened + self.reset_timeout - time.monotonic())
+
+    def allow(self):
+        """
+        Check whether a request may be made, claiming the probe if the circuit
+        has been open long enough.
+
+        Returns: True if allowed, False if not.
+
+        """
+        with self.lock:
+            if self.opened is None:
+                return True
+            if self.probing or time.monotonic() < self.opened + self.reset_timeout:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        """
+        Record a request that reached the host, closing the circuit.
+
+        """
+        with self.lock:
+            if self.opened is not None:
+                # Logging.
+                print('Circuit closed after {0} failures.'.format(self.failures))
+            self.failures = 0
+            self.opened = None
+            self.probing = False
+
+    def record_failure(self):
+        """
+        Record a failed request, opening the circuit once too many fail in a row.
+
+        Returns: True if the circuit is open, False if not.
+
+        """
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened is None and self.failures >= self.threshold):
+                # Logging.
+                print('Circuit opened after {0} failures.'.format(self.failures))
+                self.opened = time.monotonic()
+            self.probing = False
+            return self.opened is not None
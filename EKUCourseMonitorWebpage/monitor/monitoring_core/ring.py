@@ -0,0 +1,58 @@
+"""
+Consistent hashing of courses onto monitor worker processes.
+
+"""
+import bisect
+import hashlib
+
+
+class HashRing:
+    """
+    Consistent hash ring. Each node is placed on the ring at many points, so
+    keys spread evenly and only about 1/n of them move when a node joins or
+    leaves.
+
+    Attributes:
+        REPLICAS (int): Number of points each node is placed at.
+        nodes (frozenset): Names of the nodes on the ring.
+        points (list): Sorted hashes of every point on the ring.
+        owners (dict): Node owning each point.
+
+    """
+    REPLICAS = 100
+
+    def __init__(self, nodes):
+        self.nodes = frozenset(nodes)
+        self.owners = {}
+        for node in self.nodes:
+            for replica in range(HashRing.REPLICAS):
+                self.owners[HashRing.hash('{0}:{1}'.format(node, replica))] = node
+        self.points = sorted(self.owners)
+
+    @staticmethod
+    def hash(key):
+        """
+        Hash a key onto the ring.
+
+        Args:
+            key: The key to hash.
+
+        Returns: Position of the key on the ring.
+
+        """
+        return int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:16], 16)
+
+    def node_for(self, key):
+        """
+        Get the node owning a key.
+
+        Args:
+            key: The key, e.g. a course PK.
+
+        Returns: Name of the owning node, or None if the ring is empty.
+
+        """
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, HashRing.hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
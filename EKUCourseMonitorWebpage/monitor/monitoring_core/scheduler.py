@@ -0,0 +1,365 @@
+"""
+Scheduler for running the polls of every monitored course from a single
+asyncio event loop, instead of one thread per course.
+
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import math
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+from django.db import close_old_connections
+
+from .metrics import Counter, Histogram
+from .policy import get_policy
+from .resilience import CircuitOpenError, TokenBucket, backoff_delay
+
+POLLS = Counter('monitor_polls_total', 'Polls run, by outcome.', ['result'])
+POLL_SECONDS = Histogram('monitor_poll_seconds', 'Time taken by each poll, fetching included.')
+POLL_LAG = Histogram('monitor_poll_lag_seconds', 'How late polls start after they are due.')
+
+
+class PollScheduler:
+    """
+    Runs tracker polls on one event loop in a background thread. Polls are kept
+    in a timer heap keyed by the time they are next due, and the blocking fetch
+    of each poll is handed to a bounded executor.
+
+    A tracker only needs a `key` attribute, an `interval` attribute and a
+    `scan()` method to be scheduled, plus whatever its interval policy reads.
+    The interval chosen by the policy after each poll is stored on the tracker.
+
+    Polls are spread evenly over time: each tracker is first polled at a
+    deterministic phase offset within its interval (or a warm-up window),
+    derived from its key, and then every interval after that offset. Polls
+    are rescheduled relative to when they were due rather than when they
+    finished, so they do not drift back into step.
+
+    A poll that fails is retried with jittered backoff, sooner than its
+    interval, until it succeeds again. A poll refused by an open circuit
+    pauses every poll until the circuit is due to be probed.
+
+    Attributes:
+        MAX_CONCURRENT (int): Default cap on the number of polls in flight.
+        POLICY (str): Name or dotted path of the default interval policy.
+        RETRY_BASE (int): Seconds before retrying a failed poll; doubled for each failure after.
+        MAX_RATE (float): Default cap on polls started per second, or 0 for no cap.
+        max_concurrent (int): Cap on the number of polls in flight.
+        policy (IntervalPolicy): Decides how long to wait between polls.
+        bucket (TokenBucket): Limits the rate polls are started at, or None.
+        loop (asyncio.AbstractEventLoop): Event loop running the polls.
+        executor (ThreadPoolExecutor): Runs the blocking part of each poll.
+        thread (threading.Thread): Thread running the event loop.
+        heap (list): Timer heap of (due time, sequence, key) entries.
+        jobs (dict): Scheduled trackers, keyed by tracker key.
+        sequences (dict): Sequence number of the live heap entry for each key.
+        anchors (dict): Monotonic time of the first poll of each key; later
+            polls fall a whole number of intervals after it.
+        failures (dict): Consecutive failed polls of each key.
+        paused_until (float): Monotonic time polling resumes after a pause.
+        first_poll (float): Monotonic time the first poll finished, or None.
+        last_polls (dict): Wall-clock time each key was last polled successfully.
+        due (dict): Monotonic time each key is next due.
+
+    """
+    MAX_CONCURRENT = config('MONITOR_MAX_CONCURRENT', default=10, cast=int)
+    POLICY = config('MONITOR_INTERVAL_POLICY', default='fixed')
+    RETRY_BASE = config('MONITOR_RETRY_BASE', default=30, cast=int)
+    MAX_RATE = config('MONITOR_MAX_POLL_RATE', default=0.0, cast=float)
+
+    def __init__(self, max_concurrent=None, policy=None, max_rate=None):
+        self.max_concurrent = max_concurrent or PollScheduler.MAX_CONCURRENT
+        self.policy = policy or get_policy(PollScheduler.POLICY)
+        max_rate = PollScheduler.MAX_RATE if max_rate is None else max_rate
+        self.bucket = TokenBucket(max_rate, 1) if max_rate else None
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrent)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.heap = []
+        self.jobs = {}
+        self.sequences = {}
+        self.anchors = {}
+        self.failures = {}
+        self.paused_until = 0.0
+        self.first_poll = None
+        self.last_polls = {}
+        self.due = {}
+        self.counter = itertools.count()
+        self.in_flight = set()
+        self.stopping = False
+        # Created on the loop's own thread.
+        self.wakeup = None
+        self.semaphore = None
+
+    def start(self):
+        """
+        Start the event loop thread.
+
+        """
+        self.thread.start()
+
+    def stop(self):
+        """
+        Cancel every scheduled poll, wait for in-flight polls to finish and
+        shut down the event loop thread.
+
+        """
+        self.loop.call_soon_threadsafe(self._stop)
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+        self.loop.close()
+
+    @staticmethod
+    def phase(key):
+        """
+        Get the deterministic phase of a key, spreading keys evenly.
+
+        Args:
+            key: Key of the tracker.
+
+        Returns: The phase, as a fraction in [0, 1).
+
+        """
+        return int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:16], 16) / 2 ** 64
+
+    def add(self, tracker, delay=None, window=None):
+        """
+        Schedule a tracker to be polled every interval. Safe to call from any
+        thread.
+
+        Args:
+            tracker: The tracker to be polled.
+            delay (float): Seconds to wait before the first poll; by default,
+                the tracker's phase offset within the window.
+            window (float): Seconds the first polls of trackers are spread
+                over; defaults to the tracker's interval.
+
+        """
+        if delay is None:
+            delay = PollScheduler.phase(tracker.key) * (window or tracker.interval)
+        self.loop.call_soon_threadsafe(self._add, tracker, delay)
+
+    def remove(self, tracker):
+        """
+        Stop polling a tracker. A poll already in flight is allowed to finish
+        but is not rescheduled. Safe to call from any thread.
+
+        Args:
+            tracker: The tracker to stop polling.
+
+        """
+        self.loop.call_soon_threadsafe(self._remove, tracker.key)
+
+    def remove_many(self, trackers):
+        """
+        Stop polling several trackers at once, waking the event loop once.
+        Safe to call from any thread.
+
+        Args:
+            trackers (list): The trackers to stop polling.
+
+        """
+        if trackers:
+            self.loop.call_soon_threadsafe(self._remove_many, [tracker.key for tracker in trackers])
+
+    def status(self, key):
+        """
+        Get when a key was last polled and when it is next due. Safe to call
+        from any thread.
+
+        Args:
+            key: Key of the tracker.
+
+        Returns: Tuple of (last poll, next due) as wall-clock times, either of
+            which is None if unknown.
+
+        """
+        due = self.due.get(key)
+        if due is not None:
+            due = time.time() + max(due, self.paused_until) - time.monotonic()
+        return self.last_polls.get(key), due
+
+    def _add(self, tracker, delay):
+        self.jobs[tracker.key] = tracker
+        self.anchors[tracker.key] = time.monotonic() + delay
+        self._push(tracker.key, delay)
+
+    def _remove(self, key):
+        self._remove_many([key])
+
+    def _remove_many(self, keys):
+        for key in keys:
+            self.jobs.pop(key, None)
+            self.sequences.pop(key, None)
+            self.anchors.pop(key, None)
+            self.failures.pop(key, None)
+            self.last_polls.pop(key, None)
+            self.due.pop(key, None)
+            self.policy.forget(key)
+        self.wakeup.set()
+
+    def _stop(self):
+        self.stopping = True
+        self.jobs.clear()
+        self.sequences.clear()
+        self.anchors.clear()
+        self.due.clear()
+        self.wakeup.set()
+
+    def next_slot(self, key, interval):
+        """
+        Get the next time a key is due in its phase, skipping any slots missed
+        while behind.
+
+        Args:
+            key: Key of the tracker.
+            interval (float): Seconds between polls of the tracker.
+
+        Returns: Monotonic time of the next slot after now.
+
+        """
+        anchor = self.anchors[key]
+        return anchor + interval * (math.floor((time.monotonic() - anchor) / interval) + 1)
+
+    def _push(self, key, delay):
+        """
+        Push a new heap entry for a key, superseding any older entry.
+
+        Args:
+            key: Key of the tracker.
+            delay (float): Seconds from now until the poll is due.
+
+        """
+        self._push_at(key, time.monotonic() + delay)
+
+    def _push_at(self, key, due):
+        """
+        Push a new heap entry for a key at a given time, superseding any older entry.
+
+        Args:
+            key: Key of the tracker.
+            due (float): Monotonic time the poll is due.
+
+        """
+        seq = next(self.counter)
+        self.sequences[key] = seq
+        self.due[key] = due
+        heapq.heappush(self.heap, (due, seq, key))
+        self.wakeup.set()
+
+    def run(self):
+        """
+        Main thread execution; run the dispatch loop until stopped.
+
+        """
+        asyncio.set_event_loop(self.loop)
+        # Loop-bound primitives must be created once this thread owns the loop.
+        self.wakeup = asyncio.Event()
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        self.loop.run_until_complete(self.dispatch())
+
+    async def dispatch(self):
+        """
+        Pop polls off the timer heap as they become due and start them,
+        sleeping until the next one is due or the heap changes.
+
+        """
+        while not self.stopping:
+            self.wakeup.clear()
+            # Sleep until the earliest entry is due and any pause is over, or until woken.
+            timeout = max(self.heap[0][0], self.paused_until) - time.monotonic() if self.heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due, seq, key = heapq.heappop(self.heap)
+            # Skip entries that were cancelled or superseded.
+            if self.sequences.get(key) != seq:
+                continue
+            tracker = self.jobs[key]
+            await self.semaphore.acquire()
+            # Hold back bursts, e.g. after a pause.
+            if self.bucket is not None:
+                await asyncio.sleep(self.bucket.reserve())
+            POLL_LAG.observe(time.monotonic() - due)
+            task = self.loop.create_task(self.poll(key, tracker, seq))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+        # Let in-flight polls finish before the loop is shut down.
+        if self.in_flight:
+            await asyncio.wait(list(self.in_flight))
+
+    @staticmethod
+    def scan(tracker):
+        """
+        Scan a tracker on an executor thread, replacing the thread's database
+        connection if it has dropped, so alert lookups keep working.
+
+        Args:
+            tracker: The tracker to scan.
+
+        """
+        close_old_connections()
+        try:
+            tracker.scan()
+        finally:
+            close_old_connections()
+
+    async def poll(self, key, tracker, seq):
+        """
+        Run one poll of a tracker in the executor and reschedule it.
+
+        Args:
+            key: Key of the tracker.
+            tracker: The tracker to poll.
+            seq (int): Sequence number of the heap entry being run.
+
+        """
+        start = time.monotonic()
+        retry = None
+        try:
+            await self.loop.run_in_executor(self.executor, PollScheduler.scan, tracker)
+            POLLS.inc(result='ok')
+            self.failures.pop(key, None)
+            self.last_polls[key] = time.time()
+            if self.first_poll is None:
+                self.first_poll = time.monotonic()
+                # Logging.
+                print('First poll finished ({0}).'.format(key))
+        except CircuitOpenError as e:
+            # The registrar is down; hold every poll until it is probed again.
+            POLLS.inc(result='paused')
+            if self.paused_until < time.monotonic():
+                print('Pausing polls: {0}'.format(e))
+            self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+        except Exception:
+            traceback.print_exc()
+            POLLS.inc(result='error')
+            self.failures[key] = self.failures.get(key, 0) + 1
+            retry = backoff_delay(self.failures[key], PollScheduler.RETRY_BASE, tracker.interval)
+        finally:
+            self.semaphore.release()
+            POLL_SECONDS.observe(time.monotonic() - start)
+        # Reschedule unless removed or re-added while in flight.
+        if self.sequences.get(key) != seq:
+            return
+        if retry is not None:
+            self._push(key, retry)
+        elif time.monotonic() < self.paused_until:
+            # Keep the tracker's slot; the pause holds it back until it is over.
+            self._push_at(key, self.next_slot(key, tracker.interval))
+        else:
+            interval = self.policy.next_interval(tracker)
+            if interval != tracker.interval:
+                # Logging.
+                print('Polling {0} every {1:.0f}s.'.format(key, interval))
+                tracker.interval = interval
+            self._push_at(key, self.next_slot(key, interval))
@@ -0,0 +1,158 @@
+"""
+Columnar store of the seating of every tracked section. Rather than objects
+per section, the current and previous capacity, actual and remaining seats
+are kept in parallel arrays indexed by a slot each tracker holds, so tracking
+tens of thousands of sections costs a few machine words apiece.
+
+"""
+import threading
+from array import array
+
+from .metrics import Gauge
+
+# Columns of the table, in the order seating is given in.
+CAPACITY = 0
+ACTUAL = 1
+REMAINING = 2
+COLUMNS = (CAPACITY, ACTUAL, REMAINING)
+
+SLOTS = Gauge('monitor_seat_table_slots', 'Rows allocated in the seat table, free ones included.')
+
+
+class SeatTable:
+    """
+    Seating of many sections in parallel arrays. Each slot is written by one
+    poll at a time; allocating and releasing slots is thread-safe.
+
+    Attributes:
+        TYPECODE (str): Array type of the columns.
+        current (list): Array of the current values of each column.
+        previous (list): Array of the previous values of each column.
+        free (list): Released slots, reused before the arrays grow.
+
+    """
+    TYPECODE = 'l'
+
+    def __init__(self):
+        self.current = [array(SeatTable.TYPECODE) for _ in COLUMNS]
+        self.previous = [array(SeatTable.TYPECODE) for _ in COLUMNS]
+        self.free = []
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.current[CAPACITY])
+
+    def allocate(self):
+        """
+        Get a slot for a section, with zero seating.
+
+        Returns: The slot.
+
+        """
+        with self.lock:
+            if self.free:
+                slot = self.free.pop()
+                self.reset(slot, (0, 0, 0))
+                return slot
+            for column in self.current + self.previous:
+                column.append(0)
+            return len(self) - 1
+
+    def release(self, slot):
+        """
+        Give back the slot of a section no longer tracked.
+
+        Args:
+            slot (int): The slot.
+
+        """
+        with self.lock:
+            self.free.append(slot)
+
+    def get(self, slot, column=None):
+        """
+        Get the current seating of a slot.
+
+        Args:
+            slot (int): The slot.
+            column (int): Column to get; every column if None.
+
+        Returns: The value of the column, or list of [Capacity, Actual, Remaining].
+
+        """
+        if column is not None:
+            return self.current[column][slot]
+        return [values[slot] for values in self.current]
+
+    def get_previous(self, slot, column):
+        """
+        Get the previous value of a column of a slot.
+
+        Args:
+            slot (int): The slot.
+            column (int): The column.
+
+        Returns: The value.
+
+        """
+        return self.previous[column][slot]
+
+    def reset(self, slot, seating):
+        """
+        Set both the current and previous seating of a slot, so there is no
+        difference.
+
+        Args:
+            slot (int): The slot.
+            seating (list): [Capacity, Actual, Remaining].
+
+        """
+        for column in COLUMNS:
+            self.current[column][slot] = seating[column]
+            self.previous[column][slot] = seating[column]
+
+    def update(self, slot, seating):
+        """
+        Store new seating for a slot, keeping the current seating as the
+        previous one.
+
+        Args:
+            slot (int): The slot.
+            seating (list): [Capacity, Actual, Remaining].
+
+        Returns: True if the seating changed, False if not.
+
+        """
+        return bool(self.update_many([(slot, seating)]))
+
+    def update_many(self, rows):
+        """
+        Store new seating for many slots in one call, e.g. every section of
+        a batch. A plain loop over the rows, with the columns looked up once.
+
+        Args:
+            rows (list): (slot, [Capacity, Actual, Remaining]) of each section.
+
+        Returns: List of the positions in `rows` of the sections whose seating changed.
+
+        """
+        capacity, actual, remaining = self.current
+        prev_capacity, prev_actual, prev_remaining = self.previous
+        changed = []
+        for position, (slot, seating) in enumerate(rows):
+            prev_capacity[slot] = capacity[slot]
+            prev_actual[slot] = actual[slot]
+            prev_remaining[slot] = remaining[slot]
+            capacity[slot], actual[slot], remaining[slot] = seating
+            if (
+                capacity[slot] != prev_capacity[slot]
+                or actual[slot] != prev_actual[slot]
+                or remaining[slot] != prev_remaining[slot]
+            ):
+                changed.append(position)
+        return changed
+
+
+# Table shared by every tracker in the process.
+seats = SeatTable()
+SLOTS.set_function(lambda: len(seats))
@@ -1,11 +1,16 @@
-import smtplib
-import threading
 import time
-import urllib.request as request
 
-from bs4 import BeautifulSoup
 from decouple import config
 
+from .alerts import ALERTS, alerts
+from .http_client import client
+from .mailer import mailer
+from .metrics import Counter, Histogram
+from .parsing import PARSE_SECONDS, parse_seating
+from .recipients import recipients
+from .seat_table import ACTUAL, CAPACITY, REMAINING, seats
+from .snapshots import writer
+
 # Text templates for alert messages.
 OVERRIDE_ALERT = "There are no available seats and {seats} people have overrides"
 NO_AVAILABLE_ALERT = "There are no available seats in the course"
@@ -21,109 +26,283 @@ Subject: {subject_field}
 {body}
 '''
 
-# Gmail authentication information.
-GMAIL_USERNAME = config('GMAIL_USERNAME')
-GMAIL_PASSWORD = config('GMAIL_PASSWORD')
+UPDATE_SECONDS = Histogram('monitor_update_seating_seconds', 'Time taken to update the seating of a tracker.')
+SEAT_CHANGES = Counter('monitor_seat_changes_total', 'Polls that found the seating of a tracker changed.')
 
 
 class SeatingValue:
     """
-    Simple abstraction class for holding the values of of each seating attribute.
+    View of one seating attribute of a tracker, held in the seat table.
 
     Attributes:
-        cur_val (int): The current seating value.
-        prev_val (int): The previous seating value.
+        slot (int): Slot of the tracker in the seat table.
+        column (int): Column of the attribute.
 
     """
+    __slots__ = ('slot', 'column')
 
-    def __init__(self):
-        self.cur_val = 0
-        self.prev_val = 0
+    def __init__(self, slot, column):
+        self.slot = slot
+        self.column = column
 
-    def get_diff(self):
+    @property
+    def cur_val(self):
         """
-        Get the difference between the new and previous values.
+        The current seating value.
 
-        Returns: Difference between current and previous values.
+        """
+        return seats.get(self.slot, self.column)
 
+    @property
+    def prev_val(self):
         """
-        return self.cur_val - self.prev_val
+        The previous seating value.
 
-    def update(self, new_val):
         """
-        Update current seating value with an inputted value.
+        return seats.get_previous(self.slot, self.column)
 
+    def get_diff(self):
         """
-        self.prev_val = self.cur_val
-        self.cur_val = new_val
+        Get the difference between the new and previous values.
+
+        Returns: Difference between current and previous values.
+
+        """
+        return self.cur_val - self.prev_val
 
 
 # For tracking whether the seating data changes.
-class SeatingTracker(threading.Thread):
+class SeatingTracker:
     """
-    Tracks the seating of a specific course and sends email alerts whenever
-    the number of available seats changes.
+    Tracks the seating at a specific course URL and sends email alerts to the
+    subscribers of every course tracked there whenever the number of available
+    seats changes. The page is fetched once per poll no matter how many people
+    subscribe. Recipients are resolved when an alert is sent, so changes to
+    subscriptions take effect without restarting the tracker. Polled by a
+    `PollScheduler`.
 
     Attributes:
-        INTERVAL (int): Number of seconds to sleep between each scan.
-        shut (threading.Event): Stop control for the thread.
-        pk (int): Database PK for this entry.
-        emails (list): The email addresses to be alerted whenever the seating changes.
-        course_name (str): Name of the course being monitored.
-        url (str): URL that contains seating information for this course.
-        capacity (SeatingValue): The capacity of the course.
-        actual (SeatingValue): The actual number of seats in the course.
-        remaining (SeatingValue): The number of remaining seats in the course.
+        INTERVAL (int): Default number of seconds to wait between each scan.
+        interval (float): Number of seconds currently waited between each scan.
+        last_change (float): Monotonic time the seating last changed, or None.
+        url (str): URL that contains seating information for the course.
+        term (str): Banner term code of the course.
+        crn (int): Course registration number.
+        subscribers (set): PKs of the courses tracked at this URL.
+        slot (int): Slot holding the seating of the course in the seat
+            table, or None once closed.
+        primed (bool): Whether the seating has been set, from a fetch or snapshot.
 
     """
-    INTERVAL = 500
-
-    def __init__(self, pk, url, course_name, *emails):
-        threading.Thread.__init__(self)
-        self.shut = threading.Event()
-        self.pk = pk
-        self.emails = emails
-        self.course_name = course_name
+    # Every poll is a request to the registrar, so HTTP_RATE_LIMIT caps a
+    # monitor at about HTTP_RATE_LIMIT * INTERVAL courses.
+    INTERVAL = config('MONITOR_POLL_INTERVAL', default=500, cast=int)
+    # Trackers are kept for every section monitored, so they carry no __dict__.
+    __slots__ = ('url', 'term', 'crn', 'interval', 'last_change', 'subscribers', 'slot', 'primed')
+
+    def __init__(self, url, term, crn, snapshot=None, lazy=False):
         self.url = url
-        self.capacity = SeatingValue()
-        self.actual = SeatingValue()
-        self.remaining = SeatingValue()
-        # Update the seating initially.
-        self.update_seating()
-
-    def update_seating(self):
-        """
-        Update seating attributes with data from EKU's website.
-
-        """
-        # Get raw data from web page.
-        raw = request.urlopen(self.url).read()
-        # Parse HTML.
-        parsed = BeautifulSoup(raw, features='html.parser')
-        # Get the table associated with seating.
-        seating_table = parsed.body.find('table', attrs={
-            'class': 'datadisplaytable',
-            'summary': 'This layout table is used to present the seating numbers.'
-        })
-        # Get the second table row, containing information about open seats.
-        seating_row = seating_table.find_all('tr')[1]
-        # Get a list of columns as such: [Capacity, Actual, Remaining]
-        seating_cols = seating_row.find_all('td')
-        # Convert to ints.
-        raw_vals = [int(seat_tag.string) for seat_tag in seating_cols]
-        # Update seating attributes.
-        self.capacity.update(raw_vals[0])
-        self.actual.update(raw_vals[1])
-        self.remaining.update(raw_vals[2])
-
-    def get_alert_text(self):
+        self.term = term
+        self.crn = crn
+        self.interval = SeatingTracker.INTERVAL
+        self.last_change = None
+        self.subscribers = set()
+        self.slot = seats.allocate()
+        self.primed = False
+        if snapshot is not None:
+            # Resume from the last known seating; the next scan alerts on any
+            # change made while the monitor was down.
+            self.restore([snapshot.capacity, snapshot.actual, snapshot.remaining])
+        elif not lazy:
+            # Update the seating initially, giving the slot back if that fails.
+            try:
+                self.prime()
+            except Exception:
+                self.close()
+                raise
+
+    def close(self):
+        """
+        Give back the tracker's slot in the seat table once it is no longer
+        polled. A poll still in flight then fails, rather than writing to a
+        slot given to another tracker.
+
+        """
+        if self.slot is not None:
+            seats.release(self.slot)
+            self.slot = None
+
+    @property
+    def key(self):
+        """
+        Key identifying this tracker to the scheduler.
+
+        """
+        return self.url
+
+    @property
+    def capacity(self):
+        """
+        The capacity of the course, as a SeatingValue.
+
+        """
+        return SeatingValue(self.slot, CAPACITY)
+
+    @property
+    def actual(self):
+        """
+        The actual number of seats in the course, as a SeatingValue.
+
+        """
+        return SeatingValue(self.slot, ACTUAL)
+
+    @property
+    def remaining(self):
+        """
+        The number of remaining seats in the course, as a SeatingValue.
+
+        """
+        return SeatingValue(self.slot, REMAINING)
+
+    def subscribe(self, pk):
+        """
+        Subscribe a course to the seating alerts of this URL.
+
+        Args:
+            pk (int): Database PK of the course.
+
+        """
+        self.subscribers.add(pk)
+
+    def unsubscribe(self, pk):
+        """
+        Unsubscribe a course from the seating alerts of this URL.
+
+        Args:
+            pk (int): Database PK of the course.
+
+        Returns: True if no subscribers remain, False if not.
+
+        """
+        self.subscribers.discard(pk)
+        return not self.subscribers
+
+    def recipients(self):
+        """
+        Get who to alert about this URL, across every course tracked here.
+
+        Returns: Tuple of Recipients.
+
+        """
+        # Copy subscribers, as they may change while an alert is being sent.
+        return tuple(
+            recipient
+            for pk in list(self.subscribers)
+            for recipient in recipients.get(pk)
+        )
+
+    def prime(self, raw_vals=None):
+        """
+        Set the initial seating of a tracker created without any, and record it.
+
+        Args:
+            raw_vals (list): [Capacity, Actual, Remaining] if already fetched;
+                the detail page is fetched if None.
+
+        """
+        self.restore(raw_vals if raw_vals is not None else self.fetch_seating())
+        writer.record(self.url, *self.get_seating())
+
+    def update_seating(self, raw_vals=None):
+        """
+        Update seating attributes with data from EKU's website. The first
+        update of a lazily created tracker only primes it, without a change.
+
+        Args:
+            raw_vals (list): [Capacity, Actual, Remaining] if already fetched,
+                e.g. from a batched listing; the detail page is fetched if None.
+
+        """
+        with UPDATE_SECONDS.time():
+            if raw_vals is None:
+                raw_vals = self.fetch_seating()
+            if not self.primed:
+                self.prime(raw_vals)
+                return
+            # Update seating attributes.
+            if seats.update(self.slot, raw_vals):
+                self.record_change()
+
+    def record_change(self):
+        """
+        Note that the seating changed, and record it.
+
+        """
+        SEAT_CHANGES.inc()
+        self.last_change = time.monotonic()
+        writer.record(self.url, *self.get_seating())
+
+    def restore(self, raw_vals):
+        """
+        Set the seating without registering a change.
+
+        Args:
+            raw_vals (list): [Capacity, Actual, Remaining].
+
+        """
+        seats.reset(self.slot, raw_vals)
+        self.primed = True
+
+    def get_seating(self):
+        """
+        Get the current seating.
+
+        Returns: List of [Capacity, Actual, Remaining].
+
+        """
+        return seats.get(self.slot)
+
+    def remaining_seats(self):
+        """
+        Get the remaining seats of the course, for the interval policy.
+
+        Returns: List holding the number of remaining seats.
+
+        """
+        return [seats.get(self.slot, REMAINING)]
+
+    def fetch_seating(self):
+        """
+        Fetch the seating of the course from its detail page.
+
+        Returns: List of [Capacity, Actual, Remaining].
+
+        """
+        # Get raw data from web page, unless unchanged since the last poll.
+        # Only a primed tracker has seating to fall back on if it is unchanged.
+        response = client.request(self.url, conditional=self.primed)
+        if response.not_modified:
+            return self.get_seating()
+        with PARSE_SECONDS.time(page='detail'):
+            seating = parse_seating(response.body)
+        if seating is None:
+            raise ValueError('No seating table found at {0}'.format(self.url))
+        return [seating.capacity, seating.actual, seating.remaining]
+
+    def get_alert_text(self, before=None, after=None):
         """
         Get the alert text for a change in the number of available seats.
 
+        Args:
+            before (int): Remaining seats before the change; defaults to the previous value.
+            after (int): Remaining seats after the change; defaults to the current value.
+
         Returns: User-friendly alert text describing how the seating has changed.
 
         """
-        diff = self.remaining.get_diff()
+        before = seats.get_previous(self.slot, REMAINING) if before is None else before
+        after = seats.get(self.slot, REMAINING) if after is None else after
+        diff = after - before
         # If no changes, exit.
         if diff == 0:
             return None
@@ -134,105 +313,95 @@ class SeatingTracker(threading.Thread):
             value=abs(diff)
         )
         # Get text describing the current number of available seats.
-        remaining_text = self.get_remaining_text()
+        remaining_text = self.get_remaining_text(after)
         return change_text + remaining_text
 
-    def get_remaining_text(self):
+    def get_remaining_text(self, remaining=None):
         """
         Get text describing the number of remaining seats available.
 
+        Args:
+            remaining (int): Remaining seats; defaults to the current value.
+
         Returns: Description of the remaining seats.
 
         """
-        if self.remaining.cur_val < 0:
+        remaining = seats.get(self.slot, REMAINING) if remaining is None else remaining
+        if remaining < 0:
             remaining_text = OVERRIDE_ALERT.format(
-                seats=self.remaining.cur_val * -1
+                seats=remaining * -1
             )
-        elif self.remaining.cur_val > 0:
+        elif remaining > 0:
             remaining_text = AVAILABLE_ALERT.format(
-                seats=self.remaining.cur_val
+                seats=remaining
             )
         else:
             remaining_text = NO_AVAILABLE_ALERT
         return remaining_text
 
-    def email_alert(self, text):
+    def email_alert(self, text, *subscriptions, kind='change'):
         """
-        Email an alert through a Gmail account.
+        Queue an alert email to subscribers.
 
         Args:
             text (str): The text to be sent.
+            *subscriptions (Recipients): Who to alert; defaults to every subscriber.
+            kind (str): Kind of alert, for metrics.
 
         """
-        # Make an ssl connection to Gmail's SMTP server.
-        server_ssl = smtplib.SMTP_SSL('smtp.gmail.com', 465)
-        server_ssl.ehlo()
-        # Login to email account.
-        server_ssl.login(GMAIL_USERNAME, GMAIL_PASSWORD)
-        # Format the email to be sent.
-        content = EMAIL_TEMPLATE.format(
-            from_field='EKU Course Monitor',
-            subject_field='[Course Monitor] {0} Seating Changes'.format(
-                self.course_name
-            ),
-            body=text
-        )
-        # Send email to each specified person.
-        for email in self.emails:
-            # Send the email.
-            server_ssl.sendmail(
-                GMAIL_USERNAME,
-                email,
-                content.format(to_field=email)
+        subscriptions = subscriptions or self.recipients()
+        for subscription in subscriptions:
+            # Format the email to be sent.
+            content = EMAIL_TEMPLATE.format(
+                from_field='EKU Course Monitor',
+                subject_field='[Course Monitor] {0} Seating Changes'.format(
+                    subscription.course_name
+                ),
+                body=text
             )
-        # Close the server connection.
-        server_ssl.close()
+            # Queue email to each specified person.
+            for email in subscription.emails:
+                mailer.send(email, content.format(to_field=email))
+            ALERTS.inc(len(subscription.emails), kind=kind)
 
-    def initial_alert(self):
+    def initial_alert(self, *subscriptions):
         """
-        Send an initial alert email to the contacts.
-        Works by,
-         - Updating the seating values.
-         - Getting text describing the seats remaining.
-         - Sending the email.
+        Send an initial alert email to new subscribers, describing the seats
+        remaining as of the latest poll.
+
+        Args:
+            *subscriptions (Recipients): The new subscribers.
 
         """
-        self.update_seating()
         text = self.get_remaining_text()
-        self.email_alert(text)
+        self.email_alert(text, *subscriptions, kind='initial')
 
-    def scan(self):
+    def scan(self, raw_vals=None):
         """
-        Check if seating has changed and send alert if so.
+        Check if the remaining seats have changed and hand the change to the
+        alert stage if so.
 
-        Returns: True if seating changed, False if not.
+        Args:
+            raw_vals (list): [Capacity, Actual, Remaining] if already fetched.
 
-        """
-        # Exit if there are no changes.
-        self.update_seating()
-        text = self.get_alert_text()
-        if text is None:
-            return False
-        # Send alert otherwise.
-        self.email_alert(text)
+        Returns: True if the remaining seats changed, False if not.
 
-    def sleep(self, secs):
         """
-        Sleep while checking thread event.
-
-        Args:
-            secs (int): The number of seconds to wait.
+        self.update_seating(raw_vals)
+        return self.alert_change()
 
+    def alert_change(self):
         """
-        while secs > 0 and not self.shut.is_set():
-            time.sleep(1)
-            secs -= 1
+        Hand the change in remaining seats of the latest update to the alert
+        stage, if there was one.
 
-    def run(self):
-        """
-        Main thread execution; scan for updates every update interval.
+        Returns: True if the remaining seats changed, False if not.
 
         """
-        while not self.shut.is_set():
-            self.scan()
-            self.sleep(SeatingTracker.INTERVAL)
+        remaining = self.remaining
+        # Exit if there are no changes.
+        if not remaining.get_diff():
+            return False
+        # Alert otherwise, once coalesced and thresholded.
+        alerts.change(self, remaining.prev_val, remaining.cur_val)
+        return True
@@ -0,0 +1,216 @@
+"""
+Buffered writer recording seat snapshots to the database whenever a course's
+seating changes, and folding them into hourly and daily rollups as they are
+written.
+
+"""
+import threading
+import traceback
+
+from decouple import config
+from django.db import close_old_connections, transaction
+from django.db.models import Case, IntegerField, OuterRef, Subquery, Value, When
+from django.utils import timezone
+
+from ..models import SeatRollup, SeatSnapshot
+from .metrics import Counter
+
+SNAPSHOTS = Counter('monitor_snapshots_total', 'Seat snapshots written.')
+
+
+class SnapshotWriter:
+    """
+    Buffers seat snapshots and writes them with `bulk_create`, either once
+    `BATCH_SIZE` are waiting or every `FLUSH_INTERVAL` seconds.
+
+    Attributes:
+        BATCH_SIZE (int): Buffered snapshots that trigger an early flush.
+        FLUSH_INTERVAL (int): Most seconds a snapshot waits to be written.
+        UPDATE_CHUNK (int): Most existing rollups written by one UPDATE.
+        ROLLUP_FIELDS (tuple): Columns of a rollup changed by new snapshots.
+        buffer (list): Snapshots waiting to be written.
+        last_remaining (dict): Last remaining seats rolled up for each URL.
+        thread (threading.Thread): Flushes the buffer, started on first record.
+
+    """
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = config('MONITOR_SNAPSHOT_FLUSH', default=5, cast=int)
+    UPDATE_CHUNK = 100
+    ROLLUP_FIELDS = ('min_remaining', 'max_remaining', 'last_remaining', 'opened', 'closed')
+
+    def __init__(self):
+        self.buffer = []
+        self.last_remaining = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def record(self, url, capacity, actual, remaining):
+        """
+        Queue a snapshot of a course's seating.
+
+        Args:
+            url (str): URL of the course.
+            capacity (int): The capacity of the course.
+            actual (int): The actual number of seats in the course.
+            remaining (int): The number of remaining seats in the course.
+
+        """
+        snapshot = SeatSnapshot(
+            url=url,
+            timestamp=timezone.now(),
+            capacity=capacity,
+            actual=actual,
+            remaining=remaining
+        )
+        with self.lock:
+            self.buffer.append(snapshot)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            if len(self.buffer) >= SnapshotWriter.BATCH_SIZE:
+                self.wakeup.set()
+
+    def flush(self):
+        """
+        Write every buffered snapshot. If the write fails, the snapshots are
+        put back at the front of the buffer to be written by the next flush.
+
+        """
+        with self.lock:
+            snapshots, self.buffer = self.buffer, []
+        if not snapshots:
+            return
+        try:
+            with transaction.atomic():
+                SeatSnapshot.objects.bulk_create(snapshots)
+                last_remaining = self.roll_up(snapshots)
+        except Exception:
+            # Inserted again from scratch, as the rolled back rows never existed.
+            for snapshot in snapshots:
+                snapshot.pk = None
+            with self.lock:
+                self.buffer[:0] = snapshots
+            raise
+        # Only rollups that were written move on.
+        self.last_remaining.update(last_remaining)
+        SNAPSHOTS.inc(len(snapshots))
+
+    def load_last_remaining(self, urls):
+        """
+        Read the remaining seats last rolled up for URLs not seen yet, from
+        the latest hourly rollup of each, in one query.
+
+        Args:
+            urls (set): URLs of the courses.
+
+        Returns: Dict of the remaining seats, or None if never recorded, of
+            each URL not seen yet.
+
+        """
+        unseen = {url for url in urls if url not in self.last_remaining}
+        if not unseen:
+            return {}
+        latest = SeatRollup.objects.filter(
+            url=OuterRef('url'),
+            granularity=SeatRollup.HOUR
+        ).order_by('-bucket_start').values('pk')[:1]
+        last_remaining = dict.fromkeys(unseen)
+        last_remaining.update(
+            SeatRollup.objects.filter(
+                url__in=unseen,
+                granularity=SeatRollup.HOUR,
+                pk=Subquery(latest)
+            ).values_list('url', 'last_remaining')
+        )
+        return last_remaining
+
+    @staticmethod
+    def update_rollups(rollups):
+        """
+        Write existing rollups with one UPDATE per `UPDATE_CHUNK` of them,
+        setting each column through a CASE on the primary key.
+
+        Args:
+            rollups (list): The rollups.
+
+        """
+        now = timezone.now()
+        for start in range(0, len(rollups), SnapshotWriter.UPDATE_CHUNK):
+            chunk = rollups[start:start + SnapshotWriter.UPDATE_CHUNK]
+            SeatRollup.objects.filter(pk__in=[rollup.pk for rollup in chunk]).update(updated=now, **{
+                field: Case(
+                    *[When(pk=rollup.pk, then=Value(getattr(rollup, field))) for rollup in chunk],
+                    output_field=IntegerField()
+                )
+                for field in SnapshotWriter.ROLLUP_FIELDS
+            })
+
+    def roll_up(self, snapshots):
+        """
+        Fold snapshots into the rollups of the buckets they fall in, creating
+        missing buckets.
+
+        Args:
+            snapshots (list): The snapshots, in the order they were recorded.
+
+        Returns: Dict of the remaining seats last rolled up for each URL of
+            the snapshots, to be kept once the rollups are written.
+
+        """
+        # Load every bucket touched by the snapshots at once.
+        keys = {
+            (snapshot.url, granularity, SeatRollup.bucket(snapshot.timestamp, granularity))
+            for snapshot in snapshots
+            for granularity, _ in SeatRollup.GRANULARITIES
+        }
+        rollups = {
+            (rollup.url, rollup.granularity, rollup.bucket_start): rollup
+            for rollup in SeatRollup.objects.filter(
+                url__in={key[0] for key in keys},
+                bucket_start__in={key[2] for key in keys}
+            )
+        }
+        last_remaining = self.load_last_remaining({key[0] for key in keys})
+        changed = set()
+        for snapshot in snapshots:
+            if snapshot.url in last_remaining:
+                prev_remaining = last_remaining[snapshot.url]
+            else:
+                prev_remaining = self.last_remaining[snapshot.url]
+            for granularity, _ in SeatRollup.GRANULARITIES:
+                key = (snapshot.url, granularity, SeatRollup.bucket(snapshot.timestamp, granularity))
+                if key not in rollups:
+                    rollups[key] = SeatRollup(
+                        url=snapshot.url,
+                        granularity=granularity,
+                        bucket_start=key[2],
+                        min_remaining=snapshot.remaining,
+                        max_remaining=snapshot.remaining,
+                        last_remaining=snapshot.remaining
+                    )
+                rollups[key].add(snapshot.remaining, prev_remaining)
+                changed.add(key)
+            last_remaining[snapshot.url] = snapshot.remaining
+        # Insert new buckets in bulk; update existing ones in batches.
+        SeatRollup.objects.bulk_create([rollups[key] for key in changed if rollups[key].pk is None])
+        self.update_rollups([rollups[key] for key in changed if rollups[key].pk is not None])
+        return last_remaining
+
+    def run(self):
+        """
+        Main thread execution; flush the buffer periodically.
+
+        """
+        while True:
+            self.wakeup.wait(SnapshotWriter.FLUSH_INTERVAL)
+            self.wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+
+# Writer shared by every tracker in the process.
+writer = SnapshotWriter()
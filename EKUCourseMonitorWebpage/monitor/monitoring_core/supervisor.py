@@ -0,0 +1,92 @@
+"""
+Supervisor running several monitor worker processes, each polling its own
+partition of the monitored courses.
+
+"""
+import os.path
+import signal
+import subprocess
+import sys
+import time
+
+# The monitor script run by each worker.
+MONITOR_SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'monitor.py')
+
+
+class Supervisor:
+    """
+    Starts a fixed number of monitor worker processes and restarts any that
+    die. Workers partition courses between themselves through the database.
+
+    Attributes:
+        CHECK_INTERVAL (int): Seconds between checks on the workers.
+        processes (list): The running worker processes, by index.
+        metrics_port (int): Base metrics port; worker N serves on the port N + 1 above it. 0 disables metrics.
+        stopping (bool): Whether the supervisor is shutting down.
+
+    """
+    CHECK_INTERVAL = 5
+
+    def __init__(self, count, metrics_port=0):
+        self.processes = [None] * count
+        self.metrics_port = metrics_port
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.catch)
+        signal.signal(signal.SIGHUP, self.catch)
+
+    @staticmethod
+    def worker_name(index):
+        """
+        Get the stable name of a worker, so a restarted worker resumes its leases.
+
+        Args:
+            index (int): Index of the worker.
+
+        Returns: The worker name.
+
+        """
+        return 'worker-{0}'.format(index)
+
+    def spawn(self, index):
+        """
+        Start a worker process.
+
+        Args:
+            index (int): Index of the worker.
+
+        """
+        name = Supervisor.worker_name(index)
+        metrics_port = self.metrics_port + index + 1 if self.metrics_port else 0
+        self.processes[index] = subprocess.Popen([
+            sys.executable, MONITOR_SCRIPT, '--worker', name, '--metrics-port', str(metrics_port)
+        ])
+        # Logging.
+        print('Started monitor {0}.'.format(name))
+
+    def run(self):
+        """
+        Start every worker and keep them running until terminated.
+
+        """
+        for index in range(len(self.processes)):
+            self.spawn(index)
+        while not self.stopping:
+            time.sleep(Supervisor.CHECK_INTERVAL)
+            for index, process in enumerate(self.processes):
+                if not self.stopping and process.poll() is not None:
+                    print('Monitor {0} exited with {1}.'.format(Supervisor.worker_name(index), process.returncode))
+                    self.spawn(index)
+
+    def catch(self, signum, frame):
+        """
+        Shut down every worker on termination, then exit.
+
+        """
+        self.stopping = True
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.wait()
+        exit()
@@ -2,37 +2,92 @@
 Info regarding course URLs
 
 """
-import urllib.request
-from bs4 import BeautifulSoup
+import urllib.parse
+from decouple import config
+from django.core.cache import cache
 
-BASE_URL = 'https://web4s.eku.edu/prod/bwckschd.p_disp_detail_sched?term_in={year}{semester_code}&crn_in={crn}'
+from .http_client import client
+from .parsing import parse_seating
+
+# Root of the registrar's Banner pages (overridable to point at a local stand-in).
+REGISTRAR_URL = config('REGISTRAR_URL', default='https://web4s.eku.edu/prod/')
+# Detail page of a single section.
+BASE_URL = REGISTRAR_URL + 'bwckschd.p_disp_detail_sched?term_in={term}&crn_in={crn}'
+# Class search results, listing every section of a term.
+LISTING_URL = REGISTRAR_URL + 'bwckschd.p_get_crse_unsec'
+# Seconds validation results are cached for; sections rarely disappear, while
+# sections not found yet may still be added to the schedule.
+VALID_TTL = config('URL_VALID_TTL', default=86400, cast=int)
+INVALID_TTL = config('URL_INVALID_TTL', default=600, cast=int)
+# Cache key of the validation result of a section.
+VALID_KEY = 'course-valid:{term}:{crn}'
+# Search form fields matching every section of a term. Banner expects the
+# 'dummy' entries to precede the real value of each multi-select field.
+LISTING_FIELDS = [
+    ('sel_subj', 'dummy'), ('sel_day', 'dummy'), ('sel_schd', 'dummy'),
+    ('sel_insm', 'dummy'), ('sel_camp', 'dummy'), ('sel_levl', 'dummy'),
+    ('sel_sess', 'dummy'), ('sel_instr', 'dummy'), ('sel_ptrm', 'dummy'),
+    ('sel_attr', 'dummy'), ('sel_subj', '%'), ('sel_crse', ''),
+    ('sel_title', ''), ('sel_schd', '%'), ('sel_from_cred', ''),
+    ('sel_to_cred', ''), ('sel_camp', '%'), ('sel_levl', '%'),
+    ('sel_ptrm', '%'), ('sel_instr', '%'), ('sel_attr', '%'),
+    ('begin_hh', '0'), ('begin_mi', '0'), ('begin_ap', 'a'),
+    ('end_hh', '0'), ('end_mi', '0'), ('end_ap', 'a'),
+]
 
 
 class URL:
     @staticmethod
-    def get_url(year, semester, crn):
+    def get_term(year, semester):
         """
-        Get a URL given course information.
+        Get the Banner term code for a semester.
 
         Args:
             year (int): Year of the course.
             semester (str): Semester constant.
-            crn (int): Course registration number.
 
-        Returns: The course seating information URL.
+        Returns: The term code, e.g. '201920'.
 
         """
         from ..models import Course
         if semester == Course.FALL or semester == Course.WINTER:
             year += 1
         semester_code = Course.SEMESTER_CODES[semester]
+        return '{0}{1}'.format(year, semester_code)
+
+    @staticmethod
+    def get_url(year, semester, crn):
+        """
+        Get a URL given course information.
+
+        Args:
+            year (int): Year of the course.
+            semester (str): Semester constant.
+            crn (int): Course registration number.
+
+        Returns: The course seating information URL.
+
+        """
         url = BASE_URL.format(
-            year=year,
-            semester_code=semester_code,
+            term=URL.get_term(year, semester),
             crn=crn
         )
         return url
 
+    @staticmethod
+    def get_listing_data(term):
+        """
+        Get the encoded search form listing every section of a term.
+
+        Args:
+            term (str): Banner term code.
+
+        Returns: The form data to POST to the listing URL.
+
+        """
+        fields = [('term_in', term)] + LISTING_FIELDS
+        return urllib.parse.urlencode(fields).encode('ascii')
+
     @staticmethod
     def validate_url(url):
         """
@@ -45,15 +100,64 @@ class URL:
 
         """
         # Get raw data from web page.
-        raw = urllib.request.urlopen(url).read()
-        # Parse HTML.
-        parsed = BeautifulSoup(raw, features='html.parser')
-        # Get the table associated with seating.
-        seating_table = parsed.body.find('table', attrs={
-            'class': 'datadisplaytable',
-            'summary': 'This layout table is used to present the seating numbers.'
-        })
-        # If nothing found, URL is invalid.
-        if seating_table is None:
-            return False
-        return True
+        raw = client.request(url).body
+        # If no seating table found, URL is invalid.
+        return parse_seating(raw) is not None
+
+    @staticmethod
+    def is_valid_course(year, semester, crn):
+        """
+        Check that a course exists. Sections in the term's catalog are valid
+        straight away; others use the cached result if there is one, and are
+        fetched otherwise.
+
+        Args:
+            year (int): Year of the course.
+            semester (str): Semester constant.
+            crn (int): Course registration number.
+
+        Returns: True if valid, False if not.
+
+        """
+        valid = URL.known_course(year, semester, crn)
+        if valid is None:
+            valid = URL.validate_url(URL.get_url(year, semester, crn))
+            URL.remember_courses(URL.get_term(year, semester), [crn], valid)
+        return valid
+
+    @staticmethod
+    def known_course(year, semester, crn):
+        """
+        Check whether a course is known to exist without fetching it: sections
+        in the term's catalog are valid, and others use the cached result.
+
+        Args:
+            year (int): Year of the course.
+            semester (str): Semester constant.
+            crn (int): Course registration number.
+
+        Returns: True if valid, False if not, or None if unknown.
+
+        """
+        from ..models import CatalogSection
+        term = URL.get_term(year, semester)
+        if CatalogSection.is_listed(term, crn):
+            return True
+        return cache.get(VALID_KEY.format(term=term, crn=crn))
+
+    @staticmethod
+    def remember_courses(term, crns, valid=True):
+        """
+        Cache the validation result of sections, e.g. ones the monitor has
+        fetched seating for.
+
+        Args:
+            term (str): Banner term code.
+            crns (list): Course registration numbers of the sections.
+            valid (bool): Whether the sections exist.
+
+        """
+        cache.set_many(
+            {VALID_KEY.format(term=term, crn=crn): valid for crn in crns},
+            VALID_TTL if valid else INVALID_TTL
+        )
@@ -0,0 +1,115 @@
+"""
+Background validation of signups. Signups for sections not known yet are
+saved as pending courses without waiting on the registrar; the monitor checks
+that each section exists, a few at a time, then lets it be monitored or tells
+its subscribers it was rejected.
+
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+from django.db import close_old_connections
+
+from ..models import Course
+from .events import notify_course_change
+from .metrics import Counter
+from .resilience import CircuitOpenError, backoff_delay
+from .url import URL
+
+VALIDATIONS = Counter('monitor_signup_validations_total', 'Pending courses checked, by outcome.', ['result'])
+
+
+class SignupValidator:
+    """
+    Checks pending courses on a pool of worker threads, leaving the monitor
+    free to keep scanning. Courses whose check fails, e.g. because the
+    registrar is down, stay pending and are retried with backoff.
+
+    Attributes:
+        CONCURRENCY (int): Most courses checked at once.
+        RETRY_BASE (int): Seconds before retrying a failed check; doubled
+            for each failure after, up to `RETRY_MAX`.
+        RETRY_MAX (int): Most seconds between retries.
+        in_flight (set): PKs of the courses being checked.
+        retries (dict): (failed attempts, monotonic time of next attempt) of
+            courses that could not be checked, keyed by PK.
+
+    """
+    CONCURRENCY = config('MONITOR_VALIDATION_CONCURRENCY', default=4, cast=int)
+    RETRY_BASE = 10
+    RETRY_MAX = 600
+
+    def __init__(self, concurrency=None):
+        self.executor = ThreadPoolExecutor(max_workers=concurrency or SignupValidator.CONCURRENCY)
+        self.in_flight = set()
+        self.retries = {}
+        self.lock = threading.Lock()
+
+    def submit(self, courses):
+        """
+        Queue pending courses to be checked, skipping any being checked or
+        backing off.
+
+        Args:
+            courses (list): The pending courses.
+
+        Returns: Number of courses queued.
+
+        """
+        now = time.monotonic()
+        queued = 0
+        with self.lock:
+            for course in courses:
+                if course.pk in self.in_flight or self.retries.get(course.pk, (0, 0))[1] > now:
+                    continue
+                self.in_flight.add(course.pk)
+                self.executor.submit(self.validate, course)
+                queued += 1
+        return queued
+
+    def validate(self, course):
+        """
+        Check that the section of a pending course exists, then mark it valid
+        and tell the monitor, or reject it.
+
+        Args:
+            course (Course): The pending course.
+
+        """
+        try:
+            close_old_connections()
+            valid = URL.is_valid_course(course.year, course.semester, course.crn)
+            if valid:
+                # Only pending courses are changed; a signup may have settled it already.
+                if Course.objects.filter(pk=course.pk, status=Course.PENDING).update(status=Course.VALID):
+                    notify_course_change(course.pk)
+                print('Signup for {0} validated.'.format(course))
+            else:
+                course.reject()
+                print('Signup for {0} rejected.'.format(course))
+            VALIDATIONS.inc(result='valid' if valid else 'rejected')
+            with self.lock:
+                self.retries.pop(course.pk, None)
+        except Exception as e:
+            # Registrar troubles are expected; anything else is logged in full.
+            if not isinstance(e, (CircuitOpenError, OSError)):
+                traceback.print_exc()
+            VALIDATIONS.inc(result='error')
+            with self.lock:
+                attempts = self.retries.get(course.pk, (0, 0))[0] + 1
+                delay = backoff_delay(attempts, SignupValidator.RETRY_BASE, SignupValidator.RETRY_MAX)
+                self.retries[course.pk] = (attempts, time.monotonic() + delay)
+            print('Retrying validation of {0} in {1:.0f}s.'.format(course, delay))
+        finally:
+            with self.lock:
+                self.in_flight.discard(course.pk)
+
+    def shutdown(self):
+        """
+        Stop checking courses, waiting for checks in progress to finish.
+
+        """
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Course, Subscriber, Subscription
+from .monitoring_core.events import notify_course_change
+from .monitoring_core.recipients import recipients
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    """
+    Tell the monitor about a course change once it is committed.
+
+    """
+    transaction.on_commit(lambda: notify_course_change(instance.pk))
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    """
+    Tell the monitor to look up the recipients of a course again once a
+    change to its subscriptions is committed.
+
+    """
+    course_id = instance.course_id
+    recipients.invalidate(course_id)
+    transaction.on_commit(lambda: notify_course_change(course_id))
+
+
+@receiver(post_save, sender=Subscriber)
+def subscriber_changed(sender, instance, created, **kwargs):
+    """
+    Tell the monitor to look up the recipients of a subscriber's courses
+    again once a change to their address is committed.
+
+    """
+    if created:
+        return
+    course_ids = list(instance.subscriptions.values_list('course_id', flat=True))
+    recipients.invalidate(*course_ids)
+
+    def notify():
+        for course_id in course_ids:
+            notify_course_change(course_id)
+
+    transaction.on_commit(notify)
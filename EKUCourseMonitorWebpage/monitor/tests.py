@@ -1,3 +1,1572 @@
-from django.test import TestCase
+import datetime
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from monitor.benchmarks import reference
+from monitor.benchmarks.pages import render_detail, render_invalid, render_listing, saved_pages
+from monitor.benchmarks.registrar import FakeRegistrar
+from monitor.benchmarks.smtp import SmtpSink
+from monitor.models import CatalogSection, Course, MonitorWorker, SeatRollup, SeatSnapshot, Subscriber, Subscription
+from monitor.monitoring_core import batch, parsing
+from monitor.monitoring_core.alerts import AlertAggregator, alerts
+from monitor.monitoring_core.batch import TermBatch
+from monitor.monitoring_core.http_client import HTTPClient
+from monitor.monitoring_core.mailer import Mailer
+from monitor.monitoring_core.monitor import Monitor
+from monitor.monitoring_core.policy import AdaptiveIntervalPolicy, FixedIntervalPolicy, IntervalPolicy, get_policy
+from monitor.monitoring_core.recipients import Recipients
+from monitor.monitoring_core.resilience import CircuitBreaker, CircuitOpenError, TokenBucket
+from monitor.monitoring_core.ring import HashRing
+from monitor.monitoring_core.scheduler import PollScheduler
+from monitor.monitoring_core.seat_table import SeatTable, seats
+from monitor.monitoring_core.seat_tracker import SeatingTracker
+from monitor.monitoring_core.snapshots import SnapshotWriter, writer
+from monitor.monitoring_core.url import URL
+from monitor.monitoring_core.validation import SignupValidator
+from monitor.views import AUTOCOMPLETE_LIMIT, CSRF_PLACEHOLDER, page_cache
+
+
+class ParserTests(SimpleTestCase):
+    """
+    Checks the streaming seating parser against the original BeautifulSoup
+    extraction it replaced.
+
+    """
+
+    def assert_detail_matches(self, raw):
+        """
+        Assert both parsers read the same seats from a detail page.
+
+        Args:
+            raw (bytes): HTML of the detail page.
+
+        """
+        seating = parsing.parse_seating(raw)
+        # The reference parser does not read waitlists.
+        self.assertEqual(seating and tuple(seating[:3]), reference.parse_seating(raw))
+
+    def test_saved_pages_match_reference(self):
+        for name, raw in saved_pages().items():
+            with self.subTest(page=name):
+                if name.startswith('listing'):
+                    self.assertEqual(parsing.parse_listing(raw), reference.parse_listing(raw))
+                else:
+                    self.assert_detail_matches(raw)
+
+    def test_generated_details_match_reference(self):
+        for seats in [(30, 0, 30), (30, 30, 0), (30, 32, -2), (250, 117, 133)]:
+            for waitlist in (None, (10, 3, 7)):
+                with self.subTest(seats=seats, waitlist=waitlist):
+                    self.assert_detail_matches(render_detail(12345, *seats, waitlist=waitlist))
+
+    def test_generated_listing_matches_reference(self):
+        sections = [
+            {
+                'crn': 10000 + index, 'subject': 'ENG', 'number': str(100 + index), 'section': '001',
+                'title': 'Section {0}'.format(index), 'capacity': 30, 'actual': index, 'remaining': 30 - index
+            }
+            for index in range(40)
+        ]
+        raw = render_listing(sections)
+        seating = parsing.parse_listing(raw)
+        self.assertEqual(len(seating), 40)
+        self.assertEqual(seating, reference.parse_listing(raw))
+
+    def test_invalid_page_has_no_seating(self):
+        raw = render_invalid()
+        self.assertIsNone(parsing.parse_seating(raw))
+        self.assertIsNone(reference.parse_seating(raw))
+
+    def test_waitlist(self):
+        seating = parsing.parse_seating(render_detail(12345, 30, 30, 0, waitlist=(10, 3, 7)))
+        self.assertEqual(tuple(seating[:3]), (30, 30, 0))
+        self.assertEqual(tuple(seating.waitlist), (10, 3, 7))
+        self.assertIsNone(parsing.parse_seating(render_detail(12345, 30, 30, 0)).waitlist)
+
+
+class ScriptedRegistrar(FakeRegistrar):
+    """
+    Registrar stand-in failing requests with a scripted series of statuses.
+
+    Attributes:
+        statuses (list): Status of each coming request; None serves the
+            request, and requests past the end are served.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statuses = []
+
+    def inject(self, handler):
+        if not super().inject(handler):
+            return False
+        with self.lock:
+            status = self.statuses.pop(0) if self.statuses else None
+        if status is not None:
+            handler.send_error(status)
+            return False
+        return True
+
+
+@mock.patch.multiple(
+    HTTPClient, RETRIES=3, RETRY_BASE=0.01, RETRY_MAX=0.05, RATE=1000.0, BURST=1000,
+    BREAKER_THRESHOLD=3, BREAKER_RESET=0.3
+)
+@mock.patch('builtins.print')
+class ResilienceTests(SimpleTestCase):
+    """
+    Exercises rate limiting, retries and the circuit breaker of the HTTP
+    client against a local registrar stand-in.
+
+    """
+
+    def setUp(self):
+        self.registrar = ScriptedRegistrar().start()
+        self.addCleanup(self.registrar.server_close)
+        self.addCleanup(self.registrar.shutdown)
+        self.registrar.set_seating(12345, 30, 20, 10)
+        self.url = self.registrar.url + 'bwckschd.p_disp_detail_sched?term_in=201920&crn_in=12345'
+        self.client = HTTPClient(timeout=5)
+
+    def breaker(self):
+        """
+        Get the circuit breaker of the stand-in.
+
+        """
+        return self.client.get_guards(('http', '{0}:{1}'.format(*self.registrar.server_address)))[1]
+
+    def test_server_errors_are_retried(self, _):
+        for status in (503, 429):
+            with self.subTest(status=status):
+                self.registrar.requests = 0
+                self.registrar.statuses = [status, status]
+                response = self.client.request(self.url)
+                self.assertEqual(tuple(parsing.parse_seating(response.body)[:3]), (30, 20, 10))
+                self.assertEqual(self.registrar.requests, 3)
+
+    def test_retries_give_up(self, _):
+        self.registrar.statuses = [503] * (HTTPClient.RETRIES + 1)
+        # A circuit left closed, so only the retries stop the request.
+        with mock.patch.object(HTTPClient, 'BREAKER_THRESHOLD', HTTPClient.RETRIES + 2):
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                HTTPClient(timeout=5).request(self.url)
+        self.assertEqual(raised.exception.code, 503)
+        self.assertEqual(self.registrar.requests, HTTPClient.RETRIES + 1)
+
+    def test_client_errors_are_not_failures(self, _):
+        self.registrar.statuses = [404] * (HTTPClient.BREAKER_THRESHOLD + 1)
+        for _ in range(HTTPClient.BREAKER_THRESHOLD + 1):
+            with self.assertRaises(urllib.error.HTTPError):
+                self.client.request(self.url)
+        # Neither retried nor counted against the host.
+        self.assertEqual(self.registrar.requests, HTTPClient.BREAKER_THRESHOLD + 1)
+        self.assertEqual(self.breaker().failures, 0)
+        self.assertIsNone(self.breaker().opened)
+
+    def test_circuit_opens_and_probes(self, _):
+        self.registrar.statuses = [503] * HTTPClient.BREAKER_THRESHOLD
+        with self.assertRaises(urllib.error.HTTPError):
+            self.client.request(self.url)
+        # The circuit opened before the retries ran out.
+        self.assertEqual(self.registrar.requests, HTTPClient.BREAKER_THRESHOLD)
+        with self.assertRaises(CircuitOpenError):
+            self.client.request(self.url)
+        self.assertEqual(self.registrar.requests, HTTPClient.BREAKER_THRESHOLD)
+        time.sleep(HTTPClient.BREAKER_RESET)
+        breaker = self.breaker()
+        # A single probe is let through once the reset timeout passes.
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.probing = False
+        # The probe succeeds, closing the circuit.
+        self.client.request(self.url)
+        self.assertEqual(self.registrar.requests, HTTPClient.BREAKER_THRESHOLD + 1)
+        self.assertIsNone(breaker.opened)
+        self.client.request(self.url)
+
+    def test_failed_probe_reopens_circuit(self, _):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0.1)
+        self.assertTrue(breaker.record_failure())
+        self.assertFalse(breaker.allow())
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.record_failure())
+        self.assertFalse(breaker.allow())
+
+    def test_rate_limit(self, _):
+        bucket = TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        # Two tokens beyond the burst, at 20 per second.
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        with mock.patch.multiple(HTTPClient, RATE=10.0, BURST=1):
+            client = HTTPClient(timeout=5)
+            start = time.monotonic()
+            for _ in range(3):
+                client.request(self.url)
+            self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+
+@mock.patch('builtins.print')
+class TermBatchTests(TestCase):
+    """
+    Polls a term's trackers from the listing of a local registrar stand-in.
+
+    """
+    TERM = '201920'
+
+    def setUp(self):
+        self.registrar = ScriptedRegistrar().start()
+        self.addCleanup(self.registrar.server_close)
+        self.addCleanup(self.registrar.shutdown)
+        for patcher in (
+            mock.patch.object(batch, 'LISTING_URL', self.registrar.url + 'bwckschd.p_get_crse_unsec'),
+            mock.patch.object(writer, 'record'),
+            mock.patch.object(alerts, 'change')
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.batch = TermBatch(TermBatchTests.TERM)
+
+    def add_tracker(self, crn, seating=None):
+        """
+        Add a tracker of a section to the batch.
+
+        Args:
+            crn (int): CRN of the section.
+            seating (list): [Capacity, Actual, Remaining] the tracker starts
+                from; it starts without seating if None.
+
+        Returns: The tracker.
+
+        """
+        url = self.registrar.url + 'bwckschd.p_disp_detail_sched?term_in={0}&crn_in={1}'.format(
+            TermBatchTests.TERM, crn
+        )
+        tracker = SeatingTracker(url, TermBatchTests.TERM, crn, lazy=True)
+        if seating is not None:
+            tracker.restore(seating)
+        self.batch.add(tracker)
+        return tracker
+
+    def test_listing_updates_every_tracker(self, _):
+        trackers = [self.add_tracker(crn, [30, 20, 10]) for crn in (10001, 10002, 10003)]
+        self.registrar.set_seating(10001, 30, 20, 10)
+        self.registrar.set_seating(10002, 30, 21, 9)
+        self.registrar.set_seating(10003, 30, 18, 12)
+        self.batch.scan()
+        self.assertEqual(self.registrar.requests, 1)
+        self.assertEqual([tracker.get_seating() for tracker in trackers], [[30, 20, 10], [30, 21, 9], [30, 18, 12]])
+        # Only the sections that changed are alerted.
+        self.assertEqual(alerts.change.call_args_list, [
+            mock.call(trackers[1], 10, 9),
+            mock.call(trackers[2], 10, 12)
+        ])
+
+    def test_listing_primes_new_trackers(self, _):
+        tracker = self.add_tracker(10001)
+        self.registrar.set_seating(10001, 30, 20, 10)
+        self.batch.scan()
+        self.assertEqual(self.registrar.requests, 1)
+        self.assertTrue(tracker.primed)
+        self.assertEqual(tracker.get_seating(), [30, 20, 10])
+        alerts.change.assert_not_called()
+
+    def test_unlisted_section_falls_back_to_detail_page(self, _):
+        listed = self.add_tracker(10001, [30, 20, 10])
+        unlisted = self.add_tracker(10002, [30, 20, 10])
+        self.registrar.set_seating(10001, 30, 20, 10)
+        self.registrar.set_seating(10002, 30, 25, 5)
+        self.registrar.unlisted.add(10002)
+        self.batch.scan()
+        # The listing, then the detail page of the unlisted section.
+        self.assertEqual(self.registrar.requests, 2)
+        self.assertEqual(listed.get_seating(), [30, 20, 10])
+        self.assertEqual(unlisted.get_seating(), [30, 25, 5])
+        alerts.change.assert_called_once_with(unlisted, 10, 5)
+
+    def test_failed_listing_falls_back_to_detail_pages(self, _):
+        trackers = [self.add_tracker(crn, [30, 20, 10]) for crn in (10001, 10002)]
+        self.registrar.set_seating(10001, 30, 21, 9)
+        self.registrar.set_seating(10002, 30, 22, 8)
+        self.registrar.statuses = [404]
+        self.batch.scan()
+        self.assertEqual(self.registrar.requests, 3)
+        self.assertEqual([tracker.get_seating() for tracker in trackers], [[30, 21, 9], [30, 22, 8]])
+        self.assertEqual(alerts.change.call_count, 2)
+
+
+class PollLogRegistrar(FakeRegistrar):
+    """
+    Registrar stand-in logging when each section's detail page is requested,
+    and how many requests it serves at once.
+
+    Attributes:
+        polls (list): (CRN, monotonic time) of each detail page request.
+        active (int): Requests being served right now.
+        peak (int): Most requests served at once.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.polls = []
+        self.active = 0
+        self.peak = 0
+
+    def inject(self, handler):
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(handler.path).query)
+        with self.lock:
+            self.polls.append((int(query['crn_in'][0]), time.monotonic()))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().inject(handler)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def poll_times(self, crn):
+        """
+        Get when a section's detail page was requested.
+
+        """
+        with self.lock:
+            return [when for polled, when in self.polls if polled == crn]
+
+
+@mock.patch.multiple(HTTPClient, RATE=1000.0, BURST=1000)
+@mock.patch('builtins.print')
+class PollSchedulerTests(SimpleTestCase):
+    """
+    Polls trackers of a local registrar stand-in from the scheduler.
+
+    """
+    TERM = '201920'
+    INTERVAL = 1.0
+
+    def setUp(self):
+        self.registrar = PollLogRegistrar().start()
+        self.addCleanup(self.registrar.server_close)
+        self.addCleanup(self.registrar.shutdown)
+        for patcher in (
+            mock.patch.object(SeatingTracker, 'INTERVAL', PollSchedulerTests.INTERVAL),
+            mock.patch.object(writer, 'record'),
+            mock.patch.object(alerts, 'change')
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def start_scheduler(self, max_concurrent, policy=None):
+        """
+        Start a scheduler, stopped again at the end of the test.
+
+        Args:
+            max_concurrent (int): Cap on the number of polls in flight.
+            policy (IntervalPolicy): Interval policy; fixed intervals if None.
+
+        Returns: The scheduler.
+
+        """
+        scheduler = PollScheduler(max_concurrent=max_concurrent, policy=policy or FixedIntervalPolicy())
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        return scheduler
+
+    def tracker(self, crn, seating=(30, 20, 10)):
+        """
+        Create a tracker of a section served by the stand-in.
+
+        Args:
+            crn (int): CRN of the section.
+            seating (tuple): (capacity, actual, remaining) of the section.
+
+        Returns: The tracker.
+
+        """
+        self.registrar.set_seating(crn, *seating)
+        url = self.registrar.url + 'bwckschd.p_disp_detail_sched?term_in={0}&crn_in={1}'.format(
+            PollSchedulerTests.TERM, crn
+        )
+        tracker = SeatingTracker(url, PollSchedulerTests.TERM, crn, lazy=True)
+        tracker.restore(list(seating))
+        self.addCleanup(tracker.close)
+        return tracker
+
+    def wait_for_polls(self, count, timeout=5):
+        """
+        Wait until the stand-in has been polled a number of times.
+
+        """
+        deadline = time.monotonic() + timeout
+        while len(self.registrar.polls) < count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertGreaterEqual(len(self.registrar.polls), count)
+
+    def test_phases_are_spread(self, _):
+        phases = [PollScheduler.phase('course-{0}'.format(i)) for i in range(1000)]
+        self.assertTrue(all(0 <= phase < 1 for phase in phases))
+        # About a tenth of the keys in each tenth of the interval.
+        for tenth in range(10):
+            count = sum(1 for phase in phases if tenth / 10 <= phase < (tenth + 1) / 10)
+            self.assertTrue(60 <= count <= 140, count)
+
+    def test_polls_follow_their_phase(self, _):
+        scheduler = self.start_scheduler(max_concurrent=10)
+        trackers = [self.tracker(crn) for crn in range(10001, 10009)]
+        start = time.monotonic()
+        for tracker in trackers:
+            scheduler.add(tracker)
+        time.sleep(2.2 * PollSchedulerTests.INTERVAL)
+        for tracker in trackers:
+            polls = self.registrar.poll_times(tracker.crn)
+            self.assertGreaterEqual(len(polls), 2)
+            # First polled at its phase offset, then every interval after it.
+            offset = PollScheduler.phase(tracker.key) * PollSchedulerTests.INTERVAL
+            self.assertAlmostEqual(polls[0] - start, offset, delta=0.15)
+            self.assertAlmostEqual(polls[1] - polls[0], PollSchedulerTests.INTERVAL, delta=0.15)
+
+    def test_concurrency_is_capped(self, _):
+        self.registrar.latency = 0.2
+        scheduler = self.start_scheduler(max_concurrent=3)
+        for crn in range(10001, 10013):
+            scheduler.add(self.tracker(crn), delay=0)
+        self.wait_for_polls(12)
+        # All due at once, but never more than three polls run together.
+        self.assertEqual(self.registrar.peak, 3)
+
+    def test_removed_tracker_is_not_polled(self, _):
+        scheduler = self.start_scheduler(max_concurrent=10)
+        kept, removed = self.tracker(10001), self.tracker(10002)
+        scheduler.add(kept, delay=0)
+        scheduler.add(removed, delay=0)
+        self.wait_for_polls(2)
+        scheduler.remove(removed)
+        time.sleep(2.5 * PollSchedulerTests.INTERVAL)
+        self.assertEqual(len(self.registrar.poll_times(removed.crn)), 1)
+        self.assertGreaterEqual(len(self.registrar.poll_times(kept.crn)), 3)
+        self.assertEqual(scheduler.status(removed.key), (None, None))
+
+    def test_adaptive_intervals(self, _):
+        patcher = mock.patch.multiple(AdaptiveIntervalPolicy, MIN_INTERVAL=0.25, MAX_INTERVAL=60, RUSH_PERIODS=[])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        scheduler = self.start_scheduler(max_concurrent=10, policy=AdaptiveIntervalPolicy())
+        hot, static = self.tracker(10001, (30, 28, 2)), self.tracker(10002)
+        scheduler.add(hot, delay=0)
+        scheduler.add(static, delay=0)
+        time.sleep(1.6 * PollSchedulerTests.INTERVAL)
+        # The nearly full section is polled every MIN_INTERVAL; the other backs off.
+        self.assertEqual(hot.interval, 0.25)
+        self.assertGreaterEqual(len(self.registrar.poll_times(hot.crn)), 5)
+        self.assertEqual(static.interval, 2 * PollSchedulerTests.INTERVAL)
+        self.assertEqual(len(self.registrar.poll_times(static.crn)), 1)
+
+
+class IntervalPolicyTests(SimpleTestCase):
+    """
+    Creates interval policies by name or dotted path.
+
+    """
+
+    def test_get_policy(self):
+        self.assertIsInstance(get_policy('fixed'), FixedIntervalPolicy)
+        self.assertIsInstance(get_policy('adaptive'), AdaptiveIntervalPolicy)
+        self.assertIsInstance(
+            get_policy('monitor.monitoring_core.policy.FixedIntervalPolicy'), FixedIntervalPolicy
+        )
+
+    def test_policies_must_pick_intervals(self):
+        class Incomplete(IntervalPolicy):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+        with self.assertRaises(TypeError):
+            IntervalPolicy()
+
+
+class AdaptiveIntervalPolicyTests(SimpleTestCase):
+    """
+    Picks poll intervals from how volatile each job is, within the budget.
+
+    """
+
+    def setUp(self):
+        patcher = mock.patch.multiple(
+            AdaptiveIntervalPolicy, MIN_INTERVAL=60, MAX_INTERVAL=3600, RUSH_MAX_INTERVAL=120, BUDGET=300,
+            RUSH_PERIODS=[]
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.policy = AdaptiveIntervalPolicy()
+
+    @staticmethod
+    def job(key, interval=500, remaining=10, changed=None):
+        """
+        Create a stand-in job.
+
+        Args:
+            key (str): Key of the job.
+            interval (float): Current interval of the job.
+            remaining (int): Remaining seats of the job.
+            changed (float): Seconds since its seating last changed, or None
+                if it never did.
+
+        Returns: The job.
+
+        """
+        job = mock.Mock(key=key, interval=interval)
+        job.last_change = None if changed is None else time.monotonic() - changed
+        job.remaining_seats.return_value = [remaining]
+        return job
+
+    def test_hot_jobs_are_polled_often(self):
+        self.assertEqual(self.policy.next_interval(self.job('changed', changed=60)), 60)
+        self.assertEqual(self.policy.next_interval(self.job('near-zero', remaining=2)), 60)
+        # Neither a change long ago nor a full section is hot.
+        self.assertEqual(self.policy.next_interval(self.job('old', changed=7200)), 1000)
+        self.assertEqual(self.policy.next_interval(self.job('full', remaining=0)), 1000)
+
+    def test_static_jobs_back_off(self):
+        job = self.job('static', interval=60)
+        intervals = []
+        for _ in range(8):
+            job.interval = self.policy.next_interval(job)
+            intervals.append(job.interval)
+        self.assertEqual(intervals, [120, 240, 480, 960, 1920, 3600, 3600, 3600])
+        # A change makes it hot again.
+        job.last_change = time.monotonic()
+        self.assertEqual(self.policy.next_interval(job), 60)
+
+    def test_rush_caps_interval(self):
+        today = datetime.date.today()
+        with mock.patch.object(AdaptiveIntervalPolicy, 'RUSH_PERIODS', [(today, today)]):
+            self.assertEqual(self.policy.next_interval(self.job('static', interval=3600)), 120)
+
+    def test_budget_stretches_intervals(self):
+        # 300 requests a minute allow 300 hot jobs every minute.
+        jobs = [self.job('hot-{0}'.format(i), remaining=1) for i in range(300)]
+        self.assertEqual({self.policy.next_interval(job) for job in jobs}, {60})
+        self.assertAlmostEqual(self.policy.total_rate, 300)
+        # Beyond that, new jobs wait the longest interval.
+        self.assertEqual(self.policy.next_interval(self.job('late', remaining=1)), 3600)
+        # Until a job is dropped, freeing its share.
+        self.policy.forget('hot-0')
+        self.policy.forget('late')
+        self.assertAlmostEqual(self.policy.total_rate, 299)
+        self.assertEqual(self.policy.next_interval(self.job('late', remaining=1)), 60)
+
+    def test_stretch_spreads_remaining_budget(self):
+        self.policy.total_rate = 299.5
+        # Half a request a minute left, so no more often than every two minutes.
+        self.assertEqual(self.policy.next_interval(self.job('hot', remaining=1)), 120)
+
+
+@mock.patch('traceback.print_exc')
+class MailerTests(SimpleTestCase):
+    """
+    Delivers queued emails to a local SMTP sink.
+
+    """
+
+    def setUp(self):
+        self.sink = SmtpSink().start()
+        self.addCleanup(self.sink.server_close)
+        self.addCleanup(self.sink.shutdown)
+        patcher = mock.patch.multiple(
+            'monitor.monitoring_core.mailer', SMTP_HOST='127.0.0.1', SMTP_PORT=self.sink.server_address[1], SMTP_SSL=False
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mailer = Mailer()
+        self.addCleanup(self.mailer.close)
+
+    def send(self, count):
+        """
+        Queue alerts to distinct addresses.
+
+        Args:
+            count (int): Number of alerts.
+
+        """
+        for index in range(count):
+            self.mailer.send(
+                'student{0}@eku.edu'.format(index),
+                'Subject: [Course Monitor] ENG 101 Seating Changes\n\nThere are {0} seats available.'.format(index)
+            )
+
+    def test_batch_shares_one_connection(self, _):
+        self.send(10)
+        self.assertTrue(self.mailer.flush(5))
+        self.assertEqual(self.sink.messages, 10)
+        self.assertEqual(self.sink.connections, 1)
+
+    @mock.patch.object(Mailer, 'MIN_BACKOFF', 0)
+    def test_reconnects_after_dropped_connection(self, *_):
+        self.sink.drop_after = 3
+        self.send(6)
+        self.assertTrue(self.mailer.flush(5))
+        # Every message arrives once, the one cut off over a new connection.
+        self.assertEqual(self.sink.messages, 6)
+        self.assertEqual(self.sink.connections, 2)
+
+
+class SnapshotWriterTests(TestCase):
+    """
+    Writes buffered snapshots and folds them into rollups.
+
+    """
+
+    def setUp(self):
+        self.writer = SnapshotWriter()
+        self.start = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0)
+
+    def buffer(self, url, remaining, minutes=0):
+        """
+        Buffer a snapshot without starting the writer's thread.
+
+        Args:
+            url (str): URL of the course.
+            remaining (int): Remaining seats.
+            minutes (int): Minutes into the hour the snapshot was taken.
+
+        """
+        self.writer.buffer.append(SeatSnapshot(
+            url=url,
+            timestamp=self.start + datetime.timedelta(minutes=minutes),
+            capacity=30,
+            actual=30 - remaining,
+            remaining=remaining
+        ))
+
+    def rollup(self, url, granularity=SeatRollup.HOUR):
+        """
+        Get the rolled up values of a course's bucket.
+
+        Returns: Tuple of (granularity, min, max, last, opened, closed).
+
+        """
+        rollup = SeatRollup.objects.get(url=url, granularity=granularity)
+        return (
+            rollup.granularity, rollup.min_remaining, rollup.max_remaining,
+            rollup.last_remaining, rollup.opened, rollup.closed
+        )
+
+    def test_failed_write_is_kept(self):
+        self.buffer('a', 0)
+        self.writer.flush()
+        self.buffer('a', 2, minutes=1)
+        with mock.patch.object(SnapshotWriter, 'update_rollups', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.writer.flush()
+        # Nothing was written, the snapshot waits for the next flush, and the
+        # change it brings is not counted yet.
+        self.assertEqual(SeatSnapshot.objects.count(), 1)
+        self.assertEqual(len(self.writer.buffer), 1)
+        self.assertEqual(self.writer.last_remaining['a'], 0)
+        self.writer.flush()
+        self.assertEqual(SeatSnapshot.objects.count(), 2)
+        self.assertEqual(self.writer.buffer, [])
+        self.assertEqual(self.rollup('a'), ('hour', 0, 2, 2, 1, 0))
+
+    def test_roll_up_queries_do_not_grow_with_urls(self):
+        # Existing rollups, flushed by an earlier run of the monitor.
+        self.buffer('a', 0)
+        self.buffer('b', 5)
+        for index in range(40):
+            self.buffer('seeded{0}'.format(index), index)
+        self.writer.flush()
+        self.writer = SnapshotWriter()
+        for minutes, (url, remaining) in enumerate([('a', 2), ('b', 0), ('c', 3), ('a', 0), ('c', 0), ('e', 0), ('e', 2)], 1):
+            self.buffer(url, remaining, minutes)
+        for index in range(40):
+            self.buffer('seeded{0}'.format(index), index + 1, minutes=10)
+            self.buffer('new{0}'.format(index), index, minutes=10)
+        # Savepoint, snapshots, rollups, last remaining seats, new rollups,
+        # updated rollups and release, for any number of URLs.
+        with self.assertNumQueries(7):
+            self.writer.flush()
+        self.assertEqual(self.rollup('a'), ('hour', 0, 2, 0, 1, 1))
+        self.assertEqual(self.rollup('b'), ('hour', 0, 5, 0, 0, 1))
+        self.assertEqual(self.rollup('c'), ('hour', 0, 3, 0, 0, 1))
+        self.assertEqual(self.rollup('e'), ('hour', 0, 2, 2, 1, 0))
+        self.assertEqual(self.rollup('e', SeatRollup.DAY), ('day', 0, 2, 2, 1, 0))
+        self.assertEqual(self.rollup('seeded0'), ('hour', 0, 1, 1, 1, 0))
+        self.assertEqual(self.rollup('seeded5'), ('hour', 5, 6, 6, 0, 0))
+
+
+class HashRingTests(SimpleTestCase):
+    """
+    Partitions keys between nodes by consistent hashing.
+
+    """
+
+    def test_keys_spread_and_stay_put(self):
+        two = HashRing(['one', 'two'])
+        three = HashRing(['one', 'two', 'three'])
+        owners = [three.node_for(key) for key in range(3000)]
+        for node in three.nodes:
+            self.assertGreater(owners.count(node), 600)
+        # Only keys taken by the new node move.
+        for key, owner in enumerate(owners):
+            if owner != 'three':
+                self.assertEqual(two.node_for(key), owner)
+
+    def test_empty_ring(self):
+        self.assertIsNone(HashRing([]).node_for(1))
+
+
+@mock.patch('builtins.print')
+class MonitorTests(TestCase):
+    """
+    Claims, renews and hands over leases on courses between monitors, and
+    closes trackers, with polling and the registrar stubbed out.
+
+    """
+
+    def setUp(self):
+        for patcher in (
+            mock.patch('monitor.monitoring_core.monitor.PollScheduler'),
+            mock.patch('monitor.monitoring_core.monitor.SignupValidator'),
+            mock.patch('monitor.monitoring_core.monitor.signal'),
+            mock.patch.object(SeatingTracker, 'fetch_seating', return_value=[30, 20, 10]),
+            mock.patch.object(writer, 'record')
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def create_courses(count):
+        """
+        Create courses to monitor.
+
+        Args:
+            count (int): Number of courses.
+
+        Returns: List of the PKs of the courses.
+
+        """
+        Course.objects.bulk_create([
+            Course(crn=10000 + index, name='ENG {0}'.format(index), semester=Course.FALL, year=2019)
+            for index in range(count)
+        ])
+        return sorted(Course.objects.values_list('pk', flat=True))
+
+    def assert_leased(self, pks, owner):
+        """
+        Assert courses are leased to a monitor for a whole lease.
+
+        """
+        soon = timezone.now() + datetime.timedelta(seconds=Monitor.LEASE - 10)
+        for course in Course.objects.filter(pk__in=pks):
+            self.assertEqual(course.owner, owner)
+            self.assertGreater(course.lease_expires, soon)
+
+    def test_claims_new_courses(self, _):
+        pks = self.create_courses(3)
+        monitor = Monitor('one')
+        self.assertTrue(monitor.setup_new_courses())
+        self.assert_leased(pks, 'one')
+        self.assertEqual(sorted(monitor.workers.pks()), pks)
+        # New courses are fetched for their initial alerts.
+        self.assertEqual(SeatingTracker.fetch_seating.call_count, 3)
+        self.assertFalse(monitor.setup_new_courses())
+
+    def test_heartbeat_renews_leases(self, _):
+        pks = self.create_courses(30)
+        monitor = Monitor('one')
+        monitor.setup_new_courses()
+        Course.objects.update(lease_expires=timezone.now() + datetime.timedelta(seconds=1))
+        with CaptureQueriesContext(connection) as queries:
+            monitor.heartbeat()
+        self.assert_leased(pks, 'one')
+        # Nothing to release, so no course PKs are sent.
+        self.assertFalse([query['sql'] for query in queries if ' IN (' in query['sql']])
+
+    def test_expired_lease_is_taken_over(self, _):
+        expired, leased = self.create_courses(2)
+        now = timezone.now()
+        Course.objects.filter(pk=expired).update(owner='two', lease_expires=now - datetime.timedelta(seconds=1))
+        Course.objects.filter(pk=leased).update(owner='two', lease_expires=now + datetime.timedelta(seconds=60))
+        monitor = Monitor('one')
+        self.assertTrue(monitor.setup_new_courses())
+        self.assert_leased([expired], 'one')
+        self.assertEqual(Course.objects.get(pk=leased).owner, 'two')
+        self.assertEqual(monitor.workers.pks(), [expired])
+        # Taken over courses resume without fetching.
+        SeatingTracker.fetch_seating.assert_not_called()
+
+    def test_courses_rebalance_when_a_monitor_joins(self, _):
+        pks = self.create_courses(20)
+        one = Monitor('one')
+        one.setup_new_courses()
+        two = Monitor('two')
+        # Every course is still leased to the first monitor.
+        self.assertFalse(two.setup_new_courses())
+        one.heartbeat()
+        self.assertTrue(two.setup_new_courses())
+        ring = HashRing(['one', 'two'])
+        owners = {pk: ring.node_for(pk) for pk in pks}
+        self.assertEqual(set(owners.values()), {'one', 'two'})
+        for monitor in (one, two):
+            owned = sorted(pk for pk, owner in owners.items() if owner == monitor.name)
+            self.assert_leased(owned, monitor.name)
+            self.assertEqual(sorted(monitor.workers.pks()), owned)
+
+    def test_dead_monitor_leaves_the_ring(self, _):
+        self.create_courses(1)
+        MonitorWorker.objects.create(name='two', heartbeat=timezone.now() - datetime.timedelta(seconds=Monitor.LEASE + 1))
+        monitor = Monitor('one')
+        self.assertEqual(monitor.ring.nodes, {'one'})
+
+    def test_closed_trackers_free_their_slots(self, _):
+        pks = self.create_courses(2)
+        monitor = Monitor('one')
+        monitor.setup_new_courses()
+        tracker = monitor.workers.tracker_of(pks[0])
+        slot = tracker.slot
+        Course.objects.filter(pk=pks[0]).update(is_monitored=False)
+        self.assertTrue(monitor.close_deactivated_courses())
+        self.assertIsNone(tracker.slot)
+        self.assertIn(slot, seats.free)
+        # The slot is reused, from zero seating, by the next tracker.
+        self.assertEqual(seats.allocate(), slot)
+        self.assertEqual(seats.get(slot), [0, 0, 0])
+        seats.release(slot)
+
+    def test_validates_pending_signups_of_its_partition(self, _):
+        pks = self.create_courses(20)
+        Course.objects.filter(pk__in=pks[:15]).update(status=Course.PENDING)
+        Course.objects.filter(pk=pks[0]).update(is_monitored=False)
+        monitor = Monitor('one')
+        monitor.ring = HashRing(['one', 'two'])
+        monitor.validator.submit.return_value = 1
+        self.assertTrue(monitor.validate_signups())
+        # Only monitored pending courses this monitor owns on the ring.
+        submitted = sorted(course.pk for course in monitor.validator.submit.call_args[0][0])
+        self.assertEqual(submitted, [pk for pk in pks[1:15] if monitor.ring.node_for(pk) == 'one'])
+        self.assertTrue(0 < len(submitted) < 14)
+        monitor.validator.submit.return_value = 0
+        self.assertFalse(monitor.validate_signups())
+
+
+class SeatTableTests(SimpleTestCase):
+    """
+    Stores the seating of many sections in parallel arrays.
+
+    """
+
+    def setUp(self):
+        self.table = SeatTable()
+
+    def test_released_slots_are_reused(self):
+        first, second = self.table.allocate(), self.table.allocate()
+        self.table.reset(first, [30, 20, 10])
+        self.table.release(first)
+        self.assertEqual(self.table.allocate(), first)
+        self.assertEqual(self.table.get(first), [0, 0, 0])
+        self.assertEqual(self.table.get_previous(first, 2), 0)
+        # Reuse does not grow the table.
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(self.table.allocate(), 2)
+
+    def test_update_many(self):
+        slots = [self.table.allocate() for _ in range(3)]
+        for slot in slots:
+            self.table.reset(slot, [30, 20, 10])
+        changed = self.table.update_many([
+            (slots[0], [30, 20, 10]),
+            (slots[1], [30, 21, 9]),
+            (slots[2], [31, 20, 11])
+        ])
+        self.assertEqual(changed, [1, 2])
+        self.assertEqual(self.table.get(slots[1]), [30, 21, 9])
+        self.assertEqual(self.table.get_previous(slots[1], 2), 10)
+        self.assertEqual(self.table.get(slots[2], 0), 31)
+        # Unchanged seating keeps no difference.
+        self.assertEqual(self.table.update_many([(slots[1], [30, 21, 9])]), [])
+        self.assertEqual(self.table.get_previous(slots[1], 2), 9)
+        self.assertTrue(self.table.update(slots[0], [30, 30, 0]))
+
+
+class FakeClock:
+    """
+    Stands in for the `time` module, with a monotonic clock moved by hand.
+
+    Attributes:
+        now (float): The current monotonic time.
+
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+@mock.patch('traceback.print_exc')
+class AlertAggregatorTests(SimpleTestCase):
+    """
+    Coalesces, thresholds, digests and retries alerts, closing windows by
+    hand on a fake clock instead of from the worker thread.
+
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.mailer = mock.Mock()
+        for patcher in (
+            mock.patch('monitor.monitoring_core.alerts.time', self.clock),
+            mock.patch('monitor.monitoring_core.alerts.mailer', self.mailer),
+            mock.patch.object(AlertAggregator, 'start')
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def tracker(url, name='ENG 101', emails=('student@eku.edu',)):
+        """
+        Get a stand-in tracker, whose alert text gives the seats before and after.
+
+        """
+        tracker = mock.Mock(url=url)
+        tracker.get_alert_text.side_effect = lambda before, after: '{0} -> {1}'.format(before, after)
+        tracker.recipients.return_value = (Recipients(name, emails),)
+        return tracker
+
+    def test_flips_within_window_are_one_alert(self, _):
+        aggregator = AlertAggregator(window=60, digest_window=0, threshold='any')
+        tracker = self.tracker('a')
+        for now, before, after in [(0, 5, 0), (10, 0, 3), (20, 3, 1)]:
+            self.clock.now = now
+            aggregator.change(tracker, before, after)
+        aggregator.flush(59)
+        tracker.email_alert.assert_not_called()
+        aggregator.flush(60)
+        tracker.email_alert.assert_called_once_with('5 -> 1')
+        self.assertEqual(aggregator.pending, {})
+
+    def test_flips_back_within_window_are_not_alerted(self, _):
+        aggregator = AlertAggregator(window=60, digest_window=0, threshold='any')
+        tracker = self.tracker('a')
+        aggregator.change(tracker, 5, 0)
+        aggregator.change(tracker, 0, 5)
+        aggregator.flush(60)
+        tracker.email_alert.assert_not_called()
+
+    def test_threshold(self, _):
+        aggregator = AlertAggregator(window=0, digest_window=0, threshold='opening')
+        tracker = self.tracker('a')
+        aggregator.change(tracker, 3, 1)
+        aggregator.change(tracker, 0, 2)
+        tracker.email_alert.assert_called_once_with('0 -> 2')
+
+    def test_digest_is_sent_after_window(self, _):
+        aggregator = AlertAggregator(window=0, digest_window=300, threshold='any')
+        aggregator.change(self.tracker('a', 'ENG 101'), 0, 2)
+        self.clock.now = 100
+        aggregator.change(self.tracker('b', 'MAT 201'), 4, 3)
+        aggregator.flush(299)
+        self.mailer.send.assert_not_called()
+        aggregator.flush(300)
+        self.mailer.send.assert_called_once()
+        address, content = self.mailer.send.call_args[0]
+        self.assertEqual(address, 'student@eku.edu')
+        self.assertIn('Subject: [Course Monitor] Seating Changes in 2 Courses', content)
+        self.assertIn('ENG 101: 0 -> 2', content)
+        self.assertIn('MAT 201: 4 -> 3', content)
+
+    def test_failed_alert_is_retried(self, _):
+        aggregator = AlertAggregator(window=0, digest_window=0, threshold='any')
+        tracker = self.tracker('a')
+        tracker.email_alert.side_effect = [OSError('lookup failed'), None]
+        aggregator.change(tracker, 0, 2)
+        self.assertIn('a', aggregator.pending)
+        aggregator.flush(AlertAggregator.RETRY_DELAY - 1)
+        self.assertEqual(tracker.email_alert.call_count, 1)
+        aggregator.flush(AlertAggregator.RETRY_DELAY)
+        self.assertEqual(tracker.email_alert.call_args_list, [mock.call('0 -> 2')] * 2)
+        self.assertEqual(aggregator.pending, {})
+
+    def test_failed_window_folds_into_later_change(self, _):
+        aggregator = AlertAggregator(window=60, digest_window=0, threshold='any')
+        tracker = self.tracker('a')
+        tracker.email_alert.side_effect = [OSError('lookup failed'), None]
+        aggregator.change(tracker, 5, 0)
+        self.clock.now = 60
+        aggregator.flush(60)
+        self.clock.now = 70
+        aggregator.change(tracker, 0, 2)
+        aggregator.flush(60 + AlertAggregator.RETRY_DELAY)
+        # Alerted once on the net change since the failed window opened.
+        self.assertEqual(tracker.email_alert.call_args_list, [mock.call('5 -> 0'), mock.call('5 -> 2')])
+
+    def test_failed_digest_is_retried(self, _):
+        aggregator = AlertAggregator(window=0, digest_window=300, threshold='any')
+        self.mailer.send.side_effect = [OSError('connection refused'), None]
+        aggregator.change(self.tracker('a'), 0, 2)
+        self.clock.now = 300
+        aggregator.flush(300)
+        aggregator.flush(300 + AlertAggregator.RETRY_DELAY - 1)
+        self.assertEqual(self.mailer.send.call_count, 1)
+        aggregator.flush(300 + AlertAggregator.RETRY_DELAY)
+        self.assertEqual(self.mailer.send.call_count, 2)
+        self.assertEqual(aggregator.digests, {})
+
+
+@mock.patch.multiple(HTTPClient, RETRIES=0, RATE=1000.0, BURST=1000)
+@mock.patch('traceback.print_exc')
+@mock.patch('builtins.print')
+class SignupValidatorTests(TestCase):
+    """
+    Checks pending signups against a local registrar stand-in. Checks are run
+    directly rather than on the validator's threads.
+
+    """
+
+    def setUp(self):
+        self.registrar = ScriptedRegistrar().start()
+        self.addCleanup(self.registrar.server_close)
+        self.addCleanup(self.registrar.shutdown)
+        self.registrar.set_seating(12345, 30, 20, 10)
+        self.clock = FakeClock()
+        self.mailer = mock.Mock()
+        for patcher in (
+            mock.patch(
+                'monitor.monitoring_core.url.BASE_URL',
+                self.registrar.url + 'bwckschd.p_disp_detail_sched?term_in={term}&crn_in={crn}'
+            ),
+            mock.patch('monitor.monitoring_core.validation.time', self.clock),
+            mock.patch('monitor.models.mailer', self.mailer)
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.validator = SignupValidator(concurrency=1)
+        self.validator.shutdown()
+        self.validator.executor = mock.Mock()
+
+    @staticmethod
+    def pending(crn):
+        """
+        Create a pending course with one subscriber.
+
+        Args:
+            crn (int): CRN of the course.
+
+        Returns: The course.
+
+        """
+        course = Course.objects.create(crn=crn, name='ENG 101', semester=Course.FALL, year=2019, status=Course.PENDING)
+        Subscription.subscribe(course, 'ENG 101', {'a@eku.edu'})
+        return course
+
+    def check(self, course):
+        """
+        Queue a course and run its check.
+
+        Returns: Number of courses queued.
+
+        """
+        queued = self.validator.submit([course])
+        if queued:
+            self.validator.executor.submit.assert_called_with(self.validator.validate, course)
+            self.validator.validate(course)
+        return queued
+
+    def test_existing_section_is_validated(self, *_):
+        course = self.pending(12345)
+        self.assertEqual(self.check(course), 1)
+        course.refresh_from_db()
+        self.assertEqual(course.status, Course.VALID)
+        self.assertEqual(course.subscriptions.count(), 1)
+        self.mailer.send.assert_not_called()
+        # The result is cached for later signups.
+        self.assertTrue(URL.known_course(2019, Course.FALL, 12345))
+        self.assertEqual(self.validator.in_flight, set())
+        self.assertEqual(self.validator.retries, {})
+
+    def test_missing_section_is_rejected(self, *_):
+        course = self.pending(99999)
+        self.assertEqual(self.check(course), 1)
+        course.refresh_from_db()
+        self.assertEqual(course.status, Course.REJECTED)
+        # The subscriber is told, and the subscription dropped.
+        self.assertFalse(course.subscriptions.exists())
+        self.mailer.send.assert_called_once()
+        address, content = self.mailer.send.call_args[0]
+        self.assertEqual(address, 'a@eku.edu')
+        self.assertIn('ENG 101 Not Found', content)
+        self.assertIs(URL.known_course(2019, Course.FALL, 99999), False)
+
+    def test_failed_check_is_retried(self, *_):
+        course = self.pending(12345)
+        self.registrar.statuses = [503]
+        self.assertEqual(self.check(course), 1)
+        course.refresh_from_db()
+        self.assertEqual(course.status, Course.PENDING)
+        attempts, due = self.validator.retries[course.pk]
+        self.assertEqual(attempts, 1)
+        self.assertTrue(SignupValidator.RETRY_BASE / 2 <= due <= SignupValidator.RETRY_BASE)
+        # Skipped until the backoff is over.
+        self.clock.now = due - 1
+        self.assertEqual(self.check(course), 0)
+        self.assertEqual(self.registrar.requests, 1)
+        self.clock.now = due
+        self.assertEqual(self.check(course), 1)
+        course.refresh_from_db()
+        self.assertEqual(course.status, Course.VALID)
+        self.assertEqual(self.validator.retries, {})
+
+    def test_course_being_checked_is_not_queued_twice(self, *_):
+        course = self.pending(12345)
+        self.assertEqual(self.validator.submit([course]), 1)
+        self.assertEqual(self.validator.submit([course]), 0)
+        self.validator.validate(course)
+        self.assertEqual(self.validator.submit([course]), 1)
+
+
+class SignupTests(TestCase):
+    """
+    Signs up for courses through the home page form.
+
+    """
+
+    def signup(self, emails):
+        """
+        Post the signup form for ENG 101.
+
+        Args:
+            emails (str): Comma separated email addresses.
+
+        Returns: The response.
+
+        """
+        return self.client.post('/', {
+            'crn': '12345', 'name': 'ENG 101', 'semester': Course.FALL, 'year': '2019', 'emails': emails
+        })
+
+    def test_signup(self):
+        response = self.signup('a@eku.edu, b@eku.edu,,')
+        self.assertRedirects(response, reverse('thank_you_page'), fetch_redirect_response=False)
+        course = Course.objects.get(crn=12345)
+        # Unknown sections wait for the monitor to check them.
+        self.assertEqual(course.status, Course.PENDING)
+        self.assertEqual(
+            sorted(course.subscriptions.values_list('subscriber__email', 'name')),
+            [('a@eku.edu', 'ENG 101'), ('b@eku.edu', 'ENG 101')]
+        )
+
+    def test_invalid_emails_are_form_errors(self):
+        for emails in ('notanemail', 'a@eku.edu, notanemail', ' , '):
+            with self.subTest(emails=emails):
+                response = self.signup(emails)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.context['form'].has_error('emails'))
+        self.assertFalse(Subscriber.objects.exists())
+        self.assertFalse(Course.objects.exists())
+
+
+@mock.patch.multiple(HTTPClient, RETRIES=0, RATE=1000.0, BURST=1000)
+class ValidationCacheTests(TestCase):
+    """
+    Checks sections against the catalog and the validation cache before
+    asking a local registrar stand-in.
+
+    """
+
+    def setUp(self):
+        self.registrar = FakeRegistrar().start()
+        self.addCleanup(self.registrar.server_close)
+        self.addCleanup(self.registrar.shutdown)
+        self.registrar.set_seating(12345, 30, 20, 10)
+        patcher = mock.patch(
+            'monitor.monitoring_core.url.BASE_URL',
+            self.registrar.url + 'bwckschd.p_disp_detail_sched?term_in={term}&crn_in={crn}'
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_results_are_cached(self):
+        for crn, valid in ((12345, True), (99999, False)):
+            with self.subTest(crn=crn):
+                self.registrar.requests = 0
+                self.assertIsNone(URL.known_course(2019, Course.FALL, crn))
+                # Fetched on a miss, then answered from the cache.
+                self.assertIs(URL.is_valid_course(2019, Course.FALL, crn), valid)
+                self.assertIs(URL.is_valid_course(2019, Course.FALL, crn), valid)
+                self.assertEqual(self.registrar.requests, 1)
+                self.assertIs(URL.known_course(2019, Course.FALL, crn), valid)
+
+    def test_catalog_sections_are_not_fetched(self):
+        CatalogSection.objects.create(
+            term='202010', crn=23456, subject='ENG', number='102', section='001', title='Composition II'
+        )
+        self.assertIs(URL.is_valid_course(2019, Course.FALL, 23456), True)
+        self.assertEqual(self.registrar.requests, 0)
+
+    def test_signups_use_cached_results(self):
+        URL.remember_courses('202010', [12345])
+        URL.remember_courses('202010', [99999], valid=False)
+        signup = {'name': 'ENG 101', 'semester': Course.FALL, 'year': '2019', 'emails': 'a@eku.edu'}
+        response = self.client.post('/', dict(signup, crn='12345'))
+        self.assertRedirects(response, reverse('thank_you_page'), fetch_redirect_response=False)
+        self.assertEqual(Course.objects.get(crn=12345).status, Course.VALID)
+        response = self.client.post('/', dict(signup, crn='99999'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].has_error('crn'))
+        self.assertFalse(Course.objects.filter(crn=99999).exists())
+        self.assertEqual(self.registrar.requests, 0)
+
+
+class CatalogAutocompleteTests(TestCase):
+    """
+    Looks up sections of a term's catalog by subject and course number.
+
+    """
+
+    def setUp(self):
+        sections = [
+            ('202010', 10001, 'ENG', '101', '002', 'Composition I'),
+            ('202010', 10002, 'ENG', '101', '001', 'Composition I'),
+            ('202010', 10003, 'ENG', '102', '001', 'Composition II'),
+            ('202010', 10004, 'ENGL', '210', '001', 'Literature'),
+            ('202010', 10005, 'MAT', '112', '001', 'Algebra'),
+            ('202020', 20001, 'ENG', '101', '001', 'Composition I')
+        ]
+        CatalogSection.objects.bulk_create([
+            CatalogSection(term=term, crn=crn, subject=subject, number=number, section=section, title=title)
+            for term, crn, subject, number, section, title in sections
+        ])
+
+    def lookup(self, q, semester=Course.FALL, year='2019'):
+        """
+        Get the CRNs of the sections matching a query.
+
+        """
+        response = self.client.get(reverse('catalog_autocomplete'), {'q': q, 'semester': semester, 'year': year})
+        self.assertEqual(response.status_code, 200)
+        return [section['crn'] for section in response.json()['results']]
+
+    def test_lookup(self):
+        self.assertEqual(self.lookup('eng'), [10002, 10001, 10003, 10004])
+        self.assertEqual(self.lookup('ENG 10'), [10002, 10001, 10003])
+        self.assertEqual(self.lookup('ENG 102'), [10003])
+        self.assertEqual(self.lookup('ENG 101', semester=Course.SPRING, year='2020'), [20001])
+        self.assertEqual(self.lookup('HIS'), [])
+        self.assertEqual(self.lookup(' '), [])
+
+    def test_results(self):
+        response = self.client.get(reverse('catalog_autocomplete'), {'q': 'MAT', 'semester': 'fal', 'year': '2019'})
+        self.assertEqual(response.json(), {'results': [
+            {'crn': 10005, 'subject': 'MAT', 'number': '112', 'section': '001', 'title': 'Algebra'}
+        ]})
+
+    def test_results_are_capped(self):
+        CatalogSection.objects.bulk_create([
+            CatalogSection(term='202010', crn=30000 + i, subject='HIS', number='202', section=str(i), title='History')
+            for i in range(AUTOCOMPLETE_LIMIT + 5)
+        ])
+        self.assertEqual(len(self.lookup('HIS')), AUTOCOMPLETE_LIMIT)
+
+    def test_term_is_required(self):
+        for params in ({'q': 'ENG'}, {'q': 'ENG', 'year': '2019', 'semester': 'xyz'},
+                       {'q': 'ENG', 'year': 'last', 'semester': 'fal'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('catalog_autocomplete'), params)
+                self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('catalog_autocomplete'), {'q': 'ENG', 'year': '2019', 'semester': 'fal'})
+        self.assertEqual(response.status_code, 405)
+
+    def test_is_listed(self):
+        self.assertTrue(CatalogSection.is_listed('202010', 10001))
+        self.assertFalse(CatalogSection.is_listed('202020', 10001))
+
+
+class CachedPageTests(TestCase):
+    """
+    Serves the home page and thank you page from the page cache.
+
+    """
+
+    def setUp(self):
+        page_cache.clear()
+        self.addCleanup(page_cache.clear)
+
+    @staticmethod
+    def csrf_input(response):
+        """
+        Get the CSRF token of the form in a page.
+
+        """
+        match = re.search(r'name="csrfmiddlewaretoken" value="([^"]*)"', response.content.decode())
+        return match.group(1)
+
+    def test_home_page_is_rendered_once(self):
+        with mock.patch('monitor.views.render_to_string', wraps=render_to_string) as render:
+            first = self.client.get('/')
+            second = Client().get('/')
+        render.assert_called_once()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertContains(first, 'name="crn"')
+
+    def test_csrf_token_is_per_request(self):
+        clients = [Client(enforce_csrf_checks=True), Client(enforce_csrf_checks=True)]
+        responses = [client.get('/') for client in clients]
+        tokens = [self.csrf_input(response) for response in responses]
+        for response in responses:
+            self.assertNotContains(response, CSRF_PLACEHOLDER)
+        # Each visitor gets the token of their own CSRF cookie.
+        cookies = [client.cookies[settings.CSRF_COOKIE_NAME].value for client in clients]
+        self.assertNotEqual(cookies[0], cookies[1])
+        self.assertNotEqual(tokens[0], tokens[1])
+        signup = {'crn': '12345', 'name': 'ENG 101', 'semester': Course.FALL, 'year': '2019', 'emails': 'a@eku.edu'}
+        # The token from the cached page is accepted, and only by its own client.
+        response = clients[0].post('/', dict(signup, csrfmiddlewaretoken=tokens[1]))
+        self.assertEqual(response.status_code, 403)
+        response = clients[0].post('/', dict(signup, csrfmiddlewaretoken=tokens[0]))
+        self.assertRedirects(response, reverse('thank_you_page'), fetch_redirect_response=False)
+
+    def test_invalid_signup_is_not_cached(self):
+        self.client.get('/')
+        response = self.client.post('/', {'crn': '12345', 'emails': 'notanemail'})
+        self.assertContains(response, 'invalid-feedback')
+        # Errors are rendered for this request only.
+        response = self.client.get('/')
+        self.assertNotContains(response, 'invalid-feedback')
+
+    def test_thank_you_page_is_cached(self):
+        with mock.patch('monitor.views.render', wraps=render) as rendered:
+            for _ in range(2):
+                self.assertEqual(self.client.get(reverse('thank_you_page')).status_code, 200)
+        rendered.assert_called_once()
+
+
+class SubscriptionTests(TestCase):
+    """
+    Creates subscribers and subscriptions in bulk.
+
+    """
+
+    def setUp(self):
+        self.course = Course.objects.create(crn=12345, name='ENG 101', semester=Course.FALL, year=2019)
+
+    def test_for_addresses(self):
+        Subscriber.objects.create(email='a@eku.edu', welcomed=True)
+        subscribers = Subscriber.for_addresses({'a@eku.edu', 'b@eku.edu'})
+        self.assertEqual(sorted(subscriber.email for subscriber in subscribers), ['a@eku.edu', 'b@eku.edu'])
+        self.assertEqual(Subscriber.objects.count(), 2)
+        # Existing subscribers are kept as they are.
+        self.assertTrue(Subscriber.objects.get(email='a@eku.edu').welcomed)
+
+    def test_subscribe(self):
+        self.assertEqual(Subscription.subscribe(self.course, 'ENG 101', {'a@eku.edu', 'b@eku.edu'}), 2)
+        # Already subscribed addresses are skipped, and keep their name.
+        self.assertEqual(Subscription.subscribe(self.course, 'English', {'b@eku.edu', 'c@eku.edu'}), 1)
+        self.assertEqual(
+            sorted(self.course.subscriptions.values_list('subscriber__email', 'name')),
+            [('a@eku.edu', 'ENG 101'), ('b@eku.edu', 'ENG 101'), ('c@eku.edu', 'English')]
+        )
+
+
+
+def in_other_connection(function):
+    """
+    Run a function on its own thread, and so its own database connection,
+    as a concurrent request would.
+
+    Args:
+        function: The function.
+
+    """
+    def run():
+        try:
+            function()
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+
+class ConcurrentSignupTests(TransactionTestCase):
+    """
+    Creates subscribers and subscriptions while another signup commits some
+    of them first.
+
+    """
+
+    def setUp(self):
+        self.course = Course.objects.create(crn=12345, name='ENG 101', semester=Course.FALL, year=2019)
+
+    def test_for_addresses(self):
+        bulk_create = Subscriber.objects.bulk_create
+
+        def race(subscribers, *args, **kwargs):
+            in_other_connection(lambda: Subscriber.objects.create(email=subscribers[0].email))
+            return bulk_create(subscribers, *args, **kwargs)
+
+        with mock.patch.object(Subscriber.objects, 'bulk_create', side_effect=race):
+            subscribers = Subscriber.for_addresses({'a@eku.edu', 'b@eku.edu'})
+        self.assertEqual(sorted(subscriber.email for subscriber in subscribers), ['a@eku.edu', 'b@eku.edu'])
+        self.assertEqual(Subscriber.objects.count(), 2)
+
+    def test_subscribe(self):
+        bulk_create = Subscription.objects.bulk_create
+
+        def race(subscriptions, *args, **kwargs):
+            in_other_connection(lambda: Subscription.objects.create(
+                subscriber=subscriptions[0].subscriber, course=self.course, name='English'
+            ))
+            return bulk_create(subscriptions, *args, **kwargs)
+
+        with mock.patch.object(Subscription.objects, 'bulk_create', side_effect=race):
+            created = Subscription.subscribe(self.course, 'ENG 101', {'a@eku.edu', 'b@eku.edu'})
+        self.assertEqual(created, 1)
+        self.assertEqual(
+            sorted(self.course.subscriptions.values_list('name', flat=True)),
+            ['ENG 101', 'English']
+        )
+
+
+class MergeCoursesMigrationTests(TransactionTestCase):
+    """
+    Merges courses signed up for more than once before sections were made
+    unique, turning their emails into subscriptions.
+
+    """
+    migrate_from = [('monitor', '0009_subscriber_subscription')]
+    migrate_to = [('monitor', '0011_remove_email')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.migrate_from)
+        self.apps = self.executor.loader.project_state(self.migrate_from).apps
+
+    def tearDown(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        """
+        Run the migrations under test, and get the models they leave.
+
+        """
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.migrate_to)
+        return self.executor.loader.project_state(self.migrate_to).apps
+
+    def test_duplicate_sections_are_merged(self):
+        Course = self.apps.get_model('monitor', 'Course')
+        Email = self.apps.get_model('monitor', 'Email')
+        section = {'crn': 12345, 'semester': 'fal', 'year': 2019}
+        oldest = Course.objects.create(name='ENG 101', is_monitored=False, future_alert=False, **section)
+        duplicate = Course.objects.create(name='English', owner='one', **section)
+        other = Course.objects.create(name='MAT 201', crn=23456, semester='fal', year=2019)
+        Email.objects.create(email='a@eku.edu', course=oldest)
+        Email.objects.create(email='a@eku.edu', course=duplicate, welcomed=True)
+        Email.objects.create(email='b@eku.edu', course=duplicate)
+        Email.objects.create(email='c@eku.edu', course=other)
+        apps = self.migrate()
+        Course = apps.get_model('monitor', 'Course')
+        Subscriber = apps.get_model('monitor', 'Subscriber')
+        Subscription = apps.get_model('monitor', 'Subscription')
+        # The oldest course is kept, monitored and asking about next semester
+        # since a duplicate did.
+        self.assertEqual(sorted(Course.objects.values_list('pk', flat=True)), [oldest.pk, other.pk])
+        merged = Course.objects.get(pk=oldest.pk)
+        self.assertTrue(merged.is_monitored)
+        self.assertTrue(merged.future_alert)
+        # One subscriber per address, welcomed if any of its emails was.
+        self.assertEqual(
+            sorted(Subscriber.objects.values_list('email', 'welcomed')),
+            [('a@eku.edu', True), ('b@eku.edu', False), ('c@eku.edu', False)]
+        )
+        # Subscriptions keep the name of the course they came from, and are
+        # alerted if a monitor owned it.
+        self.assertEqual(
+            sorted(Subscription.objects.values_list('subscriber__email', 'course_id', 'name', 'alerted')),
+            [
+                ('a@eku.edu', oldest.pk, 'ENG 101', False),
+                ('b@eku.edu', oldest.pk, 'English', True),
+                ('c@eku.edu', other.pk, 'MAT 201', False)
+            ]
+        )
+
+
+class BulkImportTests(TestCase):
+    """
+    Imports rows of signups from JSON or CSV, as staff.
+
+    """
+
+    def setUp(self):
+        # Listed sections are valid without asking the registrar.
+        for crn in (12345, 23456):
+            CatalogSection.objects.create(
+                term='202010', crn=crn, subject='ENG', number='101', section='001', title='Composition'
+            )
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def test_json_rows_keep_their_names(self):
+        rows = [
+            {'crn': 12345, 'name': 'ENG 101', 'semester': 'fal', 'year': 2019, 'email': 'a@eku.edu'},
+            {'crn': 12345, 'name': 'English', 'semester': 'fal', 'year': 2019, 'email': 'b@eku.edu'},
+            {'crn': 12345, 'name': 'English', 'semester': 'fal', 'year': 2019, 'email': 'c@eku.edu'},
+            {'crn': 23456, 'name': 'ENG 102', 'semester': 'fal', 'year': 2019, 'email': 'a@eku.edu'}
+        ]
+        response = self.client.post(reverse('bulk_import'), json.dumps(rows), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'courses': 2, 'subscriptions': 4})
+        self.assertEqual(
+            sorted(Subscription.objects.values_list('course__crn', 'subscriber__email', 'name')),
+            [
+                (12345, 'a@eku.edu', 'ENG 101'),
+                (12345, 'b@eku.edu', 'English'),
+                (12345, 'c@eku.edu', 'English'),
+                (23456, 'a@eku.edu', 'ENG 102')
+            ]
+        )
+
+    def test_csv_rows_with_bad_emails_are_rejected(self):
+        rows = (
+            'crn,name,semester,year,email\n'
+            '12345,ENG 101,fal,2019,a@eku.edu\n'
+            '12345,ENG 101,fal,2019,notanemail\n'
+            '23456,ENG 102,fal,2019,\n'
+        )
+        response = self.client.post(reverse('bulk_import'), rows, content_type='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(response.json()['errors']), ['2', '3'])
+        # Nothing is saved unless every row is valid.
+        self.assertFalse(Course.objects.exists())
+        self.assertFalse(Subscriber.objects.exists())
+
+    def test_staff_only(self):
+        self.client.force_login(User.objects.create_user('student'))
+        rows = [{'crn': 12345, 'name': 'ENG 101', 'semester': 'fal', 'year': 2019, 'email': 'a@eku.edu'}]
+        response = self.client.post(reverse('bulk_import'), json.dumps(rows), content_type='application/json')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('admin:login'), response['Location'])
+        self.assertFalse(Course.objects.exists())
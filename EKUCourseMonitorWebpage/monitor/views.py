@@ -1,16 +1,66 @@
-from django.shortcuts import render, redirect
+import csv
+import hashlib
+import io
+import json
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.middleware.csrf import get_token
+from django.shortcuts import get_object_or_404, render, redirect
+from django.template.loader import render_to_string
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_page, never_cache
+from django.views.decorators.http import condition, require_GET, require_POST
 from django.views.generic.base import View
-from .forms import NewMonitoredCourse
-from .models import Email
+from .forms import MonitoredCourse, NewMonitoredCourse
+from .models import CatalogSection, Course, SeatRollup, Subscription
+from .monitoring_core.url import URL
+
+
+# Cache of rendered pages, local to each worker.
+page_cache = caches['pages']
+# Rendered in place of the CSRF token of cached pages, to be swapped for the
+# token of each request.
+CSRF_PLACEHOLDER = '__csrf_token__'
+
+
+def render_cached_form(request, template_name, form_class):
+    """
+    Render a page with an empty form, rendering it only once per worker and
+    then injecting each request's CSRF token into the cached page.
+
+    Args:
+        request: The request.
+        template_name (str): Template of the page.
+        form_class: Class of the form.
+
+    Returns: The response.
+
+    """
+    key = 'form:{0}'.format(template_name)
+    page = page_cache.get(key)
+    if page is None:
+        page = render_to_string(template_name, {'form': form_class(), 'csrf_token': CSRF_PLACEHOLDER})
+        page_cache.set(key, page)
+    # Getting the token also has the CSRF middleware set its cookie.
+    return HttpResponse(page.replace(CSRF_PLACEHOLDER, get_token(request)))
+
+
+# Most signups remembered in a session.
+SESSION_SIGNUPS = 10
 
 
 # For gathering monitoring information from the user.
 class CourseForm(View):
     # Handle GET requests (return an empty form).
     def get(self, request):
-        # Create a new NewMonitoredCourse form.
-        form = NewMonitoredCourse()
-        return render(request, 'home.html', {'form': form})
+        return render_cached_form(request, 'home.html', NewMonitoredCourse)
 
     # Handle POST requests (process the form).
     def post(self, request):
@@ -18,24 +68,227 @@ class CourseForm(View):
         form = NewMonitoredCourse(request.POST)
         # If the form is valid, process the data and save it.
         if form.is_valid():
-            # Save new Course object.
-            course = form.save()
-            # Get the string of comma separated email addresses.
-            emails = form.cleaned_data.get('emails')
-            # Split at each comma and strip whitespace from either end.
-            emails = [x.strip() for x in emails.split(',')]
-            # Create new related email objects for each one in the list.
-            for email in emails:
-                Email.objects.create(
-                    email=email,
-                    course=course
-                )
+            # Save together, so the monitor is only notified once subscriptions exist.
+            with transaction.atomic():
+                # Get the Course object of the section, creating it if new.
+                course = form.save_section()
+                # Subscribe each of the validated email addresses to the course.
+                Subscription.subscribe(course, form.cleaned_data['name'], form.cleaned_data['emails'])
+            # Remember the signup, so the thank you page can show its status.
+            signups = [signup for signup in request.session.get('signups', []) if signup[0] != course.pk]
+            signups.append([course.pk, form.cleaned_data['name']])
+            request.session['signups'] = signups[-SESSION_SIGNUPS:]
             # Redirect to thank you page.
             return redirect('thank_you_page')
         # Otherwise, render the bound form with errors.
         return render(request, 'home.html', {'form': form})
 
 
+# Fields of each row of a bulk import.
+IMPORT_FIELDS = ['crn', 'name', 'semester', 'year', 'email', 'future_alert']
+
+
+def read_import_rows(request):
+    """
+    Read the rows of a bulk import, given as a JSON list of objects or as CSV
+    with a header row, either as the request body or as an uploaded `file`.
+
+    Args:
+        request: The request.
+
+    Returns: List of dicts, one per row.
+
+    Raises:
+        ValueError: If the rows cannot be read.
+
+    """
+    if 'file' in request.FILES:
+        raw = request.FILES['file'].read()
+        is_json = request.FILES['file'].name.endswith('.json')
+    else:
+        raw = request.body
+        is_json = request.content_type == 'application/json'
+    raw = raw.decode('utf-8-sig')
+    if is_json:
+        rows = json.loads(raw)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('Expected a list of objects.')
+        return rows
+    return list(csv.DictReader(io.StringIO(raw)))
+
+
+# Registers a whole cohort of emails on their courses in one request.
+@method_decorator(staff_member_required, name='dispatch')
+@method_decorator(require_POST, name='dispatch')
+class BulkImport(View):
+    # Handle POST requests (validate every row, then save all or nothing).
+    def post(self, request):
+        try:
+            rows = read_import_rows(request)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return JsonResponse({'errors': {'file': [str(e)]}}, status=400)
+        errors = {}
+        # Group the emails by course and name, so each is validated and saved once.
+        courses = {}
+        for number, row in enumerate(rows, 1):
+            row = {field: str(row.get(field) or '').strip() for field in IMPORT_FIELDS}
+            try:
+                validate_email(row['email'])
+            except ValidationError as e:
+                errors.setdefault(number, []).extend(e.messages)
+            key = (row['crn'], row['semester'], row['year'], row['name'])
+            courses.setdefault(key, {'row': row, 'numbers': [], 'emails': set()})
+            courses[key]['numbers'].append(number)
+            courses[key]['emails'].add(row['email'])
+        forms = []
+        for course in courses.values():
+            data = dict(course['row'])
+            # Ask about future semesters unless told otherwise.
+            data['future_alert'] = data['future_alert'].lower() not in ('0', 'false', 'no')
+            form = MonitoredCourse(data)
+            if not form.is_valid():
+                for number in course['numbers']:
+                    errors.setdefault(number, []).extend(
+                        '{0}: {1}'.format(field, message)
+                        for field, messages in form.errors.items()
+                        for message in messages
+                    )
+            forms.append((form, course['emails']))
+        if errors:
+            return JsonResponse({'errors': errors}, status=400)
+        # Save together, so the monitor is only notified once subscriptions exist.
+        with transaction.atomic():
+            saved = set()
+            subscriptions = 0
+            for form, addresses in forms:
+                course = form.save_section()
+                saved.add(course.pk)
+                subscriptions += Subscription.subscribe(course, form.cleaned_data['name'], addresses)
+        return JsonResponse({'courses': len(saved), 'subscriptions': subscriptions}, status=201)
+
+
+# Most sections returned by an autocomplete lookup.
+AUTOCOMPLETE_LIMIT = 20
+
+
+# Sections of a term matching a subject prefix, optionally followed by a
+# course number prefix (e.g. 'EN' or 'ENG 1').
+@require_GET
+def catalog_autocomplete(request):
+    try:
+        term = URL.get_term(int(request.GET['year']), request.GET['semester'])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('A valid year and semester are required.')
+    query = request.GET.get('q', '').upper().split()
+    if not query:
+        return JsonResponse({'results': []})
+    sections = CatalogSection.objects.filter(term=term, subject__startswith=query[0])
+    if len(query) > 1:
+        sections = sections.filter(number__startswith=query[1])
+    results = [
+        {
+            'crn': section.crn,
+            'subject': section.subject,
+            'number': section.number,
+            'section': section.section,
+            'title': section.title
+        }
+        for section in sections.order_by('subject', 'number', 'section')[:AUTOCOMPLETE_LIMIT]
+    ]
+    return JsonResponse({'results': results})
+
+
 # Thanks you page, to be displayed after the user has filled out a form.
+@cache_page(page_cache.default_timeout, cache='pages')
 def thank_you_page(request):
     return render(request, 'thank_you_page.html')
+
+
+# Status of the signups made in this session, polled by the thank you page.
+@never_cache
+@require_GET
+def signup_status(request):
+    signups = request.session.get('signups', [])
+    courses = Course.objects.in_bulk([pk for pk, name in signups])
+    results = [
+        {
+            'crn': courses[pk].crn,
+            'name': name,
+            'semester': courses[pk].get_semester_display(),
+            'year': courses[pk].year,
+            'status': courses[pk].status
+        }
+        for pk, name in signups if pk in courses
+    ]
+    return JsonResponse({'signups': results})
+
+
+def seat_history_rollups(request, pk):
+    """
+    Get the rollups requested from the seat history of a course.
+
+    Args:
+        request: The request, with optional `bucket` ('hour' or 'day'), `start`
+            and `end` (ISO 8601 datetimes) query parameters.
+        pk (int): Database PK of the course.
+
+    Returns: The rollups queryset, or None if the parameters are invalid.
+
+    """
+    course = get_object_or_404(Course, pk=pk)
+    bucket = request.GET.get('bucket', SeatRollup.HOUR)
+    if bucket not in dict(SeatRollup.GRANULARITIES):
+        return None
+    rollups = SeatRollup.objects.filter(url=course.url, granularity=bucket)
+    # Narrow down to the requested range, if any.
+    for param, lookup in (('start', 'bucket_start__gte'), ('end', 'bucket_start__lt')):
+        if param in request.GET:
+            try:
+                value = parse_datetime(request.GET[param])
+            except ValueError:
+                value = None
+            if value is None:
+                return None
+            rollups = rollups.filter(**{lookup: value})
+    return rollups
+
+
+def seat_history_etag(request, pk):
+    """
+    Compute the ETag of a seat history response; it changes whenever a
+    rollup in the requested range does.
+
+    """
+    rollups = seat_history_rollups(request, pk)
+    if rollups is None:
+        return None
+    state = rollups.aggregate(updated=Max('updated'), count=Count('pk'))
+    key = '{0}|{1}|{2}'.format(request.get_full_path(), state['updated'], state['count'])
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+# Seat history of a course, downsampled to hourly or daily buckets.
+@method_decorator(condition(etag_func=seat_history_etag), name='dispatch')
+class SeatHistory(View):
+    # Handle GET requests (return the series as JSON).
+    def get(self, request, pk):
+        rollups = seat_history_rollups(request, pk)
+        if rollups is None:
+            return HttpResponseBadRequest('Invalid bucket, start or end.')
+        # Build the series from the precomputed rollups, oldest first.
+        series = [
+            {
+                'start': rollup.bucket_start.isoformat(),
+                'min_remaining': rollup.min_remaining,
+                'max_remaining': rollup.max_remaining,
+                'last_remaining': rollup.last_remaining,
+                'opened': rollup.opened,
+                'closed': rollup.closed
+            }
+            for rollup in rollups.order_by('bucket_start')
+        ]
+        return JsonResponse({
+            'course': pk,
+            'bucket': request.GET.get('bucket', SeatRollup.HOUR),
+            'series': series
+        })
@@ -3,6 +3,8 @@
 # Apply migrations.
 python /src/manage.py makemigrations
 python /src/manage.py migrate
+# Create the cache table.
+python /src/manage.py createcachetable
 # Start monitor daemon.
 /usr/local/bin/python /src/monitor/monitoring_core/monitor.py &
 # Start Gunicorn